@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,12 +48,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.RequestTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,6 +65,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
 
+# Paging headers set by ProductPagination, and the corrected query of a typo-tolerant search
+CORS_EXPOSE_HEADERS = ['X-Total-Count', 'Link', 'X-Next-Cursor', 'X-Search-Suggestion']
+
 ROOT_URLCONF = 'adminapp.urls'
 
 TEMPLATES = [
@@ -89,6 +95,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN and wait for it, instead of failing with
+            # "database is locked" when concurrent checkouts upgrade a read lock
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            # A file (not shared-cache memory) so threaded tests get real locking
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -132,6 +148,20 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media is served by main.views.serve_media, which checks access and sends the headers. The bytes
+# are sent by the web server with MEDIA_ACCEL = 'x-accel-redirect' (nginx; MEDIA_ACCEL_PREFIX must be
+# an `internal` location with `alias` MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd).
+# Unset, Django streams the file itself, with sendfile() under gunicorn or uWSGI.
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Anyone may fetch files under these; the rest of MEDIA_ROOT needs a staff session
+MEDIA_PUBLIC_PREFIXES = ['banners/', 'testimonials/', 'products/', 'seed/']
+# Uploaded images are named by content hash (main.storage), so their URLs never change content
+MEDIA_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MEDIA_DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+# manage.py prune_media keeps unreferenced files at least this long, for uploads not yet committed
+MEDIA_PRUNE_GRACE_HOURS = 24
+
 JAZZMIN_SETTINGS = {
     # Title of the window (Will default to current_admin_site.site_title if absent or None)
     "site_title": "DEV Silver Jewellers Admin",
@@ -273,3 +303,85 @@ JAZZMIN_UI_TWEAKS = {
         "success": "btn-success"
     }
 }
+
+# How long checkout holds stock before the sweeper (manage.py release_expired_reservations) gives it back
+STOCK_RESERVATION_TTL_MINUTES = 15
+
+# Per-endpoint latency samples kept in memory (per worker) for the percentiles at /api/metrics/
+PERFORMANCE_METRICS_SAMPLE_SIZE = 1024
+
+# SQL statements slower than this are saved with their EXPLAIN plan (Admin > Slow Queries)
+SLOW_QUERY_THRESHOLD_MS = 100
+
+# Request profiling (Admin > Request Profiles). Staff can always profile a request by
+# sending `X-Profile: 1`; set a rate such as 0.001 to also sample production traffic.
+PROFILER_SAMPLE_RATE = 0.0
+PROFILER_TOP_FUNCTIONS = 60
+PROFILER_KEEP = 200
+
+# Delta feed (/api/products/changes/). Each response stops this many seconds short of "now" so
+# writes still committing aren't skipped; cursors older than the tombstone retention get a 410.
+# A product write is only guaranteed to reach the feed (and other workers' autocomplete indexes)
+# if its transaction commits within this many seconds of stamping updated_at, so keep it above
+# the longest catalog transaction (an import or bulk-edit batch, a category rename). Mirrors lag
+# by as much.
+DELTA_FEED_SETTLE_SECONDS = 60
+DELTA_FEED_TOMBSTONE_DAYS = 30
+
+# Absolute URLs for feeds built outside a request: media is served from SITE_URL,
+# product pages live on the storefront.
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+STOREFRONT_URL = os.environ.get('STOREFRONT_URL', 'http://localhost:8080')
+STOREFRONT_PRODUCT_PATH = '/product/{slug}'
+STOREFRONT_CATEGORY_PATH = '/collections/{slug}'
+
+# Merchant product feed (/api/feeds/merchant.xml, .tsv), rebuilt by manage.py build_merchant_feed
+MERCHANT_FEED_DIR = BASE_DIR / 'feeds'
+MERCHANT_FEED_TITLE = 'DEV Silver Jewellers'
+MERCHANT_FEED_BRAND = 'DEV Silver Jewellers'
+MERCHANT_FEED_CURRENCY = 'INR'
+
+# Sitemaps (/api/sitemap.xml), rebuilt by manage.py build_sitemaps. Products are split into
+# shards of this many ids (the protocol allows up to 50,000 URLs per file).
+SITEMAP_DIR = BASE_DIR / 'sitemaps'
+SITEMAP_SHARD_SIZE = 10000
+
+# Related products kept per product (/api/products/<slug>/related/), rebuilt by manage.py build_related_products
+RELATED_PRODUCTS_COUNT = 8
+
+# Product views are counted in memory per worker and added to Product.popularity at most this
+# often; each view's weight halves every POPULARITY_HALF_LIFE_HOURS (see main.popularity)
+POPULARITY_FLUSH_SECONDS = 30
+POPULARITY_HALF_LIFE_HOURS = 72
+
+# Each worker's in-memory autocomplete index (/api/products/autocomplete/) applies catalog
+# changes made by other workers at most this many seconds late
+AUTOCOMPLETE_REFRESH_SECONDS = 5
+# ...and is rebuilt in the background this often, to re-rank it by current popularity
+AUTOCOMPLETE_REBUILD_SECONDS = 3600
+
+# Size charts are indexed in memory per worker for /api/size-guide/convert/; a chart saved by
+# another worker is picked up at most this many seconds later
+SIZE_GUIDE_REFRESH_SECONDS = 60
+
+# Featured testimonials (/api/testimonials/featured/) are reshuffled and reloaded this often per
+# worker, and at once in the worker that saves one
+TESTIMONIAL_REFRESH_SECONDS = 300
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # One JSON line per request from RequestTimingMiddleware; only slow-query warnings under `manage.py test`
+        'main.performance': {
+            'handlers': ['console'],
+            'level': 'WARNING' if sys.argv[1:2] == ['test'] else 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -1,6 +1,25 @@
-from django.contrib import admin
+import io
+from decimal import Decimal
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers, widgets
+from django.core.exceptions import PermissionDenied
 from django.db import models
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Greatest, Round
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.text import slugify
+from .catalog_io import FORMATS, STREAMS, export_rows, import_file
+from .image_archive import upload_archive
+from .pagination import EstimatedCountPaginator
 from .models import Announcement, Banner, SaleBanner, Testimonial, SocialLink, Product, Category, ProductImage, FAQ, FAQCategory, SizeGuideCategory, PromoCode
+from .models import StockReservation, StockReservationItem, SlowQuery, RequestProfile, PATH_MAX_CHAR
 from django_json_widget.widgets import JSONEditorWidget
 @admin.register(Announcement)
 class AnnouncementAdmin(admin.ModelAdmin):
@@ -39,11 +58,103 @@ class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 1
 
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV or JSONL, in the format written by the export actions")
+    format = forms.ChoiceField(choices=[(name, name.upper()) for name in FORMATS], initial='csv')
+    dry_run = forms.BooleanField(required=False, help_text="Validate and match rows without saving anything")
+
+class ImageArchiveForm(forms.Form):
+    archive = forms.FileField(help_text="A ZIP of images named <slug>/<order>.jpg, <slug>-<order>.jpg or <slug>.jpg")
+    replace = forms.BooleanField(required=False, help_text="Remove the current images of every product in the archive")
+
+class BulkPricingForm(forms.Form):
+    price_change = forms.ChoiceField(required=False, choices=[
+        ('', "Leave prices as they are"),
+        ('set', "Set every price to"),
+        ('percent', "Change prices by %"),
+        ('amount', "Change prices by an amount"),
+    ])
+    price_value = forms.DecimalField(required=False, max_digits=10, decimal_places=2,
+                                     help_text="e.g. 1499, or -10 with \"by %\" for 10% off the list price")
+    discount_percent = forms.IntegerField(required=False, min_value=0, max_value=100,
+                                          help_text="Leave empty to keep each product's discount")
+    sale = forms.ChoiceField(required=False, choices=[
+        ('', "Leave sale settings as they are"),
+        ('start', "Start (or update) a sale"),
+        ('end', "End the sale"),
+    ])
+    sale_label = forms.CharField(required=False, max_length=100, initial="Flash Sale")
+    sale_ends_at = forms.SplitDateTimeField(required=False, widget=widgets.AdminSplitDateTime)
+
+    def clean(self):
+        data = super().clean()
+        if data.get('price_change') and data.get('price_value') is None:
+            self.add_error('price_value', "Enter the new price or the change to apply.")
+        if data.get('price_change') == 'set' and data.get('price_value') is not None and data['price_value'] < 0:
+            self.add_error('price_value', "Prices can't be negative.")
+        if data.get('sale') == 'start' and data.get('sale_ends_at') and data['sale_ends_at'] <= timezone.now():
+            self.add_error('sale_ends_at', "The sale must end in the future.")
+        if not any([data.get('price_change'), data.get('discount_percent') is not None, data.get('sale')]):
+            raise forms.ValidationError("Choose at least one change to apply.")
+        return data
+
+    def updates(self):
+        """Field -> value or expression, applied to every product in one UPDATE."""
+        data = self.cleaned_data
+        values = {}
+        change, amount = data['price_change'], data['price_value']
+        if change == 'set':
+            values['price'] = amount
+        elif change == 'percent':
+            values['price'] = Greatest(Round(F('price') * (100 + amount) / 100, 2), Value(Decimal('0')))
+        elif change == 'amount':
+            values['price'] = Greatest(F('price') + amount, Value(Decimal('0')))
+        if data['discount_percent'] is not None:
+            values['discount_percent'] = data['discount_percent']
+        if data['sale'] == 'start':
+            values.update(is_sale_active=True, sale_label=data['sale_label'] or None, sale_ends_at=data['sale_ends_at'])
+        elif data['sale'] == 'end':
+            values.update(is_sale_active=False, sale_label=None, sale_ends_at=None)
+        return values
+
+
+def bulk_pricing_response(model_admin, request, products, description):
+    """
+    Intermediate page for the bulk pricing actions; applies the form to `products` once confirmed.
+    Returns None (back to the changelist) when done.
+    """
+    form = BulkPricingForm(request.POST if 'apply' in request.POST else None)
+    if form.is_bound and form.is_valid():
+        updated = products.update_in_batches(**form.updates())
+        model_admin.message_user(request, f"Updated {updated} product(s).", messages.SUCCESS)
+        return None
+    context = {
+        **model_admin.admin_site.each_context(request),
+        'opts': model_admin.model._meta,
+        'title': "Change prices, discounts and sales",
+        'description': description,
+        'form': form,
+        'media': model_admin.media + form.media,
+        'action': request.POST.get('action'),
+        'select_across': request.POST.get('select_across'),
+        'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+    }
+    return TemplateResponse(request, 'admin/main/product/bulk_pricing.html', context)
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/main/product/change_list.html'
+    actions = ['bulk_pricing', 'end_sale', 'export_csv', 'export_jsonl']
     list_display = ('name', 'category', 'price', 'stock', 'is_sale_active')
+    list_select_related = ('category',)
     list_filter = ('category', 'is_sale_active')
-    search_fields = ('name', 'description')
+    # Searched on the slug index, see get_search_results()
+    search_fields = ('slug',)
+    search_help_text = "Words of the product name (e.g. \"oxidised payal\"), its slug, or a product id."
+    autocomplete_fields = ('category',)
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) shown next to filtered results
+    show_full_result_count = False
     prepopulated_fields = {'slug': ('name',)}
     inlines = [ProductImageInline]
     formfield_overrides = {
@@ -65,10 +176,115 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Slugs are built from names, so a name prefix becomes a range scan on the unique slug
+        # index instead of LIKE '%term%' over every name and description
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        prefix = slugify(term)
+        matches = Q(slug__gte=prefix, slug__lt=prefix + PATH_MAX_CHAR) if prefix else Q(pk__in=[])
+        if term.isdigit():
+            matches |= Q(pk=int(term))
+        results = queryset.filter(matches)
+        if not results.exists():
+            # Words from the middle of a name ("payal" for "Oxidised Payal"): a full scan, but only
+            # when the index found nothing
+            results = queryset.filter(*[Q(name__icontains=word) for word in term.split()])
+        return results, False
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='main_product_import'),
+            path('upload-images/', self.admin_site.admin_view(self.upload_images_view), name='main_product_upload_images'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            # Decode the upload as a stream so large files aren't read into memory
+            fh = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            result = import_file(fh, form.cleaned_data['format'], dry_run=form.cleaned_data['dry_run'])
+            prefix = "Dry run: " if form.cleaned_data['dry_run'] else ""
+            self.message_user(request, f"{prefix}{result}.", messages.WARNING if result.errors else messages.SUCCESS)
+            for error in result.errors[:20]:
+                self.message_user(request, f"Line {error.line}: {error.message}", messages.ERROR)
+            if len(result.errors) > 20:
+                self.message_user(request, f"... and {len(result.errors) - 20} more errors.", messages.ERROR)
+            return redirect('admin:main_product_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Import products",
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/main/product/import.html', context)
+
+    def upload_images_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        form = ImageArchiveForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            # Large uploads are already on disk; members are read from the archive one at a time
+            result = upload_archive(form.cleaned_data['archive'].file, replace=form.cleaned_data['replace'])
+            self.message_user(request, f"{result}.", messages.WARNING if result.skipped else messages.SUCCESS)
+            for name, reason in result.skipped[:20]:
+                self.message_user(request, f"{name or 'Archive'}: {reason}", messages.ERROR)
+            if len(result.skipped) > 20:
+                self.message_user(request, f"... and {len(result.skipped) - 20} more skipped.", messages.ERROR)
+            return redirect('admin:main_product_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Upload product images",
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/main/product/upload_images.html', context)
+
+    def export_response(self, queryset, format):
+        content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(STREAMS[format](export_rows(queryset)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{format}"'
+        return response
+
+    @admin.action(description="Change prices, discounts or sales of selected products")
+    def bulk_pricing(self, request, queryset):
+        return bulk_pricing_response(self, request, queryset, f"{queryset.count()} selected product(s)")
+
+    @admin.action(description="End the sale on selected products (and clear their discount)")
+    def end_sale(self, request, queryset):
+        updated = queryset.update_in_batches(is_sale_active=False, sale_label=None, sale_ends_at=None, discount_percent=0)
+        self.message_user(request, f"Ended the sale on {updated} product(s).", messages.SUCCESS)
+
+    @admin.action(description="Export selected products as CSV")
+    def export_csv(self, request, queryset):
+        return self.export_response(queryset, 'csv')
+
+    @admin.action(description="Export selected products as JSONL")
+    def export_jsonl(self, request, queryset):
+        return self.export_response(queryset, 'jsonl')
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug')
+    list_display = ('name', 'slug', 'parent', 'path')
+    list_select_related = ('parent',)
+    list_filter = ('depth',)
+    search_fields = ('name', 'slug')
+    readonly_fields = ('path', 'depth')
     prepopulated_fields = {'slug': ('name',)}
+    actions = ['bulk_pricing']
+
+    @admin.action(description="Change prices, discounts or sales of products in selected categories")
+    def bulk_pricing(self, request, queryset):
+        # Each category includes its sub-categories, as on the storefront
+        subtrees = Q(pk__in=[])
+        for category in queryset:
+            subtrees |= Q(category__path__gte=category.path, category__path__lt=category.path + PATH_MAX_CHAR)
+        products = Product.objects.filter(subtrees)
+        names = ", ".join(category.name for category in queryset[:5]) + (", ..." if queryset.count() > 5 else "")
+        return bulk_pricing_response(self, request, products, f"{products.count()} product(s) in {names}")
 
 class FAQInline(admin.TabularInline):
     model = FAQ
@@ -98,6 +314,99 @@ class SizeGuideCategoryAdmin(admin.ModelAdmin):
 
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
-    list_display = ('code', 'discount_type', 'discount_value', 'is_active', 'valid_to')
+    list_display = ('code', 'discount_type', 'discount_value', 'is_active', 'valid_to', 'uses_display')
     list_filter = ('is_active', 'discount_type')
-    search_fields = ('code',)
\ No newline at end of file
+    search_fields = ('code',)
+
+    def get_queryset(self, request):
+        # Sum the usage shards in the changelist query rather than once per row
+        return super().get_queryset(request).annotate(uses=Sum('usage_shards__used'))
+
+    def uses_display(self, obj):
+        used = obj.uses or 0
+        return f"{used} / {obj.max_uses}" if obj.max_uses is not None else used
+    uses_display.short_description = "Uses"
+    uses_display.admin_order_field = 'uses'
+
+class StockReservationItemInline(admin.TabularInline):
+    model = StockReservationItem
+    extra = 0
+    raw_id_fields = ('product',)
+    readonly_fields = ('product', 'quantity')
+    can_delete = False
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('token', 'status', 'expires_at', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('token', 'status', 'expires_at', 'created_at')
+    inlines = [StockReservationItemInline]
+    actions = ['release_reservations']
+
+    @admin.action(description="Release selected reservations (return stock)")
+    def release_reservations(self, request, queryset):
+        released = sum(1 for reservation in queryset.filter(status=StockReservation.HELD) if reservation.release())
+        self.message_user(request, f"Released {released} reservation(s).")
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('short_sql', 'view_name', 'count', 'avg_ms_display', 'max_ms', 'last_seen')
+    list_filter = ('view_name',)
+    search_fields = ('sql', 'view_name')
+    readonly_fields = ('fingerprint', 'sql', 'explain', 'view_name', 'count', 'total_ms', 'max_ms', 'first_seen', 'last_seen')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def short_sql(self, obj):
+        return obj.sql[:120]
+    short_sql.short_description = "SQL"
+
+    def avg_ms_display(self, obj):
+        return f"{obj.avg_ms:.1f}"
+    avg_ms_display.short_description = "Avg (ms)"
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'view_name', 'duration_ms', 'status_code', 'triggered_by')
+    list_filter = ('view_name', 'method')
+    search_fields = ('path', 'view_name')
+    fields = ('method', 'path', 'view_name', 'status_code', 'triggered_by', 'duration_ms', 'created_at',
+              'download', 'stats_display', 'call_tree_display')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        # The raw dump is only needed for the download
+        return super().get_queryset(request).defer('raw')
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='main_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(bytes(profile.raw), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="profile-{pk}.prof"'
+        return response
+
+    def download(self, obj):
+        url = reverse('admin:main_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">profile-{}.prof</a> (open with snakeviz)', url, obj.pk)
+
+    def stats_display(self, obj):
+        return format_html('<pre style="font-size: 12px">{}</pre>', obj.stats)
+    stats_display.short_description = "Stats"
+
+    def call_tree_display(self, obj):
+        return format_html('<pre style="font-size: 12px">{}</pre>', obj.call_tree)
+    call_tree_display.short_description = "Call tree"
@@ -0,0 +1,244 @@
+"""
+Typeahead for the storefront search box (/api/products/autocomplete/?q=).
+
+Answered from an in-memory prefix index, one per worker process, over the words of each
+product's name, its category's name and its specification values. Every word the user typed
+must be the start of one of a product's words ("ox pay" finds "Oxidised Payal"); results are
+the most popular products first (Product.popularity).
+
+The words are kept in a sorted list, so a prefix is a bisect to a contiguous range, and each
+word has a posting list of products, already in ranking order. A query walks the postings of
+its most selective word in order and stops as soon as it has `limit` products whose other words
+match too.
+
+Queries take tens of microseconds at 100k products. The index is loaded on a worker's first
+query (a few seconds at that size) and then kept in sync incrementally, without reloading: at
+most every AUTOCOMPLETE_REFRESH_SECONDS (or right after catalog_changed in this process) the
+next query first applies the products updated and deleted since (updated_at and ProductTombstone, like the
+delta feed). A category rename stamps its products' updated_at, so it is picked up the same way.
+
+Popularity changes don't stamp updated_at, so the ranking would stay as it was at load time.
+Every AUTOCOMPLETE_REBUILD_SECONDS the index is rebuilt from scratch in a background thread,
+re-ranked by current popularity, while queries carry on with the old one.
+"""
+import heapq
+import logging
+import re
+import threading
+from bisect import bisect_left, insort
+from datetime import timedelta
+from itertools import islice
+from time import monotonic
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import OuterRef, Subquery
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Product, ProductImage, ProductTombstone, catalog_changed
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+')
+# A prefix spanning more words than this is answered from a merged list, kept until one of its words changes
+MERGE_WORDS = 32
+# ...which holds this many of the best products, enough to fill a page once the other words are checked
+MERGED_SIZE = 2000
+
+
+def words(*texts):
+    return frozenset(word for text in texts if text for word in WORD_RE.findall(str(text).casefold()))
+
+
+def product_words(name, category_name, specifications):
+    values = [spec.get('value') for spec in specifications or () if isinstance(spec, dict)]
+    return words(name, category_name, *values)
+
+
+class PrefixIndex:
+    """Products by the words they contain. Not thread-safe; Autocomplete holds the lock."""
+
+    def __init__(self):
+        self.words = []
+        self.postings = {}
+        self.products = {}
+        self.keys = {}
+        self.merged = {}
+
+    @classmethod
+    def build(cls, products):
+        """An index of (pk, slug, name, thumbnail, words, popularity) rows, added best first so every list comes out sorted."""
+        index = cls()
+        products = [(-popularity, name.casefold(), pk, slug, name, thumbnail, product_words)
+                    for pk, slug, name, thumbnail, product_words, popularity in products]
+        products.sort(key=lambda row: row[:3])
+        for *key, slug, name, thumbnail, product_words in products:
+            pk = key[2]
+            index.products[pk] = (slug, name, thumbnail, product_words)
+            index.keys[pk] = tuple(key)
+            for word in product_words:
+                index.postings.setdefault(word, []).append(pk)
+        index.words = sorted(index.postings)
+        return index
+
+    def add(self, pk, slug, name, thumbnail, product_words, popularity):
+        self.remove(pk)
+        self.products[pk] = (slug, name, thumbnail, product_words)
+        self.keys[pk] = (-popularity, name.casefold(), pk)
+        for word in product_words:
+            posting = self.postings.get(word)
+            if posting is None:
+                insort(self.words, word)
+                posting = self.postings[word] = []
+            insort(posting, pk, key=self.keys.__getitem__)
+            self.forget_merged(word)
+
+    def remove(self, pk):
+        product = self.products.pop(pk, None)
+        if product is None:
+            return
+        for word in product[3]:
+            posting = self.postings[word]
+            posting.remove(pk)
+            if not posting:
+                del self.postings[word]
+                del self.words[bisect_left(self.words, word)]
+            self.forget_merged(word)
+        del self.keys[pk]
+
+    def forget_merged(self, word):
+        for end in range(1, len(word) + 1):
+            self.merged.pop(word[:end], None)
+
+    def word_range(self, prefix):
+        start = bisect_left(self.words, prefix)
+        # Every word starting with `prefix` sorts before prefix + the highest code point
+        return start, bisect_left(self.words, prefix + '\U0010ffff', start)
+
+    def ranked(self, prefix):
+        """Products with a word starting with `prefix`, best first."""
+        start, end = self.word_range(prefix)
+        if end - start == 1:
+            return self.postings[self.words[start]]
+        if end - start > MERGE_WORDS:
+            if prefix not in self.merged:
+                self.merged[prefix] = list(islice(self.merge(start, end), MERGED_SIZE))
+            return self.merged[prefix]
+        return self.merge(start, end)
+
+    def merge(self, start, end):
+        previous = None
+        for pk in heapq.merge(*(self.postings[word] for word in self.words[start:end]), key=self.keys.__getitem__):
+            # A product with several matching words comes up once per word, consecutively
+            if pk != previous:
+                yield pk
+            previous = pk
+
+    def selectivity(self, prefix):
+        start, end = self.word_range(prefix)
+        if end - start > MERGE_WORDS:
+            return (1, -len(prefix))
+        return (0, sum(len(self.postings[word]) for word in self.words[start:end]))
+
+    def search(self, query, limit):
+        """[(slug, name, thumbnail)] of up to `limit` products matching every word of `query`."""
+        prefixes = sorted(words(query), key=self.selectivity)
+        if not prefixes:
+            return []
+        driver, others = prefixes[0], prefixes[1:]
+        results = []
+        for pk in self.ranked(driver):
+            slug, name, thumbnail, product_words = self.products[pk]
+            if all(any(word.startswith(prefix) for word in product_words) for prefix in others):
+                results.append((slug, name, thumbnail))
+                if len(results) == limit:
+                    break
+        return results
+
+
+def indexed_products():
+    thumbnails = ProductImage.objects.filter(product=OuterRef('pk')).order_by('order', 'pk').values('image')[:1]
+    return Product.objects.annotate(thumbnail=Subquery(thumbnails)).values_list(
+        'pk', 'slug', 'name', 'thumbnail', 'category__name', 'specifications', 'popularity',
+    )
+
+
+class Autocomplete:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.index = None
+            self.synced_at = None
+            self.refreshed_at = None
+            self.built_at = None
+            self.rebuilding = False
+
+    def mark_stale(self):
+        self.refreshed_at = None
+
+    @staticmethod
+    def rows(products):
+        for pk, slug, name, thumbnail, category_name, specifications, popularity in products:
+            yield pk, slug, name, thumbnail, product_words(name, category_name, specifications), popularity
+
+    def refresh(self):
+        """Loads the index, or applies the changes since the last refresh. Call with the lock held."""
+        # Taken before reading, and overlapping the last refresh by the delta feed's settle time,
+        # so a write committed after a refresh read past it is still picked up, as long as its
+        # transaction committed within DELTA_FEED_SETTLE_SECONDS of stamping updated_at
+        now = timezone.now()
+        if self.index is None:
+            self.index = PrefixIndex.build(self.rows(indexed_products().iterator(chunk_size=5000)))
+            self.built_at = monotonic()
+        else:
+            since = self.synced_at - timedelta(seconds=settings.DELTA_FEED_SETTLE_SECONDS)
+            for row in self.rows(indexed_products().filter(updated_at__gt=since)):
+                self.index.add(*row)
+            for pk in ProductTombstone.objects.filter(deleted_at__gt=since).values_list('product_id', flat=True):
+                self.index.remove(pk)
+        self.synced_at = now
+        self.refreshed_at = monotonic()
+
+    def rebuild(self):
+        """Replaces the index with a new one, ranked by current popularity. Builds without the lock."""
+        try:
+            now = timezone.now()
+            index = PrefixIndex.build(self.rows(indexed_products().iterator(chunk_size=5000)))
+            with self._lock:
+                self.index, self.synced_at, self.built_at = index, now, monotonic()
+                # The next query applies what changed while it was being built
+                self.refreshed_at = None
+        finally:
+            self.rebuilding = False
+
+    def rebuild_in_background(self):
+        def run():
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception("Autocomplete index rebuild failed")
+            finally:
+                connections.close_all()
+        threading.Thread(target=run, name='autocomplete-rebuild', daemon=True).start()
+
+    def search(self, query, limit):
+        with self._lock:
+            if self.refreshed_at is None or monotonic() - self.refreshed_at >= settings.AUTOCOMPLETE_REFRESH_SECONDS:
+                self.refresh()
+            if not self.rebuilding and monotonic() - self.built_at >= settings.AUTOCOMPLETE_REBUILD_SECONDS:
+                self.rebuilding = True
+                self.rebuild_in_background()
+            return self.index.search(query, limit)
+
+
+autocomplete = Autocomplete()
+
+
+@receiver(catalog_changed)
+def catalog_changed_refresh(sender, **kwargs):
+    # This worker made the change; its other workers catch up within AUTOCOMPLETE_REFRESH_SECONDS
+    autocomplete.mark_stale()
@@ -0,0 +1,399 @@
+"""
+Streaming catalog import/export (manage.py import_catalog / export_catalog and the Product admin).
+
+Both directions work row by row, so memory stays flat however large the file:
+exports iterate the queryset in chunks, imports read, validate and write one batch at a time.
+
+Columns (CSV header / JSONL keys):
+    slug, name, category, description, price, discount_percent, stock, rating, reviews_count,
+    is_sale_active, sale_label, sale_ends_at, specifications, images
+
+`category` is the slug path of the category, e.g. "anklets/payal"; missing categories are created.
+`images` are storage names under MEDIA_ROOT ('|'-separated in CSV, a list in JSONL) and replace the
+product's images when given. An empty cell or null leaves them as they are; to remove a product's
+images, write '-' in CSV or [] in JSONL. In CSV, `specifications` is a JSON string.
+
+Rows are matched to existing products by `slug`. Rows without a slug always create a product and
+get a unique slug from the name. Only the columns present in a row are written on update, and an
+empty CSV cell leaves a non-nullable field as it is.
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, models, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import PATH_SEPARATOR, Category, Product, ProductImage, unique_product_slugs
+from .search import add_words, product_search_words
+
+EXPORT_FIELDS = [
+    'slug', 'name', 'category', 'description', 'price', 'discount_percent', 'stock', 'rating',
+    'reviews_count', 'is_sale_active', 'sale_label', 'sale_ends_at', 'specifications', 'images',
+]
+# Columns that map straight onto Product fields
+PRODUCT_FIELDS = [
+    'name', 'description', 'price', 'discount_percent', 'stock', 'rating', 'reviews_count',
+    'is_sale_active', 'sale_label', 'sale_ends_at', 'specifications',
+]
+REQUIRED_FOR_CREATE = ('name', 'price', 'category')
+IMAGE_SEPARATOR = '|'
+# A CSV `images` cell that removes the product's images (an empty cell leaves them alone)
+NO_IMAGES = '-'
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n'}
+FORMATS = ('csv', 'jsonl')
+
+RowError = namedtuple('RowError', ['line', 'slug', 'message'])
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def __str__(self):
+        return f"{self.created} created, {self.updated} updated, {len(self.errors)} errors"
+
+
+# --- Export ------------------------------------------------------------------
+
+def export_rows(queryset=None, chunk_size=2000):
+    """Yields one dict per product, in EXPORT_FIELDS order, reading `chunk_size` products at a time."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    queryset = queryset.select_related('category').prefetch_related(
+        Prefetch('images', queryset=ProductImage.objects.only('product_id', 'image', 'order'))
+    ).order_by('pk')
+    for product in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'slug': product.slug,
+            'name': product.name,
+            'category': product.category.path.rstrip(PATH_SEPARATOR),
+            'description': product.description,
+            'price': str(product.price),
+            'discount_percent': product.discount_percent,
+            'stock': product.stock,
+            'rating': product.rating,
+            'reviews_count': product.reviews_count,
+            'is_sale_active': product.is_sale_active,
+            'sale_label': product.sale_label,
+            'sale_ends_at': product.sale_ends_at.isoformat() if product.sale_ends_at else None,
+            'specifications': product.specifications,
+            'images': [image.image.name for image in product.images.all()],
+        }
+
+
+def stream_csv(rows):
+    """Yields CSV text one line at a time (header first), for files and StreamingHttpResponse alike."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, EXPORT_FIELDS)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writeheader()
+    yield flush()
+    for row in rows:
+        row = dict(row)
+        row['is_sale_active'] = 'true' if row['is_sale_active'] else 'false'
+        row['specifications'] = json.dumps(row['specifications'], ensure_ascii=False)
+        row['images'] = IMAGE_SEPARATOR.join(row['images'])
+        writer.writerow(row)
+        yield flush()
+
+
+def stream_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+STREAMS = {'csv': stream_csv, 'jsonl': stream_jsonl}
+
+
+# --- Import ------------------------------------------------------------------
+
+def read_csv(fh):
+    """Yields (line number, row dict). Empty cells become None; list/JSON columns are decoded later."""
+    reader = csv.DictReader(fh)
+    for row in reader:
+        yield reader.line_num, {key: (value if value != '' else None) for key, value in row.items() if key}
+
+
+def read_jsonl(fh):
+    for line_number, line in enumerate(fh, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, exc
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError("expected a JSON object")
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class PendingRow:
+    __slots__ = ('line', 'product', 'is_new', 'fields', 'images')
+
+    def __init__(self, line, product, is_new, fields, images):
+        self.line = line
+        self.product = product
+        self.is_new = is_new
+        self.fields = fields
+        self.images = images
+
+
+def clean_value(field, value):
+    if isinstance(field, models.BooleanField) and isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered not in TRUE_VALUES | FALSE_VALUES:
+            raise ValidationError(f"'{value}' is not true or false.")
+        value = lowered in TRUE_VALUES
+    elif isinstance(field, models.JSONField) and isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValidationError("Enter valid JSON.")
+    value = field.clean(value, None)
+    if isinstance(field, models.DateTimeField) and value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def parse_row(raw):
+    """
+    (slug, {field: value}, category path or None, image names or None) for one input row.
+    Raises ValidationError with every problem in the row.
+    """
+    errors = []
+    values = {}
+    for name in PRODUCT_FIELDS:
+        if name not in raw:
+            continue
+        field = Product._meta.get_field(name)
+        value = raw[name]
+        if value is None and not field.null:
+            continue
+        try:
+            values[name] = clean_value(field, value)
+        except ValidationError as exc:
+            errors.append(f"{name}: {'; '.join(exc.messages)}")
+
+    slug = raw.get('slug')
+    if slug is not None:
+        try:
+            slug = Product._meta.get_field('slug').clean(str(slug).strip(), None) or None
+        except ValidationError as exc:
+            errors.append(f"slug: {'; '.join(exc.messages)}")
+
+    category = raw.get('category')
+    if category is not None:
+        category = str(category).strip().strip(PATH_SEPARATOR)
+
+    images = raw.get('images')
+    if isinstance(images, str):
+        if images.strip() == NO_IMAGES:
+            images = []
+        else:
+            images = [name.strip() for name in images.split(IMAGE_SEPARATOR) if name.strip()] or None
+    elif images is not None and not (isinstance(images, list) and all(isinstance(name, str) for name in images)):
+        errors.append("images: expected a list of file names")
+
+    if errors:
+        raise ValidationError(errors)
+    return slug, values, category, images
+
+
+class CategoryResolver:
+    """Category path ("anklets/payal") -> Category, creating missing levels. Loads the (small) tree once."""
+    def __init__(self, create=True):
+        self.create = create
+        self.by_path = {
+            category.path.rstrip(PATH_SEPARATOR): category
+            for category in Category.objects.only('id', 'name', 'slug', 'path', 'depth')
+        }
+
+    def resolve(self, path):
+        category = self.by_path.get(path)
+        if category is not None:
+            return category
+        if not self.create:
+            # Dry runs don't write, so a placeholder stands in for categories that would be created
+            return Category(name=path, slug=path.rsplit(PATH_SEPARATOR, 1)[-1])
+
+        parent = None
+        current = ''
+        for slug in path.split(PATH_SEPARATOR):
+            current = f"{current}{PATH_SEPARATOR}{slug}" if current else slug
+            category = self.by_path.get(current)
+            if category is None:
+                category = Category(name=slug.replace('-', ' ').title(), slug=slug, parent=parent)
+                with transaction.atomic():
+                    category.save()
+                self.by_path[current] = category
+            parent = category
+        return category
+
+
+def import_rows(rows, batch_size=500, dry_run=False):
+    """
+    Upserts products from (line number, row dict) pairs, `batch_size` at a time.
+    Bad rows are reported in the result and skipped; they never abort the rest of the batch.
+    With `dry_run`, rows are validated and matched but nothing is written.
+    """
+    result = ImportResult()
+    categories = CategoryResolver(create=not dry_run)
+    batch = []
+    slugs_in_batch = set()
+
+    for line, raw in rows:
+        if isinstance(raw, Exception):
+            result.errors.append(RowError(line, None, str(raw)))
+            continue
+        try:
+            slug, values, category, images = parse_row(raw)
+        except ValidationError as exc:
+            result.errors.append(RowError(line, raw.get('slug'), '; '.join(exc.messages)))
+            continue
+
+        # A slug repeated in the file updates the row written before it, so close the batch first
+        if (slug is not None and slug in slugs_in_batch) or len(batch) >= batch_size:
+            write_batch(batch, result, categories, dry_run)
+            batch = []
+            slugs_in_batch = set()
+        if slug is not None:
+            slugs_in_batch.add(slug)
+        batch.append((line, slug, values, category, images))
+
+    if batch:
+        write_batch(batch, result, categories, dry_run)
+    return result
+
+
+def import_file(fh, format='csv', batch_size=500, dry_run=False):
+    if format not in READERS:
+        raise ValueError(f"Unknown format {format!r}; expected one of {', '.join(FORMATS)}")
+    return import_rows(READERS[format](fh), batch_size=batch_size, dry_run=dry_run)
+
+
+def write_batch(batch, result, categories, dry_run):
+    existing = Product.objects.in_bulk([slug for _, slug, _, _, _ in batch if slug], field_name='slug')
+    explicit = {slug for _, slug, _, _, _ in batch if slug}
+    needs_slug = [values.get('name', '') for _, slug, values, _, _ in batch if not slug]
+    generated = iter(unique_product_slugs(needs_slug, exclude=explicit) if needs_slug else [])
+
+    pending = []
+    for line, slug, values, category_path, images in batch:
+        product = existing.get(slug)
+        is_new = product is None
+        if is_new:
+            missing = [name for name in REQUIRED_FOR_CREATE
+                       if (category_path if name == 'category' else values.get(name)) is None]
+            if not slug:
+                slug = next(generated)
+            if missing:
+                result.errors.append(RowError(line, slug, f"missing {', '.join(missing)} for a new product"))
+                continue
+            product = Product(slug=slug)
+
+        fields = set(values)
+        for name, value in values.items():
+            setattr(product, name, value)
+        if category_path is not None:
+            try:
+                product.category = categories.resolve(category_path)
+            except (ValidationError, DatabaseError) as exc:
+                message = '; '.join(exc.messages) if isinstance(exc, ValidationError) else str(exc)
+                result.errors.append(RowError(line, slug, f"category {category_path!r}: {message}"))
+                continue
+            fields.add('category')
+        pending.append(PendingRow(line, product, is_new, fields, images))
+
+    if dry_run:
+        count(pending, result)
+        return
+
+    try:
+        with transaction.atomic():
+            save_rows(pending)
+    except DatabaseError:
+        # Something in the batch broke a constraint; retry row by row to find it
+        for row in pending:
+            if row.is_new:
+                row.product.pk = None
+            try:
+                with transaction.atomic():
+                    save_rows([row])
+            except DatabaseError as exc:
+                result.errors.append(RowError(row.line, row.product.slug, str(exc)))
+            else:
+                count([row], result)
+    else:
+        count(pending, result)
+
+
+def count(rows, result):
+    for row in rows:
+        if row.is_new:
+            result.created += 1
+        else:
+            result.updated += 1
+
+
+def update_products(products, names):
+    """
+    Writes `names` for every product with one executemany'd UPDATE. QuerySet.bulk_update()
+    builds a CASE per field per row, which made it most of an import's run time.
+    """
+    fields = [Product._meta.get_field(name) for name in names]
+    quote = connection.ops.quote_name
+    sql = "UPDATE {} SET {} WHERE {} = %s".format(
+        quote(Product._meta.db_table),
+        ", ".join(f"{quote(field.column)} = %s" for field in fields),
+        quote(Product._meta.pk.column),
+    )
+    params = [
+        [field.get_db_prep_save(getattr(product, field.attname), connection) for field in fields] + [product.pk]
+        for product in products
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def save_rows(rows):
+    """One bulk insert, one bulk update and one image replacement for the whole batch, then its search words."""
+    new = [row.product for row in rows if row.is_new]
+    if new:
+        Product.objects.bulk_create(new)
+
+    changed = [row for row in rows if not row.is_new]
+    if changed:
+        now = timezone.now()
+        fields = {'updated_at'}
+        for row in changed:
+            row.product.updated_at = now
+            fields |= row.fields
+        update_products([row.product for row in changed], sorted(fields))
+
+    # Not left to catalog_changed, which skips batches this size: new names and specification
+    # values have to reach the typo-tolerant search's vocabulary
+    add_words(set().union(*(product_search_words(row.product.name, row.product.specifications) for row in rows)))
+
+    with_images = [row for row in rows if row.images is not None]
+    if with_images:
+        ProductImage.objects.filter(
+            product__in=[row.product.pk for row in with_images if not row.is_new]
+        ).delete()
+        ProductImage.objects.bulk_create([
+            ProductImage(product_id=row.product.pk, image=name, order=order)
+            for row in with_images for order, name in enumerate(row.images)
+        ])
@@ -0,0 +1,55 @@
+import django_filters
+from rest_framework import filters
+from .models import Product, Category
+from .search import fuzzy_filter
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    Filters for ProductListView.
+    `?category=<slug>` matches products in that category and every sub-category below it.
+    """
+    category = django_filters.CharFilter(method='filter_category')
+
+    class Meta:
+        model = Product
+        fields = {
+            'price': ['gte', 'lte'],
+        }
+
+    def filter_category(self, queryset, name, value):
+        category = Category.objects.filter(slug=value).only('path').first()
+        if category is None:
+            return queryset.none()
+        return queryset.filter(category__in=Category.objects.subtree(category))
+
+
+class ProductOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter plus named sorts. `?ordering=popular` is trending first: Product.popularity,
+    a time-decayed view count (see main.popularity), with the id to keep pages stable.
+    """
+    aliases = {'popular': ['-popularity', 'id']}
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        ordering = []
+        for field in fields:
+            if field in self.aliases:
+                ordering.extend(self.aliases[field])
+            else:
+                ordering.extend(super().remove_invalid_fields(queryset, [field], view, request))
+        return ordering
+
+
+class FuzzySearchFilter(filters.SearchFilter):
+    """
+    SearchFilter's typo-tolerant retry (see ProductListView.list): each search term also matches
+    the catalog words spelled like it, closest first. Goes after the ordering filter, whose
+    ordering it keeps as a tie-break. Leaves the corrected query in `view.search_suggestion`.
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        queryset, view.search_suggestion = fuzzy_filter(queryset, terms)
+        return queryset
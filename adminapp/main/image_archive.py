@@ -0,0 +1,161 @@
+"""
+Bulk product images from a ZIP archive (Admin > Products > Upload images).
+
+Archive members are matched to products by name:
+
+    oxidised-payal-12/0.jpg     <slug>/<order>
+    oxidised-payal-12-0.jpg     <slug>-<order> (or _<order>)
+    oxidised-payal-12.jpg       <slug>, added after the product's other images
+
+Numbered members go in the order of their numbers. When adding to a product's images they are
+placed after the ones it already has, so "0.jpg" of a product with three images becomes its
+fourth; when replacing them, the numbers are used as they are.
+
+Slugs often end in a number themselves, so a name is first tried as a whole slug. Each member
+is decompressed in chunks straight into media storage (identical photos are stored once), the
+rows are bulk-created in one transaction, and sizes and placeholders are generated afterwards,
+off the request.
+"""
+import posixpath
+import re
+import zipfile
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from .models import Product, ProductImage
+from .placeholders import backfill_in_background
+from .storage import media_storage
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.avif'}
+MAX_IMAGE_BYTES = 25 * 1024 * 1024
+NUMBERED_RE = re.compile(r'^(.+)[-_](\d+)$')
+UPLOAD_TO = ProductImage._meta.get_field('image').upload_to
+
+
+class ArchiveResult:
+    def __init__(self):
+        self.created = 0
+        self.products = set()
+        self.skipped = []
+
+    def __str__(self):
+        return f"{self.created} images added to {len(self.products)} products, {len(self.skipped)} skipped"
+
+
+def candidates(member):
+    """(slug, order or None) readings of a member name, most specific first."""
+    directory, filename = posixpath.split(member)
+    stem = posixpath.splitext(filename)[0].lower()
+    if directory and stem.isdigit():
+        return [(posixpath.basename(directory).lower(), int(stem))]
+    numbered = NUMBERED_RE.match(stem)
+    return [(stem, None)] + ([(numbered[1], int(numbered[2]))] if numbered else [])
+
+
+def image_members(archive, result):
+    """Archive members that look like images, with the rest recorded as skipped."""
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith('__MACOSX/') or posixpath.basename(name).startswith('.'):
+            continue
+        if posixpath.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            result.skipped.append((name, "not an image file"))
+        elif info.file_size > MAX_IMAGE_BYTES:
+            result.skipped.append((name, f"larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB"))
+        else:
+            yield info
+
+
+def match_products(members, result, chunk_size=500):
+    """[(member, product id, order or None)] for members whose name matches a product slug."""
+    readings = {info.filename: candidates(info.filename) for info in members}
+    slugs = sorted({slug for options in readings.values() for slug, _ in options})
+    product_ids = {}
+    for start in range(0, len(slugs), chunk_size):
+        product_ids.update(Product.objects.filter(slug__in=slugs[start:start + chunk_size]).values_list('slug', 'pk'))
+
+    matched = []
+    for info in members:
+        for slug, order in readings[info.filename]:
+            if slug in product_ids:
+                matched.append((info, product_ids[slug], order))
+                break
+        else:
+            result.skipped.append((info.filename, "no product with this slug"))
+    return matched
+
+
+def store_member(archive, info):
+    """Saves one member to media storage, streaming it; returns the stored name, or None if it isn't an image."""
+    with archive.open(info) as member:
+        try:
+            # Reads just the header
+            Image.open(member).close()
+        except (OSError, Image.DecompressionBombError):
+            return None
+    with archive.open(info) as member:
+        return media_storage.save(posixpath.join(UPLOAD_TO, posixpath.basename(info.filename)), member)
+
+
+def upload_archive(fh, replace=False, batch_size=500):
+    """
+    Adds the images in the ZIP file `fh` to their products. With `replace`, each product in the
+    archive loses its current images. Returns an ArchiveResult.
+    """
+    result = ArchiveResult()
+    try:
+        archive = zipfile.ZipFile(fh)
+    except zipfile.BadZipFile:
+        result.skipped.append(('', "not a ZIP file"))
+        return result
+
+    with archive:
+        matched = match_products(list(image_members(archive, result)), result)
+        stored = []
+        for info, product_id, order in matched:
+            name = store_member(archive, info)
+            if name is None:
+                result.skipped.append((info.filename, "not a readable image"))
+            else:
+                stored.append((product_id, order, name))
+
+    product_ids = sorted({product_id for product_id, _, _ in stored})
+    next_order = defaultdict(int)
+    if not replace:
+        existing = (
+            ProductImage.objects.filter(product__in=product_ids).order_by().values('product')
+            .annotate(last=Max('order')).values_list('product', 'last')
+        )
+        next_order.update({product_id: last + 1 for product_id, last in existing})
+        # Numbered members follow the existing images, in the order of their numbers, rather
+        # than reusing orders the product's images already have
+        numbered = sorted((product_id, order, i) for i, (product_id, order, _) in enumerate(stored) if order is not None)
+        for product_id, _, i in numbered:
+            stored[i] = (product_id, next_order[product_id], stored[i][2])
+            next_order[product_id] += 1
+    for product_id, order, _ in stored:
+        if order is not None:
+            next_order[product_id] = max(next_order[product_id], order + 1)
+
+    rows = []
+    for product_id, order, name in stored:
+        if order is None:
+            order = next_order[product_id]
+            next_order[product_id] += 1
+        rows.append(ProductImage(product_id=product_id, image=name, order=order))
+
+    if rows:
+        with transaction.atomic():
+            if replace:
+                ProductImage.objects.filter(product__in=product_ids).delete()
+            ProductImage.objects.bulk_create(rows, batch_size=batch_size)
+            # Images are part of the product for feeds and caches
+            Product.objects.filter(pk__in=product_ids).update_in_batches()
+            transaction.on_commit(backfill_in_background)
+
+    result.created = len(rows)
+    result.products = set(product_ids)
+    return result
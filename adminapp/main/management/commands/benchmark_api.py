@@ -0,0 +1,316 @@
+import json
+import logging
+import platform
+import random
+import tempfile
+import threading
+import uuid
+from time import perf_counter
+from urllib.parse import urlencode
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import F
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from main import sitemaps
+from main.autocomplete import autocomplete
+from main.metrics import percentile
+from main.models import Product, StockReservation
+from main.recommendations import build_related
+from main.seeding import seed_catalog
+from main.urls import urlpatterns
+
+
+class Plans:
+    """
+    How to build one request for each route in main/urls.py.
+    Routes without URL parameters fall back to a plain GET; routes with parameters need
+    a method here, otherwise they are reported as skipped.
+    Each method returns (method, path, json_body_or_None, as_staff) and runs outside the timed
+    section, so it may also do setup such as creating a reservation to check out.
+    """
+    def __init__(self, rng):
+        self.rng = rng
+        self.slugs = list(Product.objects.values_list('slug', flat=True)[:5000])
+        self.product_ids = list(Product.objects.values_list('pk', flat=True)[:5000])
+        self.names = list(Product.objects.values_list('name', flat=True)[:5000])
+        if not self.product_ids:
+            raise CommandError("There are no products to benchmark; seed some first with manage.py seed_catalog")
+        self.restock(pk=self.product_ids[0])
+        self.token = StockReservation.objects.reserve({self.product_ids[0]: 1}).token
+        self.related_built = False
+        self.sitemaps_built = False
+        # The index is per process and would still hold the previous scale's products
+        autocomplete.reset()
+
+    def default(self, name):
+        return ('GET', reverse(name), None, False)
+
+    def product_list(self):
+        query = self.rng.choice(['', '?category=anklets', '?search=payal', '?ordering=price', '?price__lte=2000'])
+        return ('GET', reverse('product-list') + query, None, False)
+
+    def product_detail(self):
+        return ('GET', reverse('product-detail', args=[self.rng.choice(self.slugs)]), None, False)
+
+    def product_autocomplete(self):
+        # What a shopper has typed so far: the start of a product's name, maybe into its second word
+        words = self.rng.choice(self.names).split()
+        query = words[0][:self.rng.randint(2, len(words[0]))]
+        if len(words) > 1 and self.rng.random() < 0.5:
+            query = f"{words[0]} {words[1][:self.rng.randint(1, len(words[1]))]}"
+        return ('GET', reverse('product-autocomplete') + '?' + urlencode({'q': query}), None, False)
+
+    def product_related(self):
+        # Built by a nightly job in production; once, before the first timed request, here
+        if not self.related_built:
+            build_related()
+            self.related_built = True
+        return ('GET', reverse('product-related', args=[self.rng.choice(self.slugs)]), None, False)
+
+    def build_sitemaps(self):
+        # Written by cron in production; once per scale, before the first timed request, here
+        if not self.sitemaps_built:
+            sitemaps.build_sitemaps(force=True)
+            self.sitemaps_built = True
+
+    def sitemap_index(self):
+        self.build_sitemaps()
+        return self.default('sitemap-index')
+
+    def sitemap_file(self):
+        self.build_sitemaps()
+        return ('GET', reverse('sitemap-file', args=['sitemap-products-0.xml']), None, False)
+
+    def validate_promo(self):
+        return ('POST', reverse('validate-promo'), {'code': 'SEED10', 'total_amount': 5000}, False)
+
+    def redeem_promo(self):
+        body = {'code': 'SEED10', 'total_amount': 5000, 'customer': f'{uuid.uuid4().hex}@example.com'}
+        return ('POST', reverse('redeem-promo'), body, False)
+
+    def restock(self, **lookup):
+        # Keep stock topped up so repeated runs measure the success path, not 409s
+        Product.objects.filter(**lookup).update(stock=F('stock') + 1)
+
+    def reservation_create(self):
+        slug = self.rng.choice(self.slugs)
+        self.restock(slug=slug)
+        return ('POST', reverse('reservation-create'), {'items': [{'slug': slug, 'quantity': 1}]}, False)
+
+    def reservation_detail(self):
+        return ('GET', reverse('reservation-detail', args=[self.token]), None, False)
+
+    def reservation_checkout(self):
+        # A fresh reservation each time so every checkout takes the success path
+        product_id = self.rng.choice(self.product_ids)
+        self.restock(pk=product_id)
+        reservation = StockReservation.objects.reserve({product_id: 1})
+        return ('POST', reverse('reservation-checkout', args=[reservation.token]), None, False)
+
+    def size_guide_convert(self):
+        # A seeded chart (main.seeding.SIZE_GUIDES), with a value that is in it and one that isn't
+        value = self.rng.choice(['12', '16.2'])
+        source = 'indian' if value == '12' else 'diameter'
+        query = f'?chart=rings&from={source}&value={value}&to=us'
+        return ('GET', reverse('size-guide-convert') + query, None, False)
+
+    def metrics(self):
+        return ('GET', reverse('metrics'), None, True)
+
+    def get(self, pattern):
+        handler = getattr(self, pattern.name.replace('-', '_'), None)
+        if handler is not None:
+            return handler
+        if not pattern.pattern.converters:
+            return lambda: self.default(pattern.name)
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database with a synthetic catalog at each scale, drives every /api/ route "
+        "with concurrent in-process clients and writes throughput and latency percentiles to a JSON file. "
+        "Pass --baseline to compare against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='100,10000,100000',
+                            help="Comma-separated product counts to seed (default: 100,10000,100000)")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients per endpoint")
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds to drive each endpoint")
+        parser.add_argument('--max-requests', type=int, default=1000, help="Stop an endpoint after this many requests")
+        parser.add_argument('--endpoints', default='', help="Comma-separated URL names to run (default: all)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='bench_results.json')
+        parser.add_argument('--baseline', help="Earlier results file to diff against")
+        parser.add_argument('--tolerance', type=float, default=20.0,
+                            help="Percent p95 slowdown vs. baseline that counts as a regression")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        scales = [int(scale) for scale in options['scales'].split(',') if scale]
+        if not scales or min(scales) < 1:
+            raise CommandError("--scales must be product counts of at least 1")
+        only = {name for name in options['endpoints'].split(',') if name}
+        routes = [p for p in urlpatterns if isinstance(p, URLPattern) and p.name and (not only or p.name in only)]
+
+        # One log line per request (and per 4xx) would drown the report
+        logging.getLogger('main.performance').setLevel(logging.ERROR)
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'max_requests': options['max_requests'],
+                'seed': options['seed'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'scales': {},
+        }
+
+        setup_test_environment()
+        # Sitemaps are built from each scale's catalog, away from the real ones
+        with tempfile.TemporaryDirectory() as sitemap_dir, override_settings(SITEMAP_DIR=sitemap_dir):
+            try:
+                for scale in scales:
+                    report['scales'][str(scale)] = self.run_scale(scale, routes, options)
+            finally:
+                teardown_test_environment()
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options['baseline']:
+            regressions = self.compare(options['baseline'], report, options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} endpoint(s) regressed beyond {options['tolerance']}%")
+
+    def run_scale(self, scale, routes, options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(f"Seeding {scale} products...")
+            started = perf_counter()
+            seed_catalog(scale, seed=options['seed'])
+            self.stdout.write(f"  seeded in {perf_counter() - started:.1f}s")
+
+            staff = User.objects.create_user('bench', is_staff=True)
+            plans = Plans(random.Random(options['seed']))
+
+            results = {}
+            for pattern in routes:
+                plan = plans.get(pattern)
+                if plan is None:
+                    results[pattern.name] = {'skipped': "no request plan for a parameterised route"}
+                    continue
+                results[pattern.name] = stats = self.drive(plan, staff, options)
+                line = (
+                    f"  {pattern.name:<28} {stats['throughput_rps']:>8.1f} req/s  "
+                    f"p50 {stats['p50_ms']:>8.2f}ms  p95 {stats['p95_ms']:>8.2f}ms  p99 {stats['p99_ms']:>8.2f}ms"
+                    + (f"  errors {stats['errors']}" if stats['errors'] else "")
+                )
+                if stats['errors'] * 2 > stats['requests']:
+                    self.stdout.write(self.style.WARNING(line + "  MOSTLY ERRORS, timings are not meaningful"))
+                else:
+                    self.stdout.write(line)
+            return results
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def drive(self, plan, staff, options):
+        lock = threading.Lock()
+        latencies = []
+        statuses = {}
+        errors = [0]
+        remaining = [options['max_requests']]
+        deadline = perf_counter() + options['duration']
+
+        def worker():
+            client = Client()
+            staff_client = None
+            try:
+                while perf_counter() < deadline:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    method, path, body, as_staff = plan()
+                    if as_staff and staff_client is None:
+                        staff_client = Client()
+                        staff_client.force_login(staff)
+                    http = staff_client if as_staff else client
+
+                    started = perf_counter()
+                    try:
+                        if body is None:
+                            response = http.generic(method, path)
+                        else:
+                            response = http.generic(method, path, json.dumps(body), content_type='application/json')
+                        status = str(response.status_code)
+                    except Exception:
+                        status = 'exception'
+                    elapsed = perf_counter() - started
+
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses[status] = statuses.get(status, 0) + 1
+                        # A 4xx means the plan never reached the code being measured
+                        if status == 'exception' or int(status) >= 400:
+                            errors[0] += 1
+            finally:
+                connection.close()
+
+        started = perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = perf_counter() - started
+
+        latencies.sort()
+        count = len(latencies)
+        return {
+            'requests': count,
+            'errors': errors[0],
+            'statuses': statuses,
+            'throughput_rps': round(count / wall, 2) if wall else 0.0,
+            'mean_ms': round(sum(latencies) / count * 1000, 3) if count else 0.0,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'max_ms': round(latencies[-1] * 1000, 3) if count else 0.0,
+        }
+
+    def compare(self, baseline_path, report, tolerance):
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)
+
+        regressions = []
+        self.stdout.write(f"\nCompared with {baseline_path} (p95, throughput):")
+        for scale, endpoints in report['scales'].items():
+            for name, current in endpoints.items():
+                previous = baseline.get('scales', {}).get(scale, {}).get(name)
+                if not previous or 'p95_ms' not in previous or 'p95_ms' not in current:
+                    continue
+                change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100 if previous['p95_ms'] else 0.0
+                throughput = current['throughput_rps'] - previous['throughput_rps']
+                line = f"  [{scale}] {name:<28} p95 {previous['p95_ms']:>8.2f} -> {current['p95_ms']:>8.2f}ms ({change:+.1f}%)  rps {throughput:+.1f}"
+                if change > tolerance:
+                    regressions.append((scale, name, change))
+                    self.stdout.write(self.style.ERROR(line + "  REGRESSION"))
+                else:
+                    self.stdout.write(line)
+        return regressions
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from main.placeholders import backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills in the size and inline placeholder of Banner, Testimonial and ProductImage images that "
+        "don't have them yet (rows written in bulk, or uploaded before placeholders existed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute every image, not only missing ones")
+
+    def handle(self, *args, all, **options):
+        updated, unreadable = backfill(everything=all)
+        for name in unreadable:
+            self.stderr.write(f"Couldn't read {name}")
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} row(s)"))
@@ -0,0 +1,27 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.merchant_feed import refresh_entries, write_feed_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-renders merchant feed entries for products changed since the last run, then rewrites "
+        "MERCHANT_FEED_DIR/merchant.xml and merchant.tsv from the cached entries. Run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Re-render every product (e.g. after changing SITE_URL or the feed settings)")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        refreshed = refresh_entries(full=options['full'], chunk_size=options['chunk_size'])
+        write_feed_files()
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-rendered {refreshed} product(s); wrote feeds to {settings.MERCHANT_FEED_DIR} "
+            f"in {perf_counter() - started:.1f}s"
+        ))
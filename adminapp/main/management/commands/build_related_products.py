@@ -0,0 +1,27 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from main.recommendations import build_related, changed_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes each product's related products (/api/products/<slug>/related/). Run nightly, "
+        "and with --changed every few minutes to catch up on products edited since the last run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--changed', action='store_true',
+                            help="Only products changed since the last build, and those listing them")
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        product_ids = changed_products() if options['changed'] else None
+        if product_ids is not None and not product_ids:
+            self.stdout.write(self.style.SUCCESS("Nothing changed since the last build"))
+            return
+        recomputed = build_related(product_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed related products for {recomputed} product(s) in {perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,19 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from main.search import rebuild_words
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the vocabulary typo-tolerant search corrects misspelled terms against. Run nightly "
+        "and after catalog imports; products saved one at a time add their own words."
+    )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        added, removed = rebuild_words()
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {added} and removed {removed} search word(s) in {perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.sitemaps import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrites the sitemap shards in SITEMAP_DIR whose products or categories changed since the "
+        "last run, and the sitemap index. Run from cron every few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rewrite every shard")
+
+    def handle(self, *args, **options):
+        rebuilt = build_sitemaps(force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(rebuilt)} shard(s){': ' + ', '.join(rebuilt) if rebuilt else ''} in {settings.SITEMAP_DIR}"
+        ))
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.catalog_io import FORMATS, STREAMS, export_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams every product (with its category path and images) to a CSV or JSONL file that "
+        "import_catalog can read back. Example: manage.py export_catalog catalog.jsonl"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write, or - for stdout")
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension, else csv")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Products read per query")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        chunks = STREAMS[format](export_rows(chunk_size=options['chunk_size']))
+
+        if path == '-':
+            sys.stdout.writelines(chunks)
+            return
+        try:
+            fh = open(path, 'w', newline='', encoding='utf-8')
+        except OSError as exc:
+            raise CommandError(exc)
+        with fh:
+            fh.writelines(chunks)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
@@ -0,0 +1,44 @@
+import sys
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.catalog_io import FORMATS, import_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Upserts products (and their categories and images) from a CSV or JSONL file, matching on slug. "
+        "Reads and writes one batch at a time, so files of any size import in constant memory. "
+        "Bad rows are listed and skipped. Example: manage.py import_catalog catalog.csv"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for stdin")
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension, else csv")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per bulk write/transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Validate and match rows without writing")
+        parser.add_argument('--max-errors', type=int, default=50, help="Row errors to print (all are counted)")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        started = perf_counter()
+        if path == '-':
+            result = import_file(sys.stdin, format, options['batch_size'], options['dry_run'])
+        else:
+            try:
+                fh = open(path, newline='', encoding='utf-8-sig')
+            except OSError as exc:
+                raise CommandError(exc)
+            with fh:
+                result = import_file(fh, format, options['batch_size'], options['dry_run'])
+
+        for error in result.errors[:options['max_errors']]:
+            self.stderr.write(f"line {error.line}{f' ({error.slug})' if error.slug else ''}: {error.message}")
+        if len(result.errors) > options['max_errors']:
+            self.stderr.write(f"... and {len(result.errors) - options['max_errors']} more")
+
+        summary = f"{'Dry run: ' if options['dry_run'] else ''}{result} in {perf_counter() - started:.1f}s"
+        self.stdout.write(self.style.WARNING(summary) if result.errors else self.style.SUCCESS(summary))
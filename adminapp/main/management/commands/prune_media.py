@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.storage import prune_media, rehash_media
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes uploaded images no Banner, Testimonial or ProductImage points at any more, once they "
+        "are older than MEDIA_PRUNE_GRACE_HOURS. --rehash first moves files uploaded before content "
+        "addressing onto hashed names, merging duplicates. Run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=None,
+                            help="Keep unreferenced files younger than this (default MEDIA_PRUNE_GRACE_HOURS)")
+        parser.add_argument('--rehash', action='store_true', help="Rename legacy uploads to content-addressed names first")
+        parser.add_argument('--dry-run', action='store_true', help="List what would be deleted without deleting")
+
+    def handle(self, *args, grace_hours, rehash, dry_run, **options):
+        if rehash and not dry_run:
+            rehashed, missing = rehash_media()
+            for name in missing:
+                self.stderr.write(f"Missing file, left as is: {name}")
+            self.stdout.write(f"Rehashed {len(rehashed)} file(s)")
+        if grace_hours is None:
+            grace_hours = settings.MEDIA_PRUNE_GRACE_HOURS
+        orphans = prune_media(grace_hours * 3600, dry_run=dry_run)
+        for name in orphans:
+            self.stdout.write(f"{'Would delete' if dry_run else 'Deleted'} {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(orphans)} unreferenced file(s)"))
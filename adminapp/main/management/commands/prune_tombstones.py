@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.models import ProductTombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes product tombstones older than DELTA_FEED_TOMBSTONE_DAYS. Delta feed cursors older "
+        "than that get a 410 and resync from a snapshot, so the tombstones are no longer needed. Run daily."
+    )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timezone.timedelta(days=settings.DELTA_FEED_TOMBSTONE_DAYS)
+        deleted, _ = ProductTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstone(s)"))
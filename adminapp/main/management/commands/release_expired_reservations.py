@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from main.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = "Returns stock held by checkout reservations that have expired. Run from cron every minute or so."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = StockReservation.objects.release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservation(s)"))
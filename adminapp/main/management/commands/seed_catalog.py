@@ -0,0 +1,70 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import ProductImage
+from main.seeding import delete_seeded, seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a deterministic synthetic catalog (categories, products with specifications and images, "
+        "FAQs, size guides, testimonials, banners and promo codes) for scale testing. "
+        "Example: manage.py seed_catalog --products 1000000 --image-files 24"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0, help="Same seed and arguments give the same rows")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk_create/transaction")
+        parser.add_argument('--images-per-product', default='1-4', help="Range, e.g. 1-4 or 8-8")
+        parser.add_argument('--image-files', type=int, default=24,
+                            help="Number of real WebP files to generate and share between image rows (0 = none)")
+        parser.add_argument('--extra-categories', type=int, default=0,
+                            help="Numbered collections to add under the default category tree")
+        parser.add_argument('--testimonials', type=int, help="Default: products / 10, between 20 and 5000")
+        parser.add_argument('--faq-categories', type=int, default=6)
+        parser.add_argument('--faqs-per-category', type=int, default=10)
+        parser.add_argument('--promo-codes', type=int, default=20)
+        parser.add_argument('--banners', type=int, default=4)
+        parser.add_argument('--flush', action='store_true',
+                            help="Delete previously seeded content first (other products, categories, etc. are kept)")
+
+    def handle(self, *args, **options):
+        try:
+            low, high = (int(part) for part in options['images_per_product'].split('-'))
+        except ValueError:
+            raise CommandError("--images-per-product must look like 1-4")
+
+        if options['flush']:
+            self.flush()
+
+        started = perf_counter()
+        total = options['products']
+
+        def progress(created):
+            elapsed = perf_counter() - started
+            self.stdout.write(f"  {created}/{total} products ({created / elapsed:,.0f}/s)")
+
+        seed_catalog(
+            total,
+            seed=options['seed'],
+            testimonials=options['testimonials'],
+            faq_categories=options['faq_categories'],
+            faqs_per_category=options['faqs_per_category'],
+            promo_codes=options['promo_codes'],
+            banners=options['banners'],
+            extra_categories=options['extra_categories'],
+            images_per_product=(low, high),
+            image_files=options['image_files'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {total} products, {ProductImage.objects.count()} images in total "
+            f"in {perf_counter() - started:.1f}s"
+        ))
+
+    def flush(self):
+        self.stdout.write("Deleting previously seeded content...")
+        delete_seeded()
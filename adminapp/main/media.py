@@ -0,0 +1,82 @@
+"""
+Helpers for serving MEDIA_URL (main.views.serve_media): access rules, validators and
+single byte ranges of a file.
+"""
+import os
+import re
+
+from django.conf import settings
+
+from .storage import HASHED_NAME_RE
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def is_public(name):
+    return any(name.startswith(prefix) for prefix in settings.MEDIA_PUBLIC_PREFIXES)
+
+
+def is_hidden(name):
+    # Dotfiles include the temporary names uploads are written under before being renamed
+    return any(part.startswith('.') for part in name.split('/'))
+
+
+def etag(name, stat):
+    # A content-addressed name already is a hash of the bytes
+    if HASHED_NAME_RE.search(name):
+        return f'"{os.path.splitext(os.path.basename(name))[0]}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single `bytes=` range, None when the header should be ignored
+    (absent, malformed, or several ranges; the whole file is sent instead), or ValueError when
+    it can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRange:
+    """
+    `length` bytes of an open file from `start`. read() stops at the end of the range, while
+    fileno() and tell() let a WSGI server's file_wrapper sendfile() it; gunicorn sends
+    Content-Length bytes from the current offset.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,101 @@
+"""
+In-process request metrics, fed by RequestTimingMiddleware and scraped as
+Prometheus text from /api/metrics/.
+
+Each worker process keeps its own samples (the last PERFORMANCE_METRICS_SAMPLE_SIZE
+per endpoint), so percentiles describe recent traffic on that worker.
+"""
+import math
+import threading
+from collections import deque
+
+from django.conf import settings
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# metric name -> help text. All are Prometheus summaries labelled by endpoint.
+METRICS = {
+    'http_request_duration_seconds': "Total time spent handling the request",
+    'http_request_db_seconds': "Time spent executing SQL queries",
+    'http_request_db_queries': "Number of SQL queries executed",
+    'http_request_serialize_seconds': "Time spent in the view and serializers, excluding SQL",
+    'http_request_render_seconds': "Time spent rendering the response body",
+}
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Series:
+    def __init__(self, size):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=size)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, metric, endpoint, value):
+        key = (metric, endpoint)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = Series(settings.PERFORMANCE_METRICS_SAMPLE_SIZE)
+            series.observe(value)
+
+    def snapshot(self):
+        """
+        [(metric, endpoint, count, sum, {quantile: value})], sorted by metric then endpoint.
+        Samples are copied under the lock and sorted outside it.
+        """
+        with self._lock:
+            copied = [
+                (metric, endpoint, series.count, series.sum, list(series.samples))
+                for (metric, endpoint), series in self._series.items()
+            ]
+        result = []
+        for metric, endpoint, count, total, samples in sorted(copied, key=lambda row: row[:2]):
+            samples.sort()
+            result.append((metric, endpoint, count, total, {q: percentile(samples, q) for q in QUANTILES}))
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render_prometheus(self):
+        lines = []
+        current = None
+        for metric, endpoint, count, total, quantiles in self.snapshot():
+            if metric != current:
+                current = metric
+                lines.append(f"# HELP {metric} {METRICS.get(metric, metric)}")
+                lines.append(f"# TYPE {metric} summary")
+            label = escape_label(endpoint)
+            for q, value in quantiles.items():
+                lines.append(f'{metric}{{endpoint="{label}",quantile="{q}"}} {value:.6g}')
+            lines.append(f'{metric}_sum{{endpoint="{label}"}} {total:.6g}')
+            lines.append(f'{metric}_count{{endpoint="{label}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
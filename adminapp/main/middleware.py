@@ -0,0 +1,194 @@
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import random
+import threading
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import registry
+from .models import RequestProfile
+from .slowlog import record_slow_queries
+
+logger = logging.getLogger('main.performance')
+
+# One cProfile run per process at a time: from Python 3.12 enabling a second profiler while one
+# is active raises ValueError ("Another profiling tool is already active")
+_profiling = threading.Lock()
+
+
+class RequestTiming:
+    """Per-request counters. Available to views and later middleware as `request.timing`."""
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.view_started = None
+        self.view_finished = None
+        self.render_time = 0.0
+        self.slow_threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        self.slow_queries = []
+
+    def record_query(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            if duration >= self.slow_threshold and not many:
+                self.slow_queries.append((sql, params, duration))
+
+
+class RequestTimingMiddleware:
+    """
+    Measures SQL count/time, view + serializer time and render time for every request.
+    Adds a `Server-Timing` header, logs one JSON line to the `main.performance` logger
+    and feeds the per-endpoint percentiles served by /api/metrics/. Statements slower than
+    SLOW_QUERY_THRESHOLD_MS go to the slow-query log (main.slowlog).
+    Keep it first in MIDDLEWARE so `total` covers the whole stack.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = request.timing = RequestTiming()
+
+        with connection.execute_wrapper(timing.record_query):
+            response = self.get_response(request)
+
+        total = perf_counter() - timing.started
+        view_finished = timing.view_finished or perf_counter()
+        view_time = view_finished - timing.view_started if timing.view_started else 0.0
+        # Querysets are lazy, so SQL mostly runs inside the serializer; report it separately
+        serialize_time = max(view_time - timing.db_time, 0.0)
+
+        response['Server-Timing'] = ", ".join([
+            f'db;dur={timing.db_time * 1000:.2f};desc="{timing.queries} queries"',
+            f'serialize;dur={serialize_time * 1000:.2f}',
+            f'render;dur={timing.render_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.view_name if match else 'unmatched'
+
+        registry.observe('http_request_duration_seconds', endpoint, total)
+        registry.observe('http_request_db_seconds', endpoint, timing.db_time)
+        registry.observe('http_request_db_queries', endpoint, timing.queries)
+        registry.observe('http_request_serialize_seconds', endpoint, serialize_time)
+        registry.observe('http_request_render_seconds', endpoint, timing.render_time)
+
+        if timing.slow_queries:
+            record_slow_queries(endpoint, timing.slow_queries)
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'queries': timing.queries,
+            'db_ms': round(timing.db_time * 1000, 2),
+            'serialize_ms': round(serialize_time * 1000, 2),
+            'render_ms': round(timing.render_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timing.view_started = perf_counter()
+        return None
+
+    def process_template_response(self, request, response):
+        # Called right before DRF's Response is rendered
+        timing = request.timing
+        timing.view_finished = render_started = perf_counter()
+
+        def finish_render(rendered):
+            timing.render_time = perf_counter() - render_started
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Runs a request under cProfile and stores the result as a RequestProfile (Admin > Request Profiles).
+    Triggered when a logged-in staff user sends `X-Profile: 1`, or at random for a
+    PROFILER_SAMPLE_RATE fraction of all requests. Must come after AuthenticationMiddleware.
+    Only one request per process is profiled at a time; overlapping ones run unprofiled.
+    """
+    HEADER = 'HTTP_X_PROFILE'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if request.META.get(self.HEADER) == '1' and request.user.is_staff:
+            return True
+        rate = settings.PROFILER_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        # An overlapping request on a threaded worker is served unprofiled rather than failing
+        if not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Some other profiling tool (a debugger, coverage) holds the hook
+                return self.get_response(request)
+            started = perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = perf_counter() - started
+        finally:
+            _profiling.release()
+
+        profile = self.save_profile(request, response, profiler, duration)
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    def save_profile(self, request, response, profiler, duration):
+        stats_out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stats_out)
+        raw = marshal.dumps(stats.stats)
+        stats.strip_dirs().sort_stats('cumulative')
+        stats.print_stats(settings.PROFILER_TOP_FUNCTIONS)
+
+        tree_out = io.StringIO()
+        stats.stream = tree_out
+        stats.print_callees(settings.PROFILER_TOP_FUNCTIONS)
+
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'user', None)
+        profile = RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:500],
+            view_name=match.view_name if match else '',
+            status_code=response.status_code,
+            triggered_by=user.get_username() if request.META.get(self.HEADER) == '1' and user.is_staff else '',
+            duration_ms=duration * 1000,
+            stats=stats_out.getvalue(),
+            call_tree=tree_out.getvalue(),
+            raw=raw,
+        )
+
+        # Keep only the most recent profiles
+        stale = RequestProfile.objects.values_list('pk', flat=True)[settings.PROFILER_KEEP:]
+        RequestProfile.objects.filter(pk__in=list(stale)).delete()
+        return profile
@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-19 06:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    # Every existing category is top-level, so its path is just its own slug
+    Category = apps.get_model('main', 'Category')
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.path = f"{category.slug}/"
+        category.depth = 0
+    Category.objects.bulk_update(categories, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_promocode'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='category',
+            options={'ordering': ['path'], 'verbose_name_plural': 'Categories'},
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Leave empty for a top-level category', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='main.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-19 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_usage_shards(apps, schema_editor):
+    # PromoCode.save() creates these for new codes; backfill existing ones (PromoCode.USAGE_SHARDS = 16)
+    PromoCode = apps.get_model('main', 'PromoCode')
+    PromoCodeUsageShard = apps.get_model('main', 'PromoCodeUsageShard')
+    PromoCodeUsageShard.objects.bulk_create([
+        PromoCodeUsageShard(promo_id=promo_id, shard=shard)
+        for promo_id in PromoCode.objects.values_list('id', flat=True)
+        for shard in range(16)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses',
+            field=models.PositiveIntegerField(blank=True, help_text='Total redemptions allowed across all customers (leave empty for unlimited)', null=True),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses_per_customer',
+            field=models.PositiveIntegerField(blank=True, help_text='Redemptions allowed per customer (leave empty for unlimited)', null=True),
+        ),
+        migrations.CreateModel(
+            name='PromoCodeUsageShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('used', models.PositiveIntegerField(default=0)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_shards', to='main.promocode')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('promo', 'shard'), name='unique_promo_usage_shard')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PromoCustomerUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customer_usages', to='main.promocode')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('promo', 'customer'), name='unique_promo_customer_usage')],
+            },
+        ),
+        migrations.RunPython(create_usage_shards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-19 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('status_code', models.PositiveIntegerField(null=True)),
+                ('triggered_by', models.CharField(blank=True, help_text='Staff username, or empty when sampled', max_length=150)),
+                ('duration_ms', models.FloatField()),
+                ('stats', models.TextField(help_text='Functions sorted by cumulative time')),
+                ('call_tree', models.TextField(help_text='Callees of the slowest functions')),
+                ('raw', models.BinaryField(help_text='pstats dump, loadable with snakeviz or pstats.Stats')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
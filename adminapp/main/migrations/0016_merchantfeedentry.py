@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-19 07:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_product_changes_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MerchantFeedEntry',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed_entry', serialize=False, to='main.product')),
+                ('xml', models.TextField()),
+                ('tsv', models.TextField()),
+                ('built_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Merchant feed entries',
+            },
+        ),
+    ]
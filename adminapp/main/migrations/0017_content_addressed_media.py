@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 08:05
+
+import main.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_merchantfeedentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='banner',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=main.storage.ContentAddressedStorage(), upload_to='banners/'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=main.storage.ContentAddressedStorage(), upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='testimonial',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Optional customer photo', null=True, storage=main.storage.ContentAddressedStorage(), upload_to='testimonials/'),
+        ),
+    ]
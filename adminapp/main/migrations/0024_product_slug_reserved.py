@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-19 11:20
+
+import main.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_category_path_length'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=255, unique=True, validators=[main.models.validate_product_slug]),
+        ),
+    ]
@@ -1,7 +1,21 @@
-from django.db import models
+import random
+import threading
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max, Q, Sum, Value
+from django.db.models.functions import Concat, Length, Substr
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
 from django.utils import timezone
 from django.utils.text import slugify
 
+from .placeholders import apply_metadata, field_file_metadata
+from .storage import media_storage
+
 class Announcement(models.Model):
     """
     Controls the scrolling text at the top of the site.
@@ -17,13 +31,25 @@ class Announcement(models.Model):
     def __str__(self):
         return self.text
 
-class Banner(models.Model):
+class ImageMetadata(models.Model):
+    """
+    Intrinsic size and a tiny blurred placeholder of the model's `image`, computed once on upload
+    (main.placeholders) so the storefront can lay out and preview images before they load.
+    """
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False, help_text="~16px WebP data URI")
+
+    class Meta:
+        abstract = True
+
+class Banner(ImageMetadata):
     """
     Controls main hero banners with Headings and Sub-headings.
     """
     heading = models.CharField(max_length=100)
     sub_heading = models.CharField(max_length=255, blank=True, null=True)
-    image = models.ImageField(upload_to='banners/', blank=True, null=True)
+    image = models.ImageField(upload_to='banners/', storage=media_storage, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     order = models.PositiveIntegerField(default=0, help_text="Order to display banners in")
     
@@ -58,14 +84,14 @@ class SaleBanner(models.Model):
     def is_expired(self):
         return timezone.now() > self.ends_at
     
-class Testimonial(models.Model):
+class Testimonial(ImageMetadata):
     name = models.CharField(max_length=100, help_text="Customer's name")
     location = models.CharField(max_length=100, help_text="City or Region (e.g., Mumbai)")
     text = models.TextField(help_text="The review content")
     rating = models.PositiveIntegerField(default=5, help_text="Star rating (1-5)")
     product_name = models.CharField(max_length=200, help_text="Name of the product they purchased")
     
-    image = models.ImageField(upload_to='testimonials/', blank=True, null=True, help_text="Optional customer photo")
+    image = models.ImageField(upload_to='testimonials/', storage=media_storage, blank=True, null=True, help_text="Optional customer photo")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -99,24 +125,175 @@ class SocialLink(models.Model):
     def __str__(self):
         return f"{self.get_platform_display()} - {self.url}"
 
+# Sorts after any character a slug can contain, so 'rings/' <= path < 'rings/\uffff'
+# covers exactly the 'rings/' subtree.
+PATH_MAX_CHAR = '\uffff'
+PATH_SEPARATOR = '/'
+
+
+class CategoryQuerySet(models.QuerySet):
+    def subtree(self, category):
+        """
+        The category and all of its descendants, as a single range scan on `path`.
+        A range (rather than LIKE 'prefix%') keeps the index usable on SQLite too.
+        """
+        return self.filter(path__gte=category.path, path__lt=category.path + PATH_MAX_CHAR)
+
+    def delete(self):
+        # Their products (and their subcategories' products) first, in bulk: see ProductQuerySet.delete()
+        in_subtrees = Q(pk__in=[])
+        for path in self.values_list('path', flat=True):
+            in_subtrees |= Q(category__path__gte=path, category__path__lt=path + PATH_MAX_CHAR)
+        with transaction.atomic():
+            Product.objects.filter(in_subtrees).delete()
+            return super().delete()
+
+
 class Category(models.Model):
+    """
+    Product categories, nested via `parent`.
+    `path` is the materialized path of slugs from the root, e.g. 'silver-jewellery/rings/toe-rings/',
+    so "everything under Rings" is a prefix (range) query on an indexed column.
+    """
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True, blank=True)
+    parent = models.ForeignKey(
+        'self', related_name='children', on_delete=models.CASCADE,
+        blank=True, null=True,
+        help_text="Leave empty for a top-level category"
+    )
+    # Room for ten levels of 100-character slugs; deeper trees are refused by check_path_length()
+    path = models.CharField(max_length=1010, editable=False, db_index=True, default='')
+    depth = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CategoryQuerySet.as_manager()
+
+    def build_path(self, slug=None):
+        # Read the parent's path from the database; an in-memory parent may be stale after a move
+        prefix = ''
+        if self.parent_id:
+            prefix = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+        return f"{prefix}{slug or self.slug}{PATH_SEPARATOR}"
+
+    def check_path_length(self, path, old_path=''):
+        """Raises ValidationError if `path`, or a descendant's path once moved under it, won't fit."""
+        longest = len(path)
+        if old_path and old_path != path:
+            descendants = Category.objects.filter(path__gt=old_path, path__lt=old_path + PATH_MAX_CHAR)
+            deepest = descendants.aggregate(longest=Max(Length('path')))['longest']
+            if deepest:
+                longest = max(longest, deepest - len(old_path) + len(path))
+        max_length = Category._meta.get_field('path').max_length
+        if longest > max_length:
+            raise ValidationError(
+                f"Category paths are limited to {max_length} characters; use a shorter slug or a shallower parent."
+            )
+
+    def clean(self):
+        super().clean()
+        current_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() if self.pk else ''
+        if self.pk and self.parent_id:
+            parent = Category.objects.get(pk=self.parent_id)
+            if parent.pk == self.pk or (current_path and parent.path.startswith(current_path)):
+                raise ValidationError({'parent': "A category cannot be nested under itself or one of its children."})
+        self.check_path_length(self.build_path(self.slug or slugify(self.name)), current_path)
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+
+        old_path = old_name = ''
+        if self.pk:
+            old_path, old_name = Category.objects.filter(pk=self.pk).values_list('path', 'name').first() or ('', '')
+        self.path = self.build_path()
+        self.depth = self.path.count(PATH_SEPARATOR) - 1
+        # Imports and other code that skip clean() still mustn't write a truncated path
+        self.check_path_length(self.path, old_path)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Moving or renaming a node rewrites the prefix of every descendant in one UPDATE
+            if old_path and old_path != self.path:
+                depth_change = self.depth - (old_path.count(PATH_SEPARATOR) - 1)
+                Category.objects.filter(
+                    path__gt=old_path, path__lt=old_path + PATH_MAX_CHAR
+                ).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + depth_change,
+                )
+            # Products show their category's name, so a rename is a change for the delta feed
+            if old_name and old_name != self.name:
+                self.products.update(updated_at=timezone.now())
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            Product.objects.filter(category__in=Category.objects.subtree(self)).delete()
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return self.name
     
     class Meta:
         verbose_name_plural = "Categories"
+        ordering = ['path']
+
+# Sent once per change to the catalog: a single product saved or deleted, or a whole bulk
+# update (ProductQuerySet.update_in_batches), with the affected `product_ids`. Anything that
+# caches data derived from products should drop it here rather than on post_save, which
+# queryset updates never send.
+catalog_changed = Signal()
+
+# Set while ProductQuerySet.delete() runs, which tombstones its products itself
+_bulk_delete = threading.local()
+
+
+class ProductQuerySet(models.QuerySet):
+    def update_in_batches(self, batch_size=2000, **values):
+        """
+        Set-based UPDATE of every product in the queryset, `batch_size` ids per statement and
+        transaction so no single write holds the database for long. Stamps `updated_at` (which
+        update() skips) and sends catalog_changed once at the end. Returns the number updated.
+        """
+        pks = list(self.order_by('pk').values_list('pk', flat=True))
+        values['updated_at'] = timezone.now()
+        updated = 0
+        for start in range(0, len(pks), batch_size):
+            with transaction.atomic():
+                updated += Product.objects.filter(pk__in=pks[start:start + batch_size]).update(**values)
+        if pks:
+            catalog_changed.send(sender=Product, product_ids=pks)
+        return updated
+
+    def delete(self):
+        """
+        Deletes the products with one tombstone INSERT and one catalog_changed for them all,
+        rather than the post_delete receiver's one of each per product.
+        """
+        products = list(self.order_by().values_list('pk', 'slug'))
+        with transaction.atomic():
+            ProductTombstone.objects.bulk_create([ProductTombstone(product_id=pk, slug=slug) for pk, slug in products])
+            _bulk_delete.active = True
+            try:
+                deleted = super().delete()
+            finally:
+                _bulk_delete.active = False
+        if products:
+            catalog_changed.send(sender=Product, product_ids=[pk for pk, _ in products])
+        return deleted
+
+
+# Fixed routes under /api/products/ that a product slug would be shadowed by
+RESERVED_PRODUCT_SLUGS = frozenset({'changes', 'autocomplete'})
+
+
+def validate_product_slug(value):
+    if value in RESERVED_PRODUCT_SLUGS:
+        raise ValidationError(f"'{value}' is reserved for /api/products/{value}/.")
+
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
-    slug = models.SlugField(max_length=255, unique=True, blank=True)
+    slug = models.SlugField(max_length=255, unique=True, blank=True, validators=[validate_product_slug])
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_percent = models.PositiveIntegerField(default=0, help_text="Percentage discount (0-100)")
@@ -124,6 +301,8 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0)
     rating = models.FloatField(default=0.0)
     reviews_count = models.PositiveIntegerField(default=0)
+    # Time-decayed view count, maintained by main.popularity (?ordering=popular)
+    popularity = models.FloatField(default=0.0, editable=False)
     
     # Specifications (stored as JSON)
     # Expected format: [{"label": "Material", "value": "Silver"}, ...]
@@ -137,18 +316,82 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset scans for the delta feed (/api/products/changes/)
+            models.Index(fields=['updated_at', 'id'], name='product_updated_idx'),
+            models.Index(fields=['-popularity', 'id'], name='product_popularity_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = unique_product_slugs([self.name])[0]
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
+
+    def sale_price(self, now=None):
+        """
+        Price after `discount_percent`, or None when there is no discount.
+        A discount attached to a timed sale (is_sale_active + sale_ends_at) stops when the sale ends.
+        """
+        if not self.discount_percent:
+            return None
+        if self.is_sale_active and self.sale_ends_at and self.sale_ends_at <= (now or timezone.now()):
+            return None
+        discounted = Decimal(self.price) * (100 - min(self.discount_percent, 100)) / 100
+        return discounted.quantize(Decimal('0.01'))
+
+
+def unique_product_slugs(names, exclude=(), chunk_size=200):
+    """
+    Unique Product slugs for `names`, in order: 'silver-payal', then 'silver-payal-2', ...
+    avoiding existing slugs, each other, `exclude` and RESERVED_PRODUCT_SLUGS. Existing slugs are fetched with one
+    indexed range query per `chunk_size` distinct names, so bulk imports don't query per row.
+    """
+    max_base = Product._meta.get_field('slug').max_length - 8
+    bases = [slugify(name)[:max_base].strip('-') or 'product' for name in names]
+
+    taken = set(exclude) | RESERVED_PRODUCT_SLUGS
+    distinct = sorted(set(bases))
+    for start in range(0, len(distinct), chunk_size):
+        lookup = Q()
+        for base in distinct[start:start + chunk_size]:
+            # 'base' itself, or 'base-<anything>' ('.' sorts right after '-')
+            lookup |= Q(slug=base) | Q(slug__gte=f"{base}-", slug__lt=f"{base}.")
+        taken.update(Product.objects.filter(lookup).values_list('slug', flat=True))
+
+    slugs = []
+    counters = {}
+    for base in bases:
+        n = counters.get(base, 1)
+        slug = base if n == 1 else f"{base}-{n}"
+        while slug in taken:
+            n += 1
+            slug = f"{base}-{n}"
+        counters[base] = n
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
     
 
-class ProductImage(models.Model):
+class PopularityEpoch(models.Model):
+    """
+    A single row: the time Product.popularity's view weights are counted from (see main.popularity).
+    Moved forward, with every score scaled down to match, whenever the weights grow too large.
+    """
+    started = models.DateTimeField()
+
+    def __str__(self):
+        return f"Popularity weights counted from {self.started:%Y-%m-%d %H:%M}"
+
+
+class ProductImage(ImageMetadata):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to='products/', storage=media_storage)
     order = models.PositiveIntegerField(default=0)
 
     class Meta:
@@ -156,6 +399,117 @@ class ProductImage(models.Model):
 
     def __str__(self):
         return f"Image for {self.product.name}"
+
+
+class MerchantFeedEntry(models.Model):
+    """
+    A product's pre-rendered merchant feed item, in each feed format. manage.py build_merchant_feed
+    re-renders only products changed since `built_at`, then concatenates these into the cached feed files.
+    """
+    product = models.OneToOneField(Product, primary_key=True, related_name='feed_entry', on_delete=models.CASCADE)
+    xml = models.TextField()
+    tsv = models.TextField()
+    built_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "Merchant feed entries"
+
+    def __str__(self):
+        return f"Feed entry for product {self.product_id}"
+
+
+class RelatedProduct(models.Model):
+    """
+    One of a product's nearest neighbours, best first by `rank`. Precomputed by
+    manage.py build_related_products (main.recommendations) and served by /api/products/<slug>/related/.
+    """
+    product = models.ForeignKey(Product, related_name='related_links', on_delete=models.CASCADE)
+    # Left dangling when the related product is deleted (the join drops it) so the next
+    # build_related_products --changed can find the lists it was in
+    related = models.ForeignKey(Product, related_name='recommended_in', on_delete=models.DO_NOTHING, db_constraint=False)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    built_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+class SearchWord(models.Model):
+    """
+    A distinct word of the catalog's product names and specification values, found by its
+    trigrams when a search term is misspelled (main.search). Rebuilt by manage.py build_search_words.
+    """
+    word = models.CharField(max_length=64, unique=True)
+    trigram_count = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return self.word
+
+
+class SearchTrigram(models.Model):
+    trigram = models.CharField(max_length=3)
+    word = models.ForeignKey(SearchWord, related_name='trigrams', on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trigram', 'word'], name='search_trigram_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram!r} in {self.word_id}"
+
+
+class ProductTombstone(models.Model):
+    """
+    Left behind when a Product is deleted, so the delta feed can tell mirrors to drop it.
+    Pruned after DELTA_FEED_TOMBSTONE_DAYS (manage.py prune_tombstones).
+    """
+    product_id = models.PositiveIntegerField()
+    slug = models.SlugField(max_length=255)
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['deleted_at']
+
+    def __str__(self):
+        return f"{self.slug} (deleted {self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    # Single deletes (instance.delete()). Queryset and category deletes go through
+    # ProductQuerySet.delete(), which has already tombstoned every product in one INSERT
+    if getattr(_bulk_delete, 'active', False):
+        return
+    ProductTombstone.objects.create(product_id=instance.pk, slug=instance.slug)
+    catalog_changed.send(sender=Product, product_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        catalog_changed.send(sender=Product, product_ids=[instance.pk])
+
+
+@receiver(pre_save, sender=Banner)
+@receiver(pre_save, sender=Testimonial)
+@receiver(pre_save, sender=ProductImage)
+def fill_image_metadata(sender, instance, raw=False, **kwargs):
+    # New uploads are still pending here (the file is stored later in save()), so they are read
+    # from the upload itself; rows without metadata yet are read from storage
+    if raw:
+        return
+    if not instance.image:
+        apply_metadata(instance, None)
+    elif not instance.image._committed or instance.image_width is None:
+        apply_metadata(instance, field_file_metadata(instance.image))
     
 
 
@@ -241,9 +595,31 @@ class PromoCode(models.Model):
     valid_from = models.DateTimeField(default=timezone.now)
     valid_to = models.DateTimeField(blank=True, null=True)
 
+    # Usage Limits
+    max_uses = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Total redemptions allowed across all customers (leave empty for unlimited)"
+    )
+    max_uses_per_customer = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Redemptions allowed per customer (leave empty for unlimited)"
+    )
+
+    # The global usage count is split across this many PromoCodeUsageShard rows so concurrent
+    # checkouts update different rows instead of queueing on one. Each shard owns a fixed slice
+    # of max_uses, so the cap is still exact.
+    USAGE_SHARDS = 16
+
     def __str__(self):
         return f"{self.code} - {self.discount_value} ({self.get_discount_type_display()})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        PromoCodeUsageShard.objects.bulk_create(
+            [PromoCodeUsageShard(promo=self, shard=shard) for shard in range(self.USAGE_SHARDS)],
+            ignore_conflicts=True,
+        )
+
     def is_valid(self):
         now = timezone.now()
         if not self.is_active:
@@ -253,3 +629,284 @@ class PromoCode(models.Model):
         if now < self.valid_from:
             return False
         return True
+
+    @property
+    def times_used(self):
+        return self.usage_shards.aggregate(total=Sum('used'))['total'] or 0
+
+    def is_exhausted(self):
+        return self.max_uses is not None and self.times_used >= self.max_uses
+
+    def customer_uses(self, customer):
+        usage = self.customer_usages.filter(customer=normalize_customer(customer)).values_list('count', flat=True).first()
+        return usage or 0
+
+    def calculate_discount(self, total_amount):
+        if self.discount_type == 'percent':
+            discount = total_amount * (self.discount_value / Decimal(100))
+            if self.max_discount_amount:
+                discount = min(discount, self.max_discount_amount)
+        else:
+            discount = self.discount_value
+
+        # Ensure discount doesn't exceed total
+        return min(discount, total_amount)
+
+    def shard_capacity(self, shard):
+        """This shard's slice of max_uses; the slices add up to exactly max_uses."""
+        base, remainder = divmod(self.max_uses, self.USAGE_SHARDS)
+        return base + (1 if shard < remainder else 0)
+
+    def redeem(self, customer):
+        """
+        Records one use of the code by `customer`, enforcing both limits with conditional
+        `UPDATE ... SET used = used + 1 WHERE used < cap` statements (no read-modify-write).
+        Raises PromoCodeExhausted if either limit is reached; nothing is recorded in that case.
+        """
+        customer = normalize_customer(customer)
+        with transaction.atomic():
+            if not self._take_customer_slot(customer):
+                raise PromoCodeExhausted("You have already used this promo code the maximum number of times")
+            if not self._take_global_slot():
+                raise PromoCodeExhausted("This promo code has reached its usage limit")
+
+    def _take_customer_slot(self, customer):
+        usages = PromoCustomerUsage.objects.filter(promo=self, customer=customer)
+        if self.max_uses_per_customer is not None:
+            usages = usages.filter(count__lt=self.max_uses_per_customer)
+        if usages.update(count=F('count') + 1):
+            return True
+
+        # First use by this customer. If a concurrent request created the row first,
+        # fall back to the conditional increment above.
+        if self.max_uses_per_customer == 0:
+            return False
+        try:
+            with transaction.atomic():
+                PromoCustomerUsage.objects.create(promo=self, customer=customer, count=1)
+            return True
+        except IntegrityError:
+            return bool(usages.update(count=F('count') + 1))
+
+    def _take_global_slot(self):
+        # Start at a random shard so concurrent checkouts spread across rows
+        start = random.randrange(self.USAGE_SHARDS)
+        for offset in range(self.USAGE_SHARDS):
+            shard = (start + offset) % self.USAGE_SHARDS
+            shards = PromoCodeUsageShard.objects.filter(promo=self, shard=shard)
+            if self.max_uses is not None:
+                shards = shards.filter(used__lt=self.shard_capacity(shard))
+            if shards.update(used=F('used') + 1):
+                return True
+        return False
+
+
+def normalize_customer(customer):
+    return customer.strip().lower()
+
+
+class PromoCodeExhausted(Exception):
+    """Raised by PromoCode.redeem when the global or per-customer limit is reached."""
+
+
+class PromoCodeUsageShard(models.Model):
+    """One slice of a promo code's global usage counter. Read the total with PromoCode.times_used."""
+    promo = models.ForeignKey(PromoCode, related_name='usage_shards', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    used = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'shard'], name='unique_promo_usage_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.promo.code} #{self.shard}: {self.used}"
+
+
+class PromoCustomerUsage(models.Model):
+    """How many times a customer (email or phone) has redeemed a promo code."""
+    promo = models.ForeignKey(PromoCode, related_name='customer_usages', on_delete=models.CASCADE)
+    customer = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'customer'], name='unique_promo_customer_usage'),
+        ]
+
+    def __str__(self):
+        return f"{self.promo.code} - {self.customer}: {self.count}"
+
+
+class OutOfStock(Exception):
+    """Raised when a cart line can't be reserved; the whole reservation is rolled back."""
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f"Not enough stock for product {product_id} (requested {requested})")
+
+
+class StockReservationManager(models.Manager):
+    def reserve(self, quantities):
+        """
+        Atomically takes stock for a whole cart and returns the held reservation.
+        `quantities` maps product id -> quantity.
+
+        Each line is a conditional `UPDATE ... SET stock = stock - qty WHERE stock >= qty`,
+        so two buyers can never both take the last unit, and no row is read then written back.
+        """
+        ttl = timezone.timedelta(minutes=settings.STOCK_RESERVATION_TTL_MINUTES)
+        now = timezone.now()
+
+        with transaction.atomic():
+            # Always lock products in the same order so overlapping carts can't deadlock
+            for product_id in sorted(quantities):
+                quantity = quantities[product_id]
+                updated = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+                    stock=F('stock') - quantity,
+                    updated_at=now,
+                )
+                if not updated:
+                    raise OutOfStock(product_id, quantity)
+
+            reservation = self.create(expires_at=now + ttl)
+            StockReservationItem.objects.bulk_create([
+                StockReservationItem(reservation=reservation, product_id=product_id, quantity=quantity)
+                for product_id, quantity in quantities.items()
+            ])
+        return reservation
+
+    def release_expired(self, batch_size=500):
+        """
+        Returns stock held by reservations past their expiry. Called by the
+        `release_expired_reservations` management command. Returns the number released.
+        """
+        released = 0
+        while True:
+            expired = list(
+                self.filter(status=StockReservation.HELD, expires_at__lte=timezone.now())
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not expired:
+                return released
+            for reservation in self.filter(pk__in=expired):
+                if reservation.release():
+                    released += 1
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for a cart between "add to checkout" and payment.
+    Held stock is already subtracted from Product.stock; releasing gives it back.
+    """
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+    ]
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StockReservationManager()
+
+    class Meta:
+        indexes = [
+            # The sweeper's lookup: held reservations ordered by expiry
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.token} ({self.get_status_display()})"
+
+    def _transition(self, to_status, **extra_filters):
+        # Conditional status flip: only one caller (checkout, release or the sweeper) can win
+        updated = StockReservation.objects.filter(
+            pk=self.pk, status=self.HELD, **extra_filters
+        ).update(status=to_status)
+        if updated:
+            self.status = to_status
+        return bool(updated)
+
+    def confirm(self):
+        """Marks a still-valid held reservation as paid. Returns False if it expired or was released."""
+        return self._transition(self.CONFIRMED, expires_at__gt=timezone.now())
+
+    def release(self):
+        """Returns the held stock to the products. Returns False if it was already confirmed or released."""
+        now = timezone.now()
+        with transaction.atomic():
+            if not self._transition(self.RELEASED):
+                return False
+            for item in self.items.all():
+                Product.objects.filter(pk=item.product_id).update(
+                    stock=F('stock') + item.quantity,
+                    updated_at=now,
+                )
+        return True
+
+
+class StockReservationItem(models.Model):
+    reservation = models.ForeignKey(StockReservation, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='reservation_items', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id}"
+
+
+class SlowQuery(models.Model):
+    """
+    One row per distinct slow statement (by normalized fingerprint), written by the
+    slow-query log in RequestTimingMiddleware. Browse it in the admin.
+    """
+    fingerprint = models.CharField(max_length=40, unique=True)
+    sql = models.TextField(help_text="Normalized SQL (literals and IN-lists collapsed)")
+    explain = models.TextField(blank=True, help_text="Query plan captured the first time it was seen")
+    view_name = models.CharField(max_length=200, blank=True, help_text="Endpoint that last ran it")
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Slow Query"
+        verbose_name_plural = "Slow Queries"
+        ordering = ['-total_ms']
+
+    def __str__(self):
+        return f"{self.sql[:80]} ({self.count}x)"
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0
+
+
+class RequestProfile(models.Model):
+    """
+    A cProfile run of one request, captured by ProfilerMiddleware either on demand
+    (staff sending `X-Profile: 1`) or by random sampling (PROFILER_SAMPLE_RATE).
+    """
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveIntegerField(null=True)
+    triggered_by = models.CharField(max_length=150, blank=True, help_text="Staff username, or empty when sampled")
+    duration_ms = models.FloatField()
+    stats = models.TextField(help_text="Functions sorted by cumulative time")
+    call_tree = models.TextField(help_text="Callees of the slowest functions")
+    raw = models.BinaryField(help_text="pstats dump, loadable with snakeviz or pstats.Stats")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,80 @@
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.utils.functional import cached_property
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+
+
+def estimated_row_count(model):
+    """
+    The database's own estimate of a table's size, without scanning it, or None if it has none.
+    PostgreSQL keeps one in pg_class (refreshed by autovacuum); SQLite only after ANALYZE.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        elif connection.vendor == 'sqlite':
+            try:
+                # The first number of each row is the table's row count
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            except DatabaseError:
+                return None  # never analyzed
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin paginator for big tables: an unfiltered changelist uses the table estimate instead of
+    COUNT(*), which is a full scan on PostgreSQL. Filtered and small lists are still counted exactly.
+    """
+    threshold = 10_000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.has_filters():
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate >= self.threshold:
+                return estimate
+        return super().count
+
+
+class ProductPagination(LimitOffsetPagination):
+    """
+    Pages /api/products/ when the client asks for it with ?limit= (and ?offset=), keeping the
+    body a plain list, as Collections.tsx expects. Paging details go in headers instead:
+    `X-Total-Count` and an RFC 8288 `Link` header with rel="next"/"prev". Without ?limit the
+    whole list is returned, unpaged, as before paging existed.
+    """
+    default_limit = 60
+    max_limit = 120
+    # Set by paginate_queryset() when a page is requested
+    offset = 0
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.limit_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        links = []
+        next_link = self.get_next_link()
+        previous_link = self.get_previous_link()
+        if next_link:
+            links.append(f'<{next_link}>; rel="next"')
+        if previous_link:
+            links.append(f'<{previous_link}>; rel="prev"')
+
+        headers = {'X-Total-Count': str(self.count)}
+        if links:
+            headers['Link'] = ', '.join(links)
+        return Response(data, headers=headers)
+
+    def get_paginated_response_schema(self, schema):
+        return schema
@@ -0,0 +1,103 @@
+"""
+Intrinsic size and a tiny inline placeholder for uploaded images (Banner, Testimonial and
+ProductImage), so the storefront can reserve the layout and paint a blurred preview before
+the real image arrives, without another request.
+
+They are computed once, when an image is uploaded, and stored on the row as `image_width`,
+`image_height` and `image_placeholder` (a ~16px WebP data URI of a couple of hundred bytes).
+Rows written in bulk (seeding, catalog import) are filled in by manage.py build_image_placeholders.
+"""
+import base64
+import io
+import logging
+import threading
+
+from django.db import connections
+from PIL import Image, ImageOps
+
+from .storage import media_fields, media_storage
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 30
+EXIF_ORIENTATION = 0x0112
+
+
+def image_metadata(file):
+    """(width, height, placeholder data URI) for an open image file, or None if it isn't a readable image."""
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+            if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                # Stored sideways; browsers lay it out rotated
+                width, height = height, width
+            # JPEGs decode straight to a reduced size, far cheaper than a full decode
+            image.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+            thumbnail = ImageOps.exif_transpose(image).convert('RGBA' if has_alpha else 'RGB')
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        file.seek(0)
+    thumbnail.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return width, height, "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def field_file_metadata(field_file):
+    """image_metadata() of a model's image, whether it is a pending upload or already in storage."""
+    if not field_file._committed:
+        return image_metadata(field_file)
+    try:
+        with media_storage.open(field_file.name) as fh:
+            return image_metadata(fh)
+    except OSError:
+        return None
+
+
+def apply_metadata(instance, metadata):
+    width, height, placeholder = metadata or (None, None, '')
+    instance.image_width, instance.image_height, instance.image_placeholder = width, height, placeholder
+
+
+def backfill(everything=False):
+    """
+    Fills in image metadata for rows without it (all rows with `everything`). Each distinct file is
+    read once and its rows updated with one UPDATE. Returns (rows updated, names that couldn't be read).
+    """
+    updated, unreadable = 0, []
+    for model, field in media_fields():
+        rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+        if not everything:
+            rows = rows.filter(image_width__isnull=True)
+        for name in list(rows.order_by().values_list(field, flat=True).distinct()):
+            try:
+                with media_storage.open(name) as fh:
+                    metadata = image_metadata(fh)
+            except OSError:
+                metadata = None
+            if metadata is None:
+                unreadable.append(name)
+                continue
+            width, height, placeholder = metadata
+            updated += model.objects.filter(**{field: name}).update(
+                image_width=width, image_height=height, image_placeholder=placeholder,
+            )
+    return updated, unreadable
+
+
+def backfill_in_background():
+    """
+    Runs backfill() in a daemon thread, for rows just written in bulk. If the process exits first,
+    manage.py build_image_placeholders fills in what's left.
+    """
+    def run():
+        try:
+            backfill()
+        except Exception:
+            logger.exception("Image placeholder backfill failed")
+        finally:
+            connections.close_all()
+    threading.Thread(target=run, name='image-placeholders', daemon=True).start()
@@ -0,0 +1,128 @@
+"""
+Product popularity, for the trending sort (/api/products/?ordering=popular).
+
+Views of /api/products/<slug>/ are counted in memory, per worker process, and added to
+Product.popularity at most every POPULARITY_FLUSH_SECONDS with one executemany'd UPDATE, run
+after the response has been sent. Counting a view is a dict increment under a lock; a worker
+that exits loses the views since its last flush, which a popularity score can afford.
+
+The score decays with a half-life of POPULARITY_HALF_LIFE_HOURS without ever rewriting old rows
+("forward decay"): a view is worth 2 ** (hours since EPOCH / half-life), so recent views outweigh
+old ones by exactly the decay, and ordering by the stored sum is ordering by the decayed score.
+The weights double every half-life, so once they reach 2 ** RENORMALISE_HALF_LIVES the epoch
+(PopularityEpoch) is moved forward by whole half-lives and every score is halved as many times,
+in one UPDATE. That scales all scores alike, so the order is unchanged and nothing overflows.
+"""
+import logging
+import math
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from time import monotonic
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import PopularityEpoch, Product
+
+logger = logging.getLogger(__name__)
+
+# Where the weights start from until the first renormalisation
+EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+# About 190 days at a 72h half-life; a weight of 2 ** 64 still leaves scores plenty of float range
+RENORMALISE_HALF_LIVES = 64
+
+
+def half_lives(since, now):
+    return (now - since).total_seconds() / 3600 / settings.POPULARITY_HALF_LIFE_HOURS
+
+
+def view_weight(now=None, epoch=EPOCH):
+    return 2.0 ** half_lives(epoch, now or timezone.now())
+
+
+def quoted_names():
+    quote = connection.ops.quote_name
+    meta = Product._meta
+    return quote(meta.db_table), quote(meta.get_field('popularity').column), quote(meta.pk.column)
+
+
+def current_epoch(now):
+    """The epoch weights are counted from as of `now`, renormalised first if due. Call in a transaction."""
+    # Locked, so a flush in another worker can't weigh its views against an epoch being moved
+    epoch, _ = PopularityEpoch.objects.select_for_update().get_or_create(pk=1, defaults={'started': EPOCH})
+    elapsed = half_lives(epoch.started, now)
+    if elapsed >= RENORMALISE_HALF_LIVES:
+        shift = math.floor(elapsed)
+        table, column, _ = quoted_names()
+        with connection.cursor() as cursor:
+            # A power of two, so the scaling is exact
+            cursor.execute(f"UPDATE {table} SET {column} = {column} * %s", [2.0 ** -shift])
+        epoch.started += timedelta(hours=shift * settings.POPULARITY_HALF_LIFE_HOURS)
+        epoch.save(update_fields=['started'])
+        logger.info("Moved the popularity epoch forward %d half-lives to %s", shift, epoch.started)
+    return epoch.started
+
+
+def add_popularity(counts, now=None):
+    """Adds `counts` ({product id: views}) to Product.popularity, weighted as of `now`, in one statement."""
+    now = now or timezone.now()
+    table, column, pk_column = quoted_names()
+    sql = f"UPDATE {table} SET {column} = {column} + %s WHERE {pk_column} = %s"
+    # Not a catalog change: updated_at and catalog_changed are left alone
+    with transaction.atomic():
+        weight = view_weight(now, current_epoch(now))
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(views * weight, pk) for pk, views in sorted(counts.items())])
+
+
+class ViewCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._last_flush = monotonic()
+
+    def record(self, product_id):
+        with self._lock:
+            self._counts[product_id] += 1
+
+    def pending(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def take(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._last_flush = monotonic()
+        return counts
+
+    def flush(self):
+        """Writes the counts so far. If that fails they are kept for the next flush."""
+        counts = self.take()
+        if not counts:
+            return 0
+        try:
+            add_popularity(counts)
+        except Exception:
+            # Runs after the response has been sent: there is nobody to report the error to
+            logger.exception("Could not save %d product view counts", len(counts))
+            with self._lock:
+                self._counts.update(counts)
+            return 0
+        return len(counts)
+
+    def flush_if_due(self):
+        if self._counts and monotonic() - self._last_flush >= settings.POPULARITY_FLUSH_SECONDS:
+            self.flush()
+
+
+views = ViewCounter()
+
+
+@receiver(request_finished)
+def flush_views(sender, **kwargs):
+    # Sent once the response is out, so a flush never delays the request that triggers it
+    views.flush_if_due()
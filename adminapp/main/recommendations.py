@@ -0,0 +1,223 @@
+"""
+"Related products": each product's nearest neighbours, precomputed by manage.py
+build_related_products (in full nightly, and with --changed every few minutes) and read by
+/api/products/<slug>/related/ with one indexed join on RelatedProduct.
+
+Each product becomes a weighted vector of its category and the category's ancestors, its
+`specifications` attributes (label=value), its price band (on a log scale, overlapping the
+neighbouring bands so close prices stay close) and the words of its name. Features are
+weighted by how rare they are, so what every product in a department shares counts for nothing.
+Similarity is cosine, computed with NumPy a block of products at a time, within each top-level
+category: related items come from the same department, and it keeps the work well under n².
+"""
+import math
+import re
+from array import array
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Category, PATH_MAX_CHAR, PATH_SEPARATOR, Product, ProductTombstone, RelatedProduct
+
+CATEGORY_WEIGHT = 3.0
+ANCESTOR_WEIGHT = 1.0
+SPECIFICATION_WEIGHT = 1.5
+PRICE_WEIGHT = 2.0
+NAME_WEIGHT = 1.0
+# Each price band is 35% wider than the one below it
+PRICE_BAND_RATIO = 1.35
+MAX_FEATURES = 512
+# Rows of the similarity matrix held at once: block size x group size floats
+MAX_BLOCK_CELLS = 1 << 24
+WORD_RE = re.compile(r'[a-z]{3,}')
+NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+def category_ancestors():
+    """({category id: [ancestor ids]}, {category id: top-level path})."""
+    paths = dict(Category.objects.values_list('pk', 'path'))
+    by_path = {path: pk for pk, path in paths.items()}
+    ancestors, departments = {}, {}
+    for pk, path in paths.items():
+        parts = path.split(PATH_SEPARATOR)[:-1]
+        prefixes = [PATH_SEPARATOR.join(parts[:n]) + PATH_SEPARATOR for n in range(1, len(parts))]
+        ancestors[pk] = [by_path[prefix] for prefix in prefixes if prefix in by_path]
+        departments[pk] = parts[0] + PATH_SEPARATOR if parts else path
+    return ancestors, departments
+
+
+def product_features(name, price, category_id, specifications, ancestors):
+    """{feature: weight} for one product, before rarity weighting."""
+    features = {f'c:{category_id}': CATEGORY_WEIGHT}
+    for ancestor in ancestors.get(category_id, ()):
+        features[f'c:{ancestor}'] = ANCESTOR_WEIGHT
+    for spec in specifications or ():
+        if not isinstance(spec, dict) or not spec.get('label') or spec.get('value') in (None, ''):
+            continue
+        label, value = str(spec['label']).lower(), str(spec['value']).lower()
+        number = NUMBER_RE.match(value)
+        if number and float(number[0]) > 0:
+            # "12.4 g" and "12.9 g" should match, so measurements are banded like prices
+            value = f"~{int(math.log(float(number[0]), PRICE_BAND_RATIO))}"
+        features[f's:{label}={value}'] = SPECIFICATION_WEIGHT
+    if price and price > 0:
+        band = int(math.log(float(price), PRICE_BAND_RATIO))
+        features[f'p:{band - 1}'] = features[f'p:{band + 1}'] = PRICE_WEIGHT / 2
+        features[f'p:{band}'] = PRICE_WEIGHT
+    for word in WORD_RE.findall(name.lower()):
+        features[f'n:{word}'] = NAME_WEIGHT
+    return features
+
+
+class Department:
+    """A top-level category's products and their features, as sparse (row, column, weight) triples."""
+
+    def __init__(self):
+        self.pks = array('q')
+        self.rows = array('l')
+        self.columns = array('l')
+        self.weights = array('f')
+        self.feature_ids = {}
+
+    def add(self, pk, features):
+        row = len(self.pks)
+        self.pks.append(pk)
+        for name, weight in features.items():
+            self.rows.append(row)
+            self.columns.append(self.feature_ids.setdefault(name, len(self.feature_ids)))
+            self.weights.append(weight)
+
+    def matrix(self):
+        """L2-normalised float32 matrix, one row per product, over the department's informative features."""
+        n = len(self.pks)
+        rows, columns, weights = np.asarray(self.rows), np.asarray(self.columns), np.asarray(self.weights)
+        document_frequency = np.bincount(columns, minlength=len(self.feature_ids))
+        # A feature only one product has can't make two products similar
+        vocabulary = np.argsort(-document_frequency, kind='stable')[:MAX_FEATURES]
+        vocabulary = vocabulary[document_frequency[vocabulary] > 1]
+        remap = np.full(len(self.feature_ids), -1)
+        remap[vocabulary] = np.arange(len(vocabulary))
+        idf = np.log((1 + n) / (1 + document_frequency[vocabulary])).astype(np.float32)
+
+        columns = remap[columns]
+        kept = columns >= 0
+        matrix = np.zeros((n, len(vocabulary)), dtype=np.float32)
+        matrix[rows[kept], columns[kept]] = weights[kept] * idf[columns[kept]]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+def load_departments(product_ids=None):
+    """{top-level category path: Department}, for every department or only those containing `product_ids`."""
+    ancestors, departments = category_ancestors()
+    products = Product.objects.order_by('pk')
+    if product_ids is not None:
+        wanted = set(
+            departments[category_id]
+            for category_id in Product.objects.filter(pk__in=list(product_ids)).values_list('category_id', flat=True).distinct()
+        )
+        if not wanted:
+            return {}
+        subtrees = Q(pk__in=[])
+        for path in wanted:
+            subtrees |= Q(category__path__gte=path, category__path__lt=path + PATH_MAX_CHAR)
+        products = products.filter(subtrees)
+
+    groups = defaultdict(Department)
+    rows = products.values_list('pk', 'name', 'price', 'category_id', 'specifications')
+    for pk, name, price, category_id, specifications in rows.iterator(chunk_size=5000):
+        groups[departments[category_id]].add(pk, product_features(name, price, category_id, specifications, ancestors))
+    return groups
+
+
+def nearest(matrix, rows, k):
+    """Yields (row, [(neighbour row, score)]) for `rows`, best first, a block of rows per matrix product."""
+    n = matrix.shape[0]
+    block = max(1, MAX_BLOCK_CELLS // max(n, 1))
+    for start in range(0, len(rows), block):
+        block_rows = rows[start:start + block]
+        scores = matrix[block_rows] @ matrix.T
+        scores[np.arange(len(block_rows)), block_rows] = -np.inf
+        if n - 1 > k:
+            top = np.argpartition(-scores, k, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(n), (len(block_rows), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        for i, row in enumerate(block_rows):
+            yield row, [(int(c), float(s)) for c, s in zip(top[i], top_scores[i]) if s > 0]
+
+
+def build_related(product_ids=None, k=None, batch_size=2000):
+    """
+    Recomputes the related products of `product_ids` (every product when None), replacing their
+    RelatedProduct rows. Returns how many products were recomputed.
+    """
+    k = k or settings.RELATED_PRODUCTS_COUNT
+    # Taken before reading, so products saved during the build are picked up by the next --changed run
+    now = timezone.now()
+    built_at = RelatedProduct._meta.get_field('built_at').get_db_prep_save(now, connection)
+    targets = None if product_ids is None else np.array(sorted(product_ids))
+    recomputed = 0
+    for department in load_departments(product_ids).values():
+        pks = np.asarray(department.pks)
+        rows = np.arange(len(pks)) if targets is None else np.flatnonzero(np.isin(pks, targets))
+        if not len(rows):
+            continue
+        matrix = department.matrix()
+        batch_products, links = [], []
+        for row, neighbours in nearest(matrix, rows, k):
+            batch_products.append(int(pks[row]))
+            links.extend(
+                (int(pks[row]), int(pks[column]), rank, score, built_at)
+                for rank, (column, score) in enumerate(neighbours)
+            )
+            if len(batch_products) >= batch_size:
+                write_links(batch_products, links)
+                recomputed += len(batch_products)
+                batch_products, links = [], []
+        if batch_products:
+            write_links(batch_products, links)
+            recomputed += len(batch_products)
+    return recomputed
+
+
+def write_links(product_ids, links):
+    """
+    Replaces the rows of `product_ids` with `links`, (product, related, rank, score, built_at)
+    tuples, in one executemany'd INSERT. Building a model instance per row for bulk_create()
+    took most of a full build's run time.
+    """
+    quote = connection.ops.quote_name
+    columns = [RelatedProduct._meta.get_field(name).column for name in ('product', 'related', 'rank', 'score', 'built_at')]
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        quote(RelatedProduct._meta.db_table),
+        ", ".join(quote(column) for column in columns),
+        ", ".join(["%s"] * len(columns)),
+    )
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product__in=product_ids).delete()
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, links)
+
+
+def changed_products():
+    """
+    Products whose related list may be out of date: changed since the last build, or listing a
+    product changed or deleted since. None if nothing was built yet.
+    """
+    since = RelatedProduct.objects.aggregate(last=Max('built_at'))['last']
+    if since is None:
+        return None
+    changed = set(Product.objects.filter(updated_at__gt=since).values_list('pk', flat=True))
+    deleted = ProductTombstone.objects.filter(deleted_at__gt=since).values_list('product_id', flat=True)
+    changed.update(
+        RelatedProduct.objects.filter(related_id__in=list(changed) + list(deleted)).values_list('product', flat=True)
+    )
+    return changed
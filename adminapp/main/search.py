@@ -0,0 +1,161 @@
+"""
+Typo-tolerant product search: the retry ProductListView makes when ?search= finds nothing,
+so "anklit", "paayal" and "oxidized" still find anklets, payals and oxidised pieces.
+
+Trigrams are kept for the catalog's vocabulary (the distinct words of product names and
+specification values, SearchWord and SearchTrigram) rather than for every product: the
+vocabulary is small, and a misspelled term only has to find the words spelled like it, as with
+pg_trgm's similarity() but on any database. Each term then matches products containing the term
+or one of those words, scored by how close the word is.
+
+manage.py build_search_words rebuilds the vocabulary (nightly), which also drops words no longer
+used. Words of products saved a few at a time (the admin) and of imported products are added as
+they are written.
+"""
+import math
+import re
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, FloatField, Q, Value, When
+from django.dispatch import receiver
+
+from .models import Product, SearchTrigram, SearchWord, catalog_changed
+
+WORD_RE = re.compile(r'\w+')
+MIN_WORD_LENGTH = 3
+MAX_WORD_LENGTH = SearchWord._meta.get_field('word').max_length
+# pg_trgm's default similarity threshold
+SIMILARITY_THRESHOLD = 0.3
+MAX_CORRECTIONS = 5
+MAX_TERMS = 5
+# catalog_changed for more products than this (bulk edits) waits for the next rebuild
+SYNC_LIMIT = 200
+
+
+def trigrams(word):
+    """pg_trgm's trigrams: the word padded with two spaces in front and one behind."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def search_words(*texts):
+    return {
+        word for text in texts if text for word in WORD_RE.findall(str(text).casefold())
+        if MIN_WORD_LENGTH <= len(word) <= MAX_WORD_LENGTH and not word.isdigit()
+    }
+
+
+def product_search_words(name, specifications):
+    return search_words(name, *(spec.get('value') for spec in specifications or () if isinstance(spec, dict)))
+
+
+def catalog_words(products):
+    words = set()
+    for name, specifications in products.values_list('name', 'specifications').iterator(chunk_size=5000):
+        words |= product_search_words(name, specifications)
+    return words
+
+
+def add_words(words, chunk_size=2000):
+    """Adds the words not in the vocabulary yet, with their trigrams. Returns how many were added."""
+    words = sorted(words)
+    existing = set()
+    for start in range(0, len(words), chunk_size):
+        existing.update(SearchWord.objects.filter(word__in=words[start:start + chunk_size]).values_list('word', flat=True))
+    new = [word for word in words if word not in existing]
+    if not new:
+        return 0
+
+    quote = connection.ops.quote_name
+    word_table, trigram_table = quote(SearchWord._meta.db_table), quote(SearchTrigram._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Plain executemany'd INSERTs: bulk_create() builds a model instance per row
+        cursor.executemany(
+            f"INSERT INTO {word_table} ({quote('word')}, {quote('trigram_count')}) VALUES (%s, %s)",
+            [(word, len(trigrams(word))) for word in new],
+        )
+        for start in range(0, len(new), chunk_size):
+            ids = SearchWord.objects.filter(word__in=new[start:start + chunk_size]).values_list('word', 'pk')
+            cursor.executemany(
+                f"INSERT INTO {trigram_table} ({quote('trigram')}, {quote('word_id')}) VALUES (%s, %s)",
+                [(trigram, pk) for word, pk in ids for trigram in trigrams(word)],
+            )
+    return len(new)
+
+
+def rebuild_words(chunk_size=2000):
+    """Makes the vocabulary match the catalog. Returns (words added, words removed)."""
+    words = catalog_words(Product.objects.all())
+    stale = [pk for word, pk in SearchWord.objects.values_list('word', 'pk').iterator(chunk_size=5000) if word not in words]
+    for start in range(0, len(stale), chunk_size):
+        with transaction.atomic():
+            SearchTrigram.objects.filter(word__in=stale[start:start + chunk_size]).delete()
+            SearchWord.objects.filter(pk__in=stale[start:start + chunk_size]).delete()
+    return add_words(words, chunk_size), len(stale)
+
+
+def corrections(term):
+    """[(word, similarity)] for the catalog words spelled most like `term`, closest first."""
+    grams = trigrams(term)
+    # similarity = shared / (|term| + |word| - shared) <= shared / |term|, so a word needs at least this many
+    needed = math.ceil(SIMILARITY_THRESHOLD * len(grams))
+    rows = (
+        SearchTrigram.objects.filter(trigram__in=grams).values('word')
+        .annotate(shared=Count('pk')).filter(shared__gte=needed)
+        .values_list('word__word', 'word__trigram_count', 'shared')
+    )
+    scored = [(word, shared / (len(grams) + count - shared)) for word, count, shared in rows]
+    scored = [(word, similarity) for word, similarity in scored if similarity >= SIMILARITY_THRESHOLD]
+    scored.sort(key=lambda row: (-row[1], row[0]))
+    return scored[:MAX_CORRECTIONS]
+
+
+def regex_literal(text):
+    # Backslash before anything but letters and digits is a literal in both Python's and
+    # PostgreSQL's regular expressions
+    return ''.join(char if char.isalnum() else '\\' + char for char in text)
+
+
+def contains(word):
+    # Only inside the specifications' "value" strings: the stored JSON also holds the keys
+    # ("label", "value") and the labels, which would otherwise match every product with specs
+    value = r'"value":\s*"[^"]*' + regex_literal(word)
+    return Q(name__icontains=word) | Q(specifications__iregex=value)
+
+
+def fuzzy_filter(queryset, terms):
+    """
+    (queryset, suggestion): `queryset` narrowed to products matching each of `terms` or a word
+    spelled like it, best matches first (then its own ordering), and the terms as corrected.
+    The queryset is empty when no term has a close word.
+    """
+    conditions, scores, suggestion, corrected = [], [], [], False
+    for term in [term.casefold() for term in terms[:MAX_TERMS]]:
+        alternatives = [(term, 1.0)]
+        found = corrections(term) if len(term) >= MIN_WORD_LENGTH else []
+        # A term that is a catalog word is spelled right; only the others are corrected
+        if found and found[0][0] != term:
+            alternatives += found
+            corrected = True
+        suggestion.append(alternatives[1][0] if len(alternatives) > 1 else term)
+
+        condition = Q()
+        for word, _ in alternatives:
+            condition |= contains(word)
+        conditions.append(condition)
+        scores.append(Case(
+            *[When(contains(word), then=Value(similarity)) for word, similarity in alternatives],
+            default=Value(0.0), output_field=FloatField(),
+        ))
+    if not corrected:
+        return queryset.none(), None
+
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    queryset = queryset.filter(*conditions).annotate(fuzzy_score=sum(scores[1:], scores[0]))
+    return queryset.order_by('-fuzzy_score', *ordering), " ".join(suggestion)
+
+
+@receiver(catalog_changed)
+def add_changed_words(sender, product_ids, **kwargs):
+    if len(product_ids) <= SYNC_LIMIT:
+        add_words(catalog_words(Product.objects.filter(pk__in=product_ids)))
@@ -0,0 +1,294 @@
+"""
+Synthetic catalog data for benchmarks and scale testing (manage.py seed_catalog,
+manage.py benchmark_api).
+
+Everything is generated from a seeded random.Random, so the same arguments
+always produce the same rows. Bulk rows are written with bulk_create, which skips
+Model.save(), so slugs are filled in here.
+"""
+import io
+import random
+from decimal import Decimal
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import (
+    Banner, Category, FAQ, FAQCategory, Product, ProductImage, PromoCode, PromoCodeUsageShard,
+    SizeGuideCategory, Testimonial,
+)
+
+CATEGORY_TREE = {
+    'Anklets': ['Payal', 'Kids Anklets', 'Beaded Anklets'],
+    'Rings': ['Toe Rings', 'Band Rings', 'Adjustable Rings'],
+    'Earrings': ['Jhumkas', 'Studs', 'Hoops'],
+    'Necklaces': ['Chains', 'Pendants', 'Chokers'],
+    'Bracelets': ['Kadas', 'Charm Bracelets'],
+    'Gifts': ['Idols', 'Coins'],
+}
+
+ADJECTIVES = ['Oxidised', 'Classic', 'Floral', 'Antique', 'Minimal', 'Temple', 'Twisted',
+              'Filigree', 'Beaded', 'Ghungroo', 'Peacock', 'Lotus', 'Handcrafted', 'Royal']
+MATERIALS = ['925 Sterling Silver', '92.5 Silver', 'Oxidised Silver', 'Silver with Zircon']
+FINISHES = ['High Polish', 'Matte', 'Oxidised', 'Rhodium Plated']
+STONES = ['None', 'Cubic Zirconia', 'Pearl', 'Kundan', 'Onyx', 'Turquoise']
+CITIES = ['Mumbai', 'Delhi', 'Jaipur', 'Pune', 'Kolkata', 'Chennai', 'Indore', 'Surat']
+FIRST_NAMES = ['Asha', 'Priya', 'Neha', 'Kavya', 'Riya', 'Meera', 'Ananya', 'Pooja', 'Sneha', 'Divya']
+
+SIZE_GUIDES = {
+    'rings': ('Ring Size Chart', ['Indian Size', 'US Size', 'UK Size', 'Diameter (mm)'], [
+        ('6', '3.75', 'H', '14.9'), ('8', '4.5', 'I', '15.3'), ('10', '5.25', 'K', '15.9'),
+        ('12', '6', 'L', '16.5'), ('14', '7', 'N', '17.3'), ('16', '7.75', 'P', '17.9'),
+        ('18', '8.5', 'Q', '18.5'), ('20', '9.25', 'S', '19.1'), ('22', '10', 'T', '19.8'),
+    ]),
+    'bracelets': ('Bracelet Size Chart', ['Size', 'Wrist (cm)', 'Bangle Diameter (mm)'], [
+        ('2.2', '14', '54'), ('2.4', '15', '57'), ('2.6', '16', '60'), ('2.8', '17', '64'),
+    ]),
+    'anklets': ('Anklet Size Chart', ['Size', 'Length (inches)', 'Ankle (cm)'], [
+        ('S', '9', '21'), ('M', '10', '23'), ('L', '11', '25'),
+    ]),
+}
+
+IMAGE_POOL_DIR = 'seed'
+
+# What marks a row as seeded, so delete_seeded() leaves real content alone
+SEEDED_DESCRIPTION = "Synthetic product from seed_catalog."
+SEEDED_TESTIMONIAL = "Beautiful finish and quick delivery. "
+SEEDED_BANNER_SUB_HEADING = "New arrivals"
+SEEDED_PROMO_CODE_RE = r'^SEED(10|[0-9]{6})$'
+SEEDED_FAQ_TOPIC_RE = r'^FAQ Topic [0-9]+$'
+SEEDED_BANNER_HEADING_RE = r'^Banner [0-9]+$'
+
+
+def chunked(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_image_pool(rng, count, size=96):
+    """
+    Writes `count` small distinct WebP files to MEDIA_ROOT/seed/ (once) and returns their names.
+    Seeded rows share this pool instead of writing a file per row.
+    """
+    from PIL import Image, ImageDraw
+
+    names = []
+    for n in range(count):
+        name = f"{IMAGE_POOL_DIR}/pool-{n}.webp"
+        names.append(name)
+        # Draw every image even if it exists, so the rng stream (and the rows) stay deterministic
+        background = tuple(rng.randrange(160, 255) for _ in range(3))
+        accent = tuple(rng.randrange(40, 200) for _ in range(3))
+        inset = rng.randrange(8, size // 3)
+        width = rng.randrange(3, 10)
+        if default_storage.exists(name):
+            continue
+        image = Image.new('RGB', (size, size), background)
+        ImageDraw.Draw(image).ellipse([inset, inset, size - inset, size - inset], outline=accent, width=width)
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', quality=60)
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+    return names
+
+
+def seed_categories(extra=0):
+    """Creates CATEGORY_TREE plus `extra` numbered collections under it; returns the leaf categories."""
+    leaves = []
+    parents = []
+    for parent_name, children in CATEGORY_TREE.items():
+        parent, _ = Category.objects.get_or_create(name=parent_name)
+        parents.append(parent)
+        for child_name in children:
+            leaves.append(Category.objects.get_or_create(name=child_name, defaults={'parent': parent})[0])
+    for n in range(extra):
+        parent = parents[n % len(parents)]
+        leaves.append(Category.objects.get_or_create(
+            name=f"{parent.name} Collection {n}", defaults={'parent': parent}
+        )[0])
+    return leaves
+
+
+def product_rows(count, categories, rng, start=0):
+    """Yields unsaved Product instances with realistic names, prices and specifications."""
+    now = timezone.now()
+    for i in range(start, start + count):
+        category = rng.choice(categories)
+        name = f"{rng.choice(ADJECTIVES)} {category.name.rstrip('s')} {i}"
+        on_sale = rng.random() < 0.1
+        specifications = [
+            {"label": "Material", "value": rng.choice(MATERIALS)},
+            {"label": "Weight", "value": f"{rng.uniform(2, 60):.1f} g"},
+            {"label": "Finish", "value": rng.choice(FINISHES)},
+            {"label": "Purity", "value": "92.5%"},
+        ]
+        stone = rng.choice(STONES)
+        if stone != 'None':
+            specifications.append({"label": "Stone", "value": stone})
+        yield Product(
+            name=name,
+            slug=slugify(name),
+            description=f"{name} in {rng.choice(MATERIALS).lower()}, made by hand in Jaipur. {SEEDED_DESCRIPTION}",
+            price=Decimal(rng.randrange(300, 25000)),
+            discount_percent=rng.choice([0, 0, 0, 5, 10, 15, 20]),
+            category=category,
+            stock=rng.randrange(0, 50),
+            rating=round(rng.uniform(3.5, 5.0), 1),
+            reviews_count=rng.randrange(0, 400),
+            specifications=specifications,
+            is_sale_active=on_sale,
+            sale_label="Flash Sale" if on_sale else None,
+            sale_ends_at=now + timezone.timedelta(days=rng.randrange(1, 10)) if on_sale else None,
+        )
+
+
+def image_rows(products, rng, pool, per_product=(1, 4)):
+    """Yields unsaved ProductImage rows; files come from the shared pool when there is one."""
+    for product in products:
+        for order in range(rng.randint(*per_product)):
+            if pool:
+                name = pool[rng.randrange(len(pool))]
+            else:
+                name = f"products/seed-{product.slug}-{order}.webp"
+            yield ProductImage(product_id=product.pk, image=name, order=order)
+
+
+def seed_products(count, categories, rng, batch_size=2000, images_per_product=(1, 4), pool=None,
+                  start=0, progress=None):
+    """
+    Inserts products and their images one batch at a time, each batch in its own transaction.
+    bulk_create sets primary keys on SQLite and PostgreSQL, so images are linked without re-reading.
+    """
+    created = 0
+    for batch in chunked(product_rows(count, categories, rng, start=start), batch_size):
+        with transaction.atomic():
+            Product.objects.bulk_create(batch, batch_size=batch_size)
+            ProductImage.objects.bulk_create(
+                list(image_rows(batch, rng, pool, images_per_product)), batch_size=batch_size
+            )
+        created += len(batch)
+        if progress:
+            progress(created)
+    return created
+
+
+def seed_faqs(rng, categories=6, per_category=10):
+    start = FAQCategory.objects.count()
+    for c in range(start, start + categories):
+        category = FAQCategory.objects.create(name=f"FAQ Topic {c}", order=c)
+        FAQ.objects.bulk_create([
+            FAQ(category=category, question=f"Question {c}.{q}?", answer="Answer " * rng.randrange(5, 60),
+                order=q, is_active=rng.random() < 0.9)
+            for q in range(per_category)
+        ])
+
+
+def seed_testimonials(rng, count, pool=None, batch_size=2000):
+    rows = (
+        Testimonial(name=rng.choice(FIRST_NAMES), location=rng.choice(CITIES),
+                    text=SEEDED_TESTIMONIAL * rng.randrange(1, 5),
+                    rating=rng.randint(3, 5), product_name=f"{rng.choice(ADJECTIVES)} Payal",
+                    image=rng.choice(pool) if pool and rng.random() < 0.3 else None,
+                    is_active=rng.random() < 0.9)
+        for _ in range(count)
+    )
+    for batch in chunked(rows, batch_size):
+        Testimonial.objects.bulk_create(batch)
+
+
+def seed_banners(count, pool=None):
+    Banner.objects.bulk_create([
+        Banner(heading=f"Banner {b}", sub_heading=SEEDED_BANNER_SUB_HEADING,
+               image=pool[b % len(pool)] if pool else f"banners/seed-{b}.webp", order=b)
+        for b in range(count)
+    ])
+
+
+def seed_size_guides():
+    for order, (slug, (name, columns, rows)) in enumerate(SIZE_GUIDES.items()):
+        SizeGuideCategory.objects.update_or_create(slug=slug, defaults={
+            'name': name, 'order': order, 'columns': columns,
+            'data': [dict(zip(columns, row)) for row in rows],
+        })
+
+
+def seed_promo_codes(rng, count):
+    """SEED10 plus `count` random codes. Usage shards are bulk-created, as PromoCode.save() would."""
+    PromoCode.objects.get_or_create(code='SEED10', defaults={'discount_value': 10, 'max_discount_amount': 500})
+    start = PromoCode.objects.count()
+    promos = PromoCode.objects.bulk_create([
+        PromoCode(
+            code=f"SEED{start + n:06d}",
+            discount_type=rng.choice(['percent', 'fixed']),
+            discount_value=Decimal(rng.choice([5, 10, 15, 20, 250, 500])),
+            min_order_amount=Decimal(rng.choice([0, 999, 1999])),
+            max_uses=rng.choice([None, 100, 1000]),
+            max_uses_per_customer=rng.choice([None, 1, 2]),
+        )
+        for n in range(count)
+    ])
+    PromoCodeUsageShard.objects.bulk_create([
+        PromoCodeUsageShard(promo=promo, shard=shard)
+        for promo in promos for shard in range(PromoCode.USAGE_SHARDS)
+    ], batch_size=5000)
+
+
+def seed_catalog(products, seed=0, testimonials=None, faq_categories=6, faqs_per_category=10,
+                 promo_codes=5, banners=4, extra_categories=0, images_per_product=(1, 4),
+                 image_files=0, batch_size=2000, progress=None):
+    """
+    Seeds a full synthetic catalog with `products` products. Product names (and so slugs)
+    are numbered from the highest existing id, so seeding twice adds rather than collides.
+    `image_files` > 0 writes that many real WebP files and points every image row at them.
+    """
+    rng = random.Random(seed)
+    pool = generate_image_pool(rng, image_files) if image_files else None
+    categories = seed_categories(extra_categories)
+    seed_products(products, categories, rng, batch_size=batch_size, images_per_product=images_per_product,
+                  pool=pool, start=(Product.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1, progress=progress)
+    if testimonials is None:
+        testimonials = max(20, min(products // 10, 5000))
+    seed_faqs(rng, faq_categories, faqs_per_category)
+    seed_testimonials(rng, testimonials, pool=pool, batch_size=batch_size)
+    seed_banners(banners, pool=pool)
+    seed_size_guides()
+    seed_promo_codes(rng, promo_codes)
+
+
+def seeded_category_names():
+    """Every category seed_categories() may have created, children before their parents."""
+    names = [child for children in CATEGORY_TREE.values() for child in children]
+    pattern = f"^({'|'.join(CATEGORY_TREE)}) Collection [0-9]+$"
+    collections = Category.objects.filter(name__regex=pattern).values_list('name', flat=True)
+    return names + sorted(collections) + list(CATEGORY_TREE)
+
+
+def delete_seeded():
+    """
+    Deletes what seed_catalog() created and nothing else: products, testimonials, banners, FAQ
+    topics and promo codes are recognised by the text seeding gives them. Seeded categories go
+    only once no product or sub-category is left in them. Size guides are kept; seeding
+    overwrites them in place.
+    """
+    with transaction.atomic():
+        products = Product.objects.filter(description__endswith=SEEDED_DESCRIPTION)
+        # Images first, so the products' delete has less to collect. That one tombstones every
+        # product in one INSERT and sends a single catalog_changed (ProductQuerySet.delete())
+        ProductImage.objects.filter(product__in=products).delete()
+        products.delete()
+        FAQ.objects.filter(category__name__regex=SEEDED_FAQ_TOPIC_RE).delete()
+        FAQCategory.objects.filter(name__regex=SEEDED_FAQ_TOPIC_RE).delete()
+        Testimonial.objects.filter(text__startswith=SEEDED_TESTIMONIAL).delete()
+        Banner.objects.filter(heading__regex=SEEDED_BANNER_HEADING_RE, sub_heading=SEEDED_BANNER_SUB_HEADING).delete()
+        PromoCode.objects.filter(code__regex=SEEDED_PROMO_CODE_RE).delete()
+        for name in seeded_category_names():
+            Category.objects.filter(name=name, products__isnull=True, children__isnull=True).delete()
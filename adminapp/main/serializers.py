@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Announcement, Banner, SaleBanner, Testimonial, SocialLink, Product, Category, ProductImage, FAQ, FAQCategory, SizeGuideCategory
+from .models import StockReservation, StockReservationItem
 
 class AnnouncementSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,7 +12,8 @@ class BannerSerializer(serializers.ModelSerializer):
 #comment
     class Meta:
         model = Banner
-        fields = ['id', 'heading', 'sub_heading', 'image_url', 'order']
+        # Size and placeholder let the carousel reserve space and show a preview while the image loads
+        fields = ['id', 'heading', 'sub_heading', 'image_url', 'image_width', 'image_height', 'image_placeholder', 'order']
 
     def get_image_url(self, obj):
         request = self.context.get('request')
@@ -43,6 +45,7 @@ class ProductImageSerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     # Flatten images to a list of URLs
     images = serializers.SerializerMethodField()
+    image_details = serializers.SerializerMethodField()
     category = serializers.CharField(source='category.name')
     sale = serializers.SerializerMethodField()
     reviews = serializers.IntegerField(source='reviews_count')
@@ -51,22 +54,27 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = [
             'id', 'slug', 'name', 'description', 'price', 
-            'discount_percent', 'images', 'category', 
+            'discount_percent', 'images', 'image_details', 'category', 
             'rating', 'reviews', 'stock', 'sale', 'specifications'
         ]
 
+    def image_url(self, img):
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(img.image.url)
+        return img.image.url
+
     def get_images(self, obj):
         # Return a list of absolute URLs
-        request = self.context.get('request')
-        images = obj.images.all()
-        urls = []
-        for img in images:
-            if img.image:
-                if request:
-                    urls.append(request.build_absolute_uri(img.image.url))
-                else:
-                    urls.append(img.image.url)
-        return urls
+        return [self.image_url(img) for img in obj.images.all() if img.image]
+
+    def get_image_details(self, obj):
+        # The same images with their size and inline placeholder, for layout before they load
+        return [
+            {'url': self.image_url(img), 'width': img.image_width, 'height': img.image_height,
+             'placeholder': img.image_placeholder}
+            for img in obj.images.all() if img.image
+        ]
     
     def get_sale(self, obj):
         if obj.is_sale_active:
@@ -78,9 +86,11 @@ class ProductSerializer(serializers.ModelSerializer):
         return None
 
 class CategorySerializer(serializers.ModelSerializer):
+    parent = serializers.CharField(source='parent.slug', allow_null=True, read_only=True)
+
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug']
+        fields = ['id', 'name', 'slug', 'parent', 'path', 'depth']
 
 class FAQQuestionSerializer(serializers.ModelSerializer):
     # Rename fields to match your frontend expectations (q, a)
@@ -100,11 +110,50 @@ class FAQCategorySerializer(serializers.ModelSerializer):
         fields = ['category', 'questions']
 
     def get_questions(self, obj):
-        # Only return active questions
-        questions = obj.questions.filter(is_active=True).order_by('order')
+        # Only return active questions. FAQListView prefetches them into `active_questions`;
+        # filtering obj.questions here would bypass the prefetch and query once per category.
+        questions = getattr(obj, 'active_questions', None)
+        if questions is None:
+            questions = obj.questions.filter(is_active=True).order_by('order')
         return FAQQuestionSerializer(questions, many=True).data
     
 class SizeGuideCategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = SizeGuideCategory
-        fields = ['slug', 'name', 'columns', 'data', 'instruction_title', 'instruction_text']
\ No newline at end of file
+        fields = ['slug', 'name', 'columns', 'data', 'instruction_title', 'instruction_text']
+
+class ReservationLineSerializer(serializers.Serializer):
+    slug = serializers.SlugField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class ReservationRequestSerializer(serializers.Serializer):
+    """
+    POST Payload: { "items": [{ "slug": "silver-anklet", "quantity": 2 }, ...] }
+    """
+    items = ReservationLineSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        # Merge repeated slugs and resolve them to product ids in one query
+        quantities = {}
+        for line in items:
+            quantities[line['slug']] = quantities.get(line['slug'], 0) + line['quantity']
+
+        ids = dict(Product.objects.filter(slug__in=quantities).values_list('slug', 'id'))
+        missing = sorted(set(quantities) - set(ids))
+        if missing:
+            raise serializers.ValidationError(f"Unknown products: {', '.join(missing)}")
+        return {ids[slug]: quantity for slug, quantity in quantities.items()}
+
+class StockReservationItemSerializer(serializers.ModelSerializer):
+    slug = serializers.CharField(source='product.slug')
+
+    class Meta:
+        model = StockReservationItem
+        fields = ['slug', 'quantity']
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    items = StockReservationItemSerializer(many=True)
+
+    class Meta:
+        model = StockReservation
+        fields = ['token', 'status', 'expires_at', 'items']
@@ -0,0 +1,145 @@
+"""
+Sitemaps for the storefront: an index plus shard files, served from SITEMAP_DIR.
+
+Products are sharded by id range (SITEMAP_SHARD_SIZE per shard), so a product stays in the
+same shard for life and new products only touch the last one. One GROUP BY query gives each
+shard's newest `updated_at` and row count; a shard is rewritten only when either differs from
+what was recorded in the manifest the last time it was built (an edit changes the first, a
+delete the second). Categories are a single small shard.
+"""
+import json
+import os
+import tempfile
+import zlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.urls import reverse
+
+from .merchant_feed import absolute
+from .models import Category, PATH_MAX_CHAR, Product
+
+INDEX_NAME = 'sitemap.xml'
+MANIFEST_NAME = 'manifest.json'
+CATEGORY_SHARD = 'categories'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def sitemap_path(name):
+    return os.path.join(settings.SITEMAP_DIR, name)
+
+
+def shard_filename(shard):
+    return f"sitemap-{shard}.xml"
+
+
+def write_atomic(name, chunks):
+    fd, tmp = tempfile.mkstemp(dir=settings.SITEMAP_DIR, prefix=f".{name}.")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.writelines(chunks)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, sitemap_path(name))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def url_entry(loc, lastmod):
+    lastmod = f"<lastmod>{lastmod.date().isoformat()}</lastmod>" if lastmod else ""
+    return f"<url><loc>{escape(loc)}</loc>{lastmod}</url>\n"
+
+
+def urlset(entries):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n'
+    yield from entries
+    yield "</urlset>\n"
+
+
+def product_shard_entries(number):
+    size = settings.SITEMAP_SHARD_SIZE
+    rows = Product.objects.filter(pk__gte=number * size, pk__lt=(number + 1) * size).order_by('pk')
+    for slug, updated_at in rows.values_list('slug', 'updated_at').iterator(chunk_size=2000):
+        path = settings.STOREFRONT_PRODUCT_PATH.format(slug=slug)
+        yield url_entry(absolute(settings.STOREFRONT_URL, path), updated_at)
+
+
+def category_entries():
+    # A category changes when its products do; one grouped query covers every category
+    lastmods = dict(
+        Product.objects.order_by().values('category_id').annotate(lastmod=Max('updated_at'))
+        .values_list('category_id', 'lastmod')
+    )
+    categories = list(Category.objects.only('pk', 'slug', 'path'))
+    for category in categories:
+        # Listing pages include sub-categories, so take the newest change in the subtree
+        subtree = [c.pk for c in categories if category.path <= c.path < category.path + PATH_MAX_CHAR]
+        dates = [lastmods[pk] for pk in subtree if pk in lastmods]
+        path = settings.STOREFRONT_CATEGORY_PATH.format(slug=category.slug)
+        yield url_entry(absolute(settings.STOREFRONT_URL, path), max(dates) if dates else None)
+
+
+def shard_states():
+    """
+    {shard name: [newest updated_at as an ISO string, row count]} for every product shard with rows,
+    plus the category shard. Stored in the manifest and compared on the next build.
+    """
+    size = settings.SITEMAP_SHARD_SIZE
+    rows = (
+        Product.objects.order_by().annotate(shard=F('pk') / size).values('shard')
+        .annotate(lastmod=Max('updated_at'), count=Count('pk')).values_list('shard', 'lastmod', 'count')
+    )
+    states = {f"products-{shard}": [lastmod.isoformat(), count] for shard, lastmod, count in rows}
+    category_lastmod = Product.objects.aggregate(lastmod=Max('updated_at'))['lastmod']
+    # Categories have no timestamp of their own; a checksum of their paths catches renames and moves
+    paths = "\n".join(Category.objects.order_by('pk').values_list('path', flat=True))
+    states[CATEGORY_SHARD] = [category_lastmod.isoformat() if category_lastmod else '', zlib.crc32(paths.encode())]
+    return states
+
+
+def read_manifest():
+    try:
+        with open(sitemap_path(MANIFEST_NAME)) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build_sitemaps(force=False):
+    """Rewrites the shards whose products changed (all of them with `force`) and the index. Returns their names."""
+    os.makedirs(settings.SITEMAP_DIR, exist_ok=True)
+    previous = {} if force else read_manifest()
+    states = shard_states()
+
+    rebuilt = []
+    for shard, state in states.items():
+        if previous.get(shard) == state and os.path.exists(sitemap_path(shard_filename(shard))):
+            continue
+        if shard == CATEGORY_SHARD:
+            entries = category_entries()
+        else:
+            entries = product_shard_entries(int(shard.split('-')[1]))
+        write_atomic(shard_filename(shard), urlset(entries))
+        rebuilt.append(shard)
+
+    for shard in set(previous) - set(states):
+        # Every product in the shard was deleted
+        try:
+            os.unlink(sitemap_path(shard_filename(shard)))
+        except FileNotFoundError:
+            pass
+
+    if rebuilt or set(previous) != set(states) or not os.path.exists(sitemap_path(INDEX_NAME)):
+        write_atomic(INDEX_NAME, sitemap_index(states))
+    write_atomic(MANIFEST_NAME, [json.dumps(states, sort_keys=True)])
+    return rebuilt
+
+
+def sitemap_index(states):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n'
+    for shard, (lastmod, _) in sorted(states.items()):
+        loc = absolute(settings.SITE_URL, reverse('sitemap-file', args=[shard_filename(shard)]))
+        lastmod = f"<lastmod>{lastmod}</lastmod>" if lastmod else ""
+        yield f"<sitemap><loc>{escape(loc)}</loc>{lastmod}</sitemap>\n"
+    yield "</sitemapindex>\n"
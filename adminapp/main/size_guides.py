@@ -0,0 +1,111 @@
+"""
+Size conversion (/api/size-guide/convert/) answered from an in-memory index of the size charts,
+so the storefront can convert one size without downloading every chart from /api/size-guide/.
+
+Each chart's columns are its size systems. A system can be named by its column ("US Size") or
+more loosely ("us", "diameter"). A value is looked up exactly in its column; if the column is
+numeric (diameters, lengths, numbered sizes) and nothing matches, the nearest row is used, so a
+measured 16.2 mm ring diameter still gives a size.
+
+Charts are loaded in one query on first use, reloaded as soon as one is saved or deleted in this
+process, and otherwise at most SIZE_GUIDE_REFRESH_SECONDS late for changes made by other workers.
+"""
+import re
+import threading
+from bisect import bisect_left
+from time import monotonic
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import SizeGuideCategory
+
+UNIT_RE = re.compile(r'\(.*?\)')
+WORD_RE = re.compile(r'\w+')
+NUMBER_RE = re.compile(r'^-?\d+(?:\.\d+)?$')
+
+
+def system_key(name):
+    """'Indian Size' -> 'indian', 'Diameter (mm)' -> 'diameter', 'Size' -> 'size'."""
+    words = WORD_RE.findall(UNIT_RE.sub('', str(name)).casefold())
+    if len(words) > 1 and words[-1] == 'size':
+        words = words[:-1]
+    return ' '.join(words)
+
+
+def number(value):
+    value = str(value).strip()
+    return float(value) if NUMBER_RE.match(value) else None
+
+
+def value_key(value):
+    # "6" and "6.0" are the same size
+    parsed = number(value)
+    return parsed if parsed is not None else str(value).strip().casefold()
+
+
+class SizeChart:
+    def __init__(self, slug, name, columns, rows):
+        self.slug, self.name = slug, name
+        self.rows = [row for row in rows if isinstance(row, dict)]
+        self.columns = list(columns) or list(dict.fromkeys(key for row in self.rows for key in row))
+        self.systems = {}
+        for column in self.columns:
+            for key in (column.casefold(), system_key(column)):
+                self.systems.setdefault(key, column)
+        self.exact = {column: {} for column in self.columns}
+        self.numeric = {}
+        for column in self.columns:
+            values = [(index, row.get(column)) for index, row in enumerate(self.rows) if row.get(column) not in (None, '')]
+            for index, value in values:
+                self.exact[column].setdefault(value_key(value), index)
+            numbers = [(number(value), index) for index, value in values]
+            if numbers and all(parsed is not None for parsed, _ in numbers):
+                self.numeric[column] = sorted(numbers)
+
+    def system(self, name):
+        return self.systems.get(str(name).casefold()) or self.systems.get(system_key(name))
+
+    def find(self, column, value):
+        """(row, exact) for `value` in `column`: its row, or the nearest one in a numeric column. None if neither."""
+        index = self.exact[column].get(value_key(value))
+        if index is not None:
+            return self.rows[index], True
+        parsed, numbers = number(value), self.numeric.get(column)
+        if parsed is None or not numbers:
+            return None
+        position = bisect_left(numbers, (parsed, -1))
+        below, above = numbers[max(position - 1, 0)], numbers[min(position, len(numbers) - 1)]
+        # Halfway between two sizes, take the larger: a loose ring still fits, a tight one doesn't
+        nearest = below if round(parsed - below[0], 6) < round(above[0] - parsed, 6) else above
+        return self.rows[nearest[1]], False
+
+
+class SizeGuideIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.charts = None
+        self.loaded_at = None
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def chart(self, slug):
+        with self._lock:
+            if self.loaded_at is None or monotonic() - self.loaded_at >= settings.SIZE_GUIDE_REFRESH_SECONDS:
+                self.charts = {
+                    slug: SizeChart(slug, name, columns or [], data or [])
+                    for slug, name, columns, data in SizeGuideCategory.objects.values_list('slug', 'name', 'columns', 'data')
+                }
+                self.loaded_at = monotonic()
+            return self.charts.get(slug)
+
+
+size_guides = SizeGuideIndex()
+
+
+@receiver(post_save, sender=SizeGuideCategory)
+@receiver(post_delete, sender=SizeGuideCategory)
+def size_guide_changed(sender, **kwargs):
+    size_guides.invalidate()
@@ -0,0 +1,82 @@
+"""
+Slow-query log. RequestTimingMiddleware collects statements slower than
+SLOW_QUERY_THRESHOLD_MS while the request runs, then hands them to
+record_slow_queries() once the response is ready. SQL issued here is not
+counted against the request.
+"""
+import hashlib
+import logging
+import re
+
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+
+logger = logging.getLogger('main.performance')
+
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bin\s*\((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    """Collapses literals, placeholders and IN-lists so repeats of one query share a fingerprint."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.lower().encode()).hexdigest()
+
+
+def explain(sql, params):
+    if not sql.lstrip().lower().startswith(EXPLAINABLE):
+        return ''
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        # Savepoint, so a failed EXPLAIN can't poison an enclosing transaction
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return "\n".join(" | ".join(str(col) for col in row) for row in cursor.fetchall())
+    except DatabaseError as exc:
+        return f"EXPLAIN failed: {exc}"
+
+
+def record_slow_queries(view_name, slow_queries):
+    """Upserts (sql, params, seconds) tuples into SlowQuery, one row per fingerprint."""
+    for sql, params, duration in slow_queries:
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        ms = duration * 1000
+        logger.warning('slow query %.1fms in %s: %s', ms, view_name, normalized)
+
+        updated = SlowQuery.objects.filter(fingerprint=key).update(
+            count=F('count') + 1,
+            total_ms=F('total_ms') + ms,
+            max_ms=Greatest('max_ms', ms),
+            view_name=view_name,
+            last_seen=timezone.now(),
+        )
+        if updated:
+            continue
+
+        # First sighting: capture the plan once, not on every repeat
+        try:
+            with transaction.atomic():
+                SlowQuery.objects.create(
+                    fingerprint=key, sql=normalized, explain=explain(sql, params),
+                    view_name=view_name, count=1, total_ms=ms, max_ms=ms,
+                )
+        except IntegrityError:
+            SlowQuery.objects.filter(fingerprint=key).update(
+                count=F('count') + 1, total_ms=F('total_ms') + ms, max_ms=Greatest('max_ms', ms),
+            )
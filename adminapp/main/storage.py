@@ -0,0 +1,157 @@
+"""
+Content-addressed storage for uploaded images (Banner, Testimonial and ProductImage).
+
+A file is named after the SHA-256 of its bytes, under its field's upload_to directory:
+`banners/3f/3fa94c0d9b1e2a7c5d8e6f4a2b0c9d1e.webp`. Uploading the same image again returns the
+existing name instead of writing `burger_UG8Pmhy.webp`, and since a name only ever holds one
+content, its URL can be cached forever (MEDIA_CACHE_CONTROL).
+
+Files are never deleted when a row stops pointing at them, because another row may share them.
+manage.py prune_media counts the references to every stored file and deletes the unreferenced
+ones once they are older than a grace period.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Count
+from django.utils.crypto import get_random_string
+from django.utils.deconstruct import deconstructible
+
+# 128 bits of the digest, fanned out over 256 directories by its first byte
+HASH_LENGTH = 32
+HASHED_NAME_RE = re.compile(r'(?:^|/)([0-9a-f]{2})/\1[0-9a-f]{%d}\.[A-Za-z0-9]+$' % (HASH_LENGTH - 2))
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk.encode() if isinstance(chunk, str) else chunk)
+    content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def is_hashed_name(name):
+    return bool(name and HASHED_NAME_RE.search(name))
+
+
+@deconstructible(path='main.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = content_hash(content)
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Same bytes already stored. Touch it so prune_media's grace period starts over
+            # for a file that may have been unreferenced until this upload is committed.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # The name is the content: if it is taken, it already holds these bytes
+        if max_length and len(name) > max_length:
+            raise SuspiciousFileOperation(f"Storage can not find an available filename for \"{name}\".")
+        return name
+
+    def _save(self, name, content):
+        # Written under a temporary name and renamed into place, so a concurrent upload of the
+        # same image (or a request for it) never sees a partial file
+        directory, filename = posixpath.split(name)
+        temporary = super()._save(posixpath.join(directory, f".{get_random_string(8)}.{filename}"), content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+media_storage = ContentAddressedStorage()
+
+
+def media_fields():
+    """(model, field name) for every image field stored in media_storage."""
+    from .models import Banner, ProductImage, Testimonial
+    return [(Banner, 'image'), (Testimonial, 'image'), (ProductImage, 'image')]
+
+
+def reference_counts():
+    """Counter of stored name -> rows pointing at it, one GROUP BY per image field."""
+    counts = Counter()
+    for model, field in media_fields():
+        rows = (
+            model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .order_by().values(field).annotate(rows=Count('pk')).values_list(field, 'rows')
+        )
+        for name, rows in rows.iterator(chunk_size=5000):
+            counts[name] += rows
+    return counts
+
+
+def stored_files():
+    """Yields (name, modified time) for every content-addressed file under the image fields' directories."""
+    roots = {field.upload_to.strip('/') for field in (model._meta.get_field(name) for model, name in media_fields())}
+    for root in sorted(roots):
+        for directory, _, filenames in os.walk(media_storage.path(root)):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, media_storage.location).replace(os.sep, '/')
+                if is_hashed_name(name):
+                    yield name, os.stat(path).st_mtime
+
+
+def prune_media(grace_seconds, dry_run=False):
+    """Deletes content-addressed files no row points at, last written over `grace_seconds` ago. Returns their names."""
+    referenced = reference_counts()
+    cutoff = time.time() - grace_seconds
+    orphans = [name for name, modified in stored_files() if name not in referenced and modified < cutoff]
+    if not dry_run:
+        for name in orphans:
+            media_storage.delete(name)
+    return orphans
+
+
+def rehash_media():
+    """
+    Moves rows still pointing at files saved before content addressing (`burger_UG8Pmhy.webp`)
+    onto hashed names, one UPDATE per distinct name, and deletes the old files. Duplicates
+    collapse into one file. Returns (names rehashed, names whose file is missing).
+    """
+    rehashed, missing = [], []
+    for model, field in media_fields():
+        names = (
+            model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .order_by().values_list(field, flat=True).distinct()
+        )
+        upload_to = model._meta.get_field(field).upload_to
+        for name in [name for name in names if not is_hashed_name(name)]:
+            if not media_storage.exists(name):
+                missing.append(name)
+                continue
+            with media_storage.open(name) as fh:
+                new_name = media_storage.save(posixpath.join(upload_to, posixpath.basename(name)), fh)
+            model.objects.filter(**{field: name}).update(**{field: new_name})
+            rehashed.append(name)
+
+    still_used = reference_counts()
+    for name in rehashed:
+        if name not in still_used:
+            media_storage.delete(name)
+    return rehashed, missing
+
+
+def cache_control(name):
+    """Cache-Control for a media file: immutable for content-addressed names, none otherwise."""
+    return settings.MEDIA_CACHE_CONTROL if is_hashed_name(name) else None
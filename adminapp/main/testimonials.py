@@ -0,0 +1,65 @@
+"""
+Featured testimonials for the homepage (/api/testimonials/featured/): a different handful on
+each request, without ORDER BY RANDOM(), which sorts the whole table every time.
+
+Each worker serializes the active testimonials once and shuffles them into a ring. A request
+takes the next `count` items from the ring and moves the cursor past them, so consecutive
+requests show different testimonials and everything comes round before anything repeats.
+Asking for a minimum rating uses a ring of just those, in the same shuffled order.
+
+The ring is rebuilt (and reshuffled) as soon as a testimonial is saved or deleted in this
+process, and otherwise every TESTIMONIAL_REFRESH_SECONDS.
+"""
+import random
+import threading
+from time import monotonic
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Testimonial
+from .serializers import TestimonialSerializer
+
+
+class TestimonialRing:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = None
+        # min rating -> [the ring of items rated at least that, cursor]
+        self.rings = {}
+        self.loaded_at = None
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def load(self):
+        items = TestimonialSerializer(Testimonial.objects.filter(is_active=True), many=True).data
+        self.items = [dict(item) for item in items]
+        random.shuffle(self.items)
+        self.rings = {}
+        self.loaded_at = monotonic()
+
+    def take(self, count, min_rating=0):
+        """The next `count` testimonials rated at least `min_rating` (fewer if there aren't that many)."""
+        with self._lock:
+            if self.loaded_at is None or monotonic() - self.loaded_at >= settings.TESTIMONIAL_REFRESH_SECONDS:
+                self.load()
+            if min_rating not in self.rings:
+                self.rings[min_rating] = [[item for item in self.items if item['rating'] >= min_rating], 0]
+            ring, cursor = self.rings[min_rating]
+            if count >= len(ring):
+                return list(ring)
+            taken = ring[cursor:cursor + count]
+            taken += ring[:count - len(taken)]
+            self.rings[min_rating][1] = (cursor + count) % len(ring)
+            return taken
+
+
+testimonials = TestimonialRing()
+
+
+@receiver(post_save, sender=Testimonial)
+@receiver(post_delete, sender=Testimonial)
+def testimonial_changed(sender, **kwargs):
+    testimonials.invalidate()
@@ -1,3 +1,1617 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import merchant_feed, placeholders, popularity, sitemaps, storage
+from .autocomplete import autocomplete
+from .catalog_io import export_rows, import_file, stream_csv, stream_jsonl
+from .image_archive import upload_archive
+from .metrics import registry
+from .middleware import ProfilerMiddleware
+from .pagination import EstimatedCountPaginator
+from .placeholders import backfill_in_background
+from .recommendations import build_related, changed_products
+from .search import corrections, rebuild_words
+from .seeding import delete_seeded
+from .size_guides import size_guides
+from .testimonials import testimonials
+from .models import (
+    Announcement, Banner, Category, FAQ, FAQCategory, PopularityEpoch, Product, ProductImage, ProductTombstone,
+    PromoCode, PromoCodeExhausted, RelatedProduct, RequestProfile, SizeGuideCategory, SlowQuery, SocialLink,
+    StockReservation, Testimonial,
+    catalog_changed, unique_product_slugs,
+)
+from .slowlog import normalize
+from .urls import urlpatterns
+
+
+def make_product(name, stock, category=None, **kwargs):
+    if category is None:
+        category, _ = Category.objects.get_or_create(name='Anklets')
+    return Product.objects.create(
+        name=name, description=name, price=1000, category=category, stock=stock, **kwargs
+    )
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.anklet = make_product('Silver Anklet', stock=5)
+        self.ring = make_product('Toe Ring', stock=1)
+
+    def reserve(self, *lines):
+        return self.client.post(reverse('reservation-create'), {
+            'items': [{'slug': slug, 'quantity': quantity} for slug, quantity in lines]
+        }, format='json')
+
+    def test_reserve_decrements_stock(self):
+        response = self.reserve(('silver-anklet', 2), ('toe-ring', 1))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'held')
+        self.anklet.refresh_from_db()
+        self.ring.refresh_from_db()
+        self.assertEqual((self.anklet.stock, self.ring.stock), (3, 0))
+
+    def test_cart_is_all_or_nothing(self):
+        response = self.reserve(('silver-anklet', 2), ('toe-ring', 2))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['slug'], 'toe-ring')
+        self.anklet.refresh_from_db()
+        self.assertEqual(self.anklet.stock, 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_unknown_slug_is_rejected(self):
+        response = self.reserve(('no-such-thing', 1))
+        self.assertEqual(response.status_code, 400)
+
+    def test_checkout_and_release(self):
+        token = self.reserve(('silver-anklet', 2)).data['token']
+        checkout = self.client.post(reverse('reservation-checkout', args=[token]))
+        self.assertEqual(checkout.status_code, 200)
+        self.assertEqual(checkout.data['status'], 'confirmed')
+
+        # A confirmed reservation can't be released back into stock
+        release = self.client.delete(reverse('reservation-detail', args=[token]))
+        self.assertEqual(release.status_code, 409)
+        self.anklet.refresh_from_db()
+        self.assertEqual(self.anklet.stock, 3)
+
+    def test_sweeper_releases_expired(self):
+        token = self.reserve(('silver-anklet', 4)).data['token']
+        StockReservation.objects.filter(token=token).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(StockReservation.objects.release_expired(), 1)
+        self.anklet.refresh_from_db()
+        self.assertEqual(self.anklet.stock, 5)
+
+        checkout = self.client.post(reverse('reservation-checkout', args=[token]))
+        self.assertEqual(checkout.status_code, 410)
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    BUYERS = 40
+    STOCK = 15
+
+    def test_concurrent_buyers_never_oversell(self):
+        product = make_product('Flash Sale Payal', stock=self.STOCK, is_sale_active=True)
+        results = []
+        start = threading.Barrier(self.BUYERS)
+
+        def buy():
+            try:
+                start.wait()
+                client = APIClient()
+                response = client.post(reverse('reservation-create'), {
+                    'items': [{'slug': product.slug, 'quantity': 1}]
+                }, format='json')
+                results.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(self.BUYERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count(201), self.STOCK)
+        self.assertEqual(results.count(409), self.BUYERS - self.STOCK)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(StockReservation.objects.count(), self.STOCK)
+
+
+class PromoCodeLimitTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.promo = PromoCode.objects.create(
+            code='PAYAL10', discount_value=10, max_uses=3, max_uses_per_customer=2
+        )
+
+    def redeem(self, customer):
+        return self.client.post(reverse('redeem-promo'), {
+            'code': 'payal10', 'total_amount': 2000, 'customer': customer
+        }, format='json')
+
+    def test_per_customer_limit(self):
+        self.assertEqual(self.redeem('asha@example.com').status_code, 200)
+        self.assertEqual(self.redeem('ASHA@example.com ').status_code, 200)
+        self.assertEqual(self.redeem('asha@example.com').status_code, 400)
+        self.assertEqual(self.promo.customer_uses('asha@example.com'), 2)
+
+    def test_customer_must_be_a_string(self):
+        for customer in (123, ['x'], {'email': 'a@x.com'}):
+            with self.subTest(customer=customer):
+                self.assertEqual(self.redeem(customer).status_code, 400)
+                response = self.client.post(reverse('validate-promo'), {
+                    'code': 'PAYAL10', 'total_amount': 2000, 'customer': customer,
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.promo.times_used, 0)
+
+    def test_global_limit(self):
+        for customer in ('a@x.com', 'b@x.com', 'c@x.com'):
+            self.assertEqual(self.redeem(customer).status_code, 200)
+        self.assertEqual(self.redeem('d@x.com').status_code, 400)
+        self.assertEqual(self.promo.times_used, 3)
+
+        # Validation reports the exhausted code without consuming anything
+        response = self.client.post(reverse('validate-promo'), {'code': 'PAYAL10', 'total_amount': 2000}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_global_slot_rolls_back_customer_count(self):
+        self.promo.max_uses = 0
+        self.promo.save()
+        with self.assertRaises(PromoCodeExhausted):
+            self.promo.redeem('asha@example.com')
+        self.assertEqual(self.promo.customer_uses('asha@example.com'), 0)
+
+    def test_shard_capacities_add_up_to_max_uses(self):
+        for max_uses in (0, 5, 16, 1000, 1001):
+            self.promo.max_uses = max_uses
+            total = sum(self.promo.shard_capacity(shard) for shard in range(PromoCode.USAGE_SHARDS))
+            self.assertEqual(total, max_uses)
+
+
+class PromoCodeConcurrencyTests(TransactionTestCase):
+    def run_concurrently(self, promo, customers):
+        results = []
+        start = threading.Barrier(len(customers))
+
+        def redeem(customer):
+            try:
+                start.wait()
+                promo_copy = PromoCode.objects.get(pk=promo.pk)
+                promo_copy.redeem(customer)
+                results.append(True)
+            except PromoCodeExhausted:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=redeem, args=(customer,)) for customer in customers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_global_cap_holds_under_contention(self):
+        promo = PromoCode.objects.create(code='FLASH', discount_value=20, max_uses=25)
+        results = self.run_concurrently(promo, [f'buyer{i}@example.com' for i in range(60)])
+        self.assertEqual(results.count(True), 25)
+        self.assertEqual(promo.times_used, 25)
+
+    def test_per_customer_cap_holds_under_contention(self):
+        promo = PromoCode.objects.create(code='ONCE', discount_value=20, max_uses_per_customer=2)
+        results = self.run_concurrently(promo, ['same@example.com'] * 20)
+        self.assertEqual(results.count(True), 2)
+        self.assertEqual(promo.customer_uses('same@example.com'), 2)
+        self.assertEqual(promo.times_used, 2)
+
+
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        make_product('Oxidised Jhumka', stock=3)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('product-list'))
+        timing = response['Server-Timing']
+        for phase in ('db;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.get(reverse('product-list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        staff = User.objects.create_user('ops', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds{endpoint="product-list",quantile="0.99"}', body)
+        self.assertIn('http_request_db_queries_count{endpoint="product-list"} 1', body)
+
+
+class SlowQueryLogTests(TestCase):
+    def test_normalize_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            normalize("SELECT * FROM  main_product WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            "SELECT * FROM main_product WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_deduplicated_with_plan(self):
+        make_product('Silver Payal', stock=1)
+        self.client.get(reverse('product-list'))
+        self.client.get(reverse('product-list'))
+
+        entry = SlowQuery.objects.get(sql__startswith='SELECT "main_product"."id"')
+        self.assertEqual(entry.count, 2)
+        self.assertEqual(entry.view_name, 'product-list')
+        self.assertTrue(entry.explain)
+
+
+class ProfilerTests(TestCase):
+    def test_staff_header_profiles_request(self):
+        staff = User.objects.create_user('ops', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('faq-list'), HTTP_X_PROFILE='1')
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.view_name, 'faq-list')
+        self.assertEqual(profile.triggered_by, 'ops')
+        self.assertIn('cumulative', profile.stats)
+
+    def test_overlapping_profiled_requests_run_unprofiled(self):
+        staff = User.objects.create_user('ops', is_staff=True)
+        factory = RequestFactory()
+        inner_responses, profiling = [], []
+
+        def request():
+            r = factory.get(reverse('faq-list'), HTTP_X_PROFILE='1')
+            r.user = staff
+            return r
+
+        def get_response(r):
+            if not profiling:
+                # A second profiled request arrives while this one is still being profiled
+                profiling.append(r)
+                inner_responses.append(middleware(request()))
+            return HttpResponse('ok')
+
+        middleware = ProfilerMiddleware(get_response)
+        outer = middleware(request())
+        self.assertEqual(inner_responses[0].status_code, 200)
+        self.assertNotIn('X-Profile-Id', inner_responses[0])
+        self.assertIn('X-Profile-Id', outer)
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_header_ignored_for_anonymous_users(self):
+        response = self.client.get(reverse('faq-list'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+@override_settings(DELTA_FEED_SETTLE_SECONDS=0, MERCHANT_FEED_DIR='/nonexistent/feeds')
+class PerformanceBudgetTests(TestCase):
+    """
+    Every route in main/urls.py declares (max SQL queries, max response bytes).
+    Query counts are measured with a little data and again with ten times as much:
+    they must not change (that's how N+1s show up), and must stay within budget.
+    Payloads are checked at the larger size.
+    """
+    BUDGETS = {
+        'api-root': (0, 1_000),
+        'announcement-list': (1, 5_000),
+        'banner-list': (1, 10_000),
+        'sale-banner': (1, 500),
+        'testimonial-list': (1, 10_000),
+        'testimonial-featured': (1, 2_000),
+        'whatsapp-group-link': (1, 200),
+        # Unpaged (no ?limit), so the bytes are for the LARGE fixture's 30 products
+        'product-list': (2, 40_000),
+        'product-detail': (2, 2_000),
+        'product-related': (2, 20_000),
+        'product-changes': (3, 60_000),
+        'product-autocomplete': (1, 2_000),
+        'merchant-feed-xml': (2, 60_000),
+        'merchant-feed-tsv': (2, 30_000),
+        'sitemap-index': (0, 1_000),
+        'sitemap-file': (0, 10_000),
+        'faq-list': (2, 10_000),
+        'category-list': (1, 10_000),
+        'size-guide': (1, 10_000),
+        'size-guide-convert': (1, 500),
+        'validate-promo': (2, 300),
+        'redeem-promo': (8, 300),
+        'reservation-create': (9, 500),
+        'reservation-detail': (3, 500),
+        'reservation-checkout': (4, 500),
+        'metrics': (2, 100_000),
+    }
+    SMALL, LARGE = 3, 30
+
+    def setUp(self):
+        sitemap_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(sitemap_dir.cleanup)
+        self.enterContext(override_settings(SITEMAP_DIR=sitemap_dir.name))
+        # View counts are flushed on a timer, not by any one request
+        self.enterContext(override_settings(POPULARITY_FLUSH_SECONDS=3600))
+        self.staff = User.objects.create_user('ops', is_staff=True)
+        self.promo = PromoCode.objects.create(code='BUDGET10', discount_value=10)
+        SocialLink.objects.create(platform='whatsapp_group', url='https://chat.whatsapp.com/x')
+        self.root = Category.objects.create(name='Silver')
+        self.rows = 0
+        self.add_rows(self.SMALL)
+        self.reservation = StockReservation.objects.reserve({Product.objects.first().pk: 1})
+
+    def add_rows(self, count):
+        for i in range(self.rows, self.rows + count):
+            category = Category.objects.create(name=f'Sub {i}', parent=self.root)
+            product = make_product(f'Budget Payal {i}', stock=100, category=category,
+                                   specifications=[{"label": "Material", "value": "Silver"}])
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=f'products/{i}-{n}.webp', order=n) for n in range(3)
+            ])
+            faq_category = FAQCategory.objects.create(name=f'Topic {i}', order=i)
+            FAQ.objects.bulk_create([
+                FAQ(category=faq_category, question=f'Q{n}?', answer='A', order=n, is_active=n < 3) for n in range(4)
+            ])
+            Testimonial.objects.create(name='Asha', location='Pune', text='Lovely', product_name='Payal')
+            Banner.objects.create(heading=f'Banner {i}', image=f'banners/{i}.webp', order=i)
+            Announcement.objects.create(text=f'Free shipping {i}')
+            SizeGuideCategory.objects.create(slug=f'guide-{i}', name=f'Guide {i}', columns=['A'], data=[{'A': '1'}])
+        self.rows += count
+
+    def build_request(self, name):
+        """(method, path, json body or None, as_staff) for one call to the route."""
+        product = Product.objects.first()
+        if name == 'product-detail':
+            return 'GET', reverse(name, args=[product.slug]), None, False
+        if name == 'product-autocomplete':
+            # A cold index: the one query that loads it
+            autocomplete.reset()
+            return 'GET', reverse(name) + '?q=budget', None, False
+        if name == 'product-related':
+            build_related()
+            return 'GET', reverse(name, args=[product.slug]), None, False
+        if name == 'reservation-detail':
+            return 'GET', reverse(name, args=[self.reservation.token]), None, False
+        if name == 'reservation-checkout':
+            token = StockReservation.objects.reserve({product.pk: 1}).token
+            return 'POST', reverse(name, args=[token]), None, False
+        if name == 'reservation-create':
+            return 'POST', reverse(name), {'items': [{'slug': product.slug, 'quantity': 1}]}, False
+        if name == 'validate-promo':
+            return 'POST', reverse(name), {'code': 'BUDGET10', 'total_amount': 1000}, False
+        if name == 'redeem-promo':
+            customer = f'{self.promo.customer_usages.count()}@example.com'
+            return 'POST', reverse(name), {'code': 'BUDGET10', 'total_amount': 1000, 'customer': customer}, False
+        if name == 'testimonial-featured':
+            # A cold ring: the one query that loads it
+            testimonials.invalidate()
+            return 'GET', reverse(name), None, False
+        if name == 'size-guide-convert':
+            # A cold index: the one query that loads every chart
+            size_guides.invalidate()
+            return 'GET', reverse(name) + '?chart=guide-0&from=A&value=1', None, False
+        if name == 'metrics':
+            return 'GET', reverse(name), None, True
+        if name in ('sitemap-index', 'sitemap-file'):
+            # Served from files; building them (cron's job) isn't part of the request
+            sitemaps.build_sitemaps()
+            if name == 'sitemap-file':
+                return 'GET', reverse(name, args=['sitemap-products-0.xml']), None, False
+        return 'GET', reverse(name), None, False
+
+    def measure(self, name):
+        method, path, body, as_staff = self.build_request(name)
+        client = APIClient()
+        if as_staff:
+            client.force_authenticate(self.staff)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.generic(method, path, json.dumps(body) if body else '', content_type='application/json')
+            # Streamed bodies run their queries while being consumed
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertLess(response.status_code, 400, f"{name}: {response.status_code} {content[:200]}")
+        return len(queries), len(content)
+
+    def test_every_route_has_a_budget(self):
+        names = {p.name for p in urlpatterns if isinstance(p, URLPattern)}
+        self.assertEqual(names - set(self.BUDGETS), set(), "Add a budget for new routes")
+
+    def test_query_counts_are_constant_and_payloads_fit(self):
+        small = {name: self.measure(name) for name in self.BUDGETS}
+        self.add_rows(self.LARGE - self.SMALL)
+        large = {name: self.measure(name) for name in self.BUDGETS}
+
+        for name, (max_queries, max_bytes) in self.BUDGETS.items():
+            with self.subTest(route=name):
+                self.assertEqual(large[name][0], small[name][0], f"{name}: query count grows with data (N+1?)")
+                self.assertLessEqual(large[name][0], max_queries, f"{name}: over query budget")
+                self.assertLessEqual(large[name][1], max_bytes, f"{name}: payload over budget")
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    # Routes whose plans need seeded data to get past validation
+    routes = [
+        'product-list', 'product-detail', 'product-related', 'product-autocomplete', 'size-guide-convert',
+        'sitemap-index', 'sitemap-file',
+    ]
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        # Seed and drive the test database instead of a throwaway one, in the test environment already set up
+        self.enterContext(mock.patch.object(connection.creation, 'create_test_db', return_value=None))
+        self.enterContext(mock.patch.object(connection.creation, 'destroy_test_db'))
+        for name in ('setup_test_environment', 'teardown_test_environment'):
+            self.enterContext(mock.patch(f'main.management.commands.benchmark_api.{name}'))
+
+    def test_small_run_writes_results_per_scale_and_route(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('benchmark_api', scales='20', endpoints=','.join(self.routes), duration=0.2,
+                         max_requests=3, concurrency=1, output=output, stdout=io.StringIO())
+            with open(output) as fh:
+                report = json.load(fh)
+        self.assertEqual(set(report), {'meta', 'scales'})
+        self.assertEqual(report['meta']['database'], connection.vendor)
+        self.assertEqual(set(report['scales']['20']), set(self.routes))
+        for name, stats in report['scales']['20'].items():
+            self.assertEqual(stats['requests'], 3, name)
+            self.assertEqual(stats['statuses'], {'200': 3}, name)
+            self.assertEqual(stats['errors'], 0)
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+
+    def test_client_errors_count_as_errors(self):
+        stdout = io.StringIO()
+        missing = ('GET', reverse('product-detail', args=['no-such-product']), None, False)
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('main.management.commands.benchmark_api.Plans.product_detail', return_value=missing):
+            output = os.path.join(directory, 'results.json')
+            call_command('benchmark_api', scales='5', endpoints='product-detail', duration=0.2,
+                         max_requests=3, concurrency=1, output=output, stdout=stdout)
+            with open(output) as fh:
+                stats = json.load(fh)['scales']['5']['product-detail']
+        self.assertEqual(stats['statuses'], {'404': 3})
+        self.assertEqual(stats['errors'], 3)
+        self.assertIn("MOSTLY ERRORS", stdout.getvalue())
+
+    def test_empty_catalog_is_an_error(self):
+        with self.assertRaisesMessage(CommandError, "seed_catalog"):
+            with mock.patch('main.management.commands.benchmark_api.seed_catalog'):
+                call_command('benchmark_api', scales='5', output=os.devnull, stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "--scales"):
+            call_command('benchmark_api', scales='0', output=os.devnull, stdout=io.StringIO())
+
+
+class SeedCatalogTests(TestCase):
+    def seed(self, *args):
+        call_command('seed_catalog', '--products', '30', '--seed', '7', '--image-files', '0', *args, stdout=io.StringIO())
+
+    def snapshot(self):
+        return {
+            'products': list(Product.objects.order_by('name').values_list(
+                'name', 'slug', 'description', 'price', 'discount_percent', 'category__path', 'stock', 'rating',
+                'reviews_count', 'specifications', 'is_sale_active', 'sale_label',
+            )),
+            'images': list(ProductImage.objects.order_by('product__name', 'order').values_list('product__slug', 'order', 'image')),
+            'testimonials': list(Testimonial.objects.order_by('pk').values_list('name', 'location', 'text', 'rating', 'is_active')),
+            'faqs': list(FAQ.objects.order_by('category__order', 'order').values_list('category__name', 'question', 'is_active')),
+            'promo_codes': list(PromoCode.objects.order_by('code').values_list('code', 'discount_type', 'discount_value', 'max_uses')),
+            'banners': list(Banner.objects.order_by('order').values_list('heading', 'image')),
+            'size_guides': list(SizeGuideCategory.objects.order_by('slug').values_list('slug', 'data')),
+        }
+
+    def test_same_seed_gives_the_same_rows(self):
+        self.seed()
+        first = self.snapshot()
+        self.assertEqual(
+            {name: len(rows) for name, rows in first.items() if name != 'images'},
+            {'products': 30, 'testimonials': 20, 'faqs': 60, 'promo_codes': 21, 'banners': 4, 'size_guides': 3},
+        )
+        self.assertTrue(30 <= len(first['images']) <= 120)
+
+        self.seed('--flush')
+        self.assertEqual(self.snapshot(), first)
+
+    def test_flush_only_deletes_seeded_rows(self):
+        anklets = Category.objects.create(name='Anklets')
+        product = make_product('Silver Payal', stock=1, category=anklets)
+        PromoCode.objects.create(code='DIWALI', discount_value=10)
+        Testimonial.objects.create(name='Asha', location='Pune', text='Lovely', product_name='Payal')
+        Banner.objects.create(heading='Festive Sale', image='banners/festive.webp')
+        self.seed()
+        self.assertEqual(Product.objects.count(), 31)
+
+        delete_seeded()
+        self.assertEqual(list(Product.objects.all()), [product])
+        self.assertEqual(list(PromoCode.objects.values_list('code', flat=True)), ['DIWALI'])
+        self.assertEqual(list(Testimonial.objects.values_list('name', flat=True)), ['Asha'])
+        self.assertEqual(list(Banner.objects.values_list('heading', flat=True)), ['Festive Sale'])
+        self.assertFalse(FAQCategory.objects.exists())
+        # Seeded categories go once they are empty; Anklets still holds the real product
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Anklets'])
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        self.silver = Category.objects.create(name='Silver')
+        self.rings = Category.objects.create(name='Rings', parent=self.silver)
+        self.toe_rings = Category.objects.create(name='Toe Rings', parent=self.rings)
+        self.anklets = Category.objects.create(name='Anklets')
+
+    def paths(self):
+        return dict(Category.objects.values_list('name', 'path'))
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.assertEqual((self.toe_rings.path, self.toe_rings.depth), ('silver/rings/toe-rings/', 2))
+        self.rings.parent = self.anklets
+        self.rings.save()
+        self.assertEqual(self.paths(), {
+            'Silver': 'silver/', 'Anklets': 'anklets/', 'Rings': 'anklets/rings/', 'Toe Rings': 'anklets/rings/toe-rings/',
+        })
+        self.rings.parent = None
+        self.rings.save()
+        self.assertEqual(Category.objects.get(pk=self.toe_rings.pk).depth, 1)
+        self.assertEqual(self.paths()['Toe Rings'], 'rings/toe-rings/')
+
+    def test_renaming_a_slug_rewrites_descendant_paths(self):
+        # Products show their category's name, so its products count as changed
+        product = make_product('Silver Ring', stock=1, category=self.rings)
+        self.rings.name, self.rings.slug = 'Finger Rings', 'finger-rings'
+        self.rings.save()
+        self.assertEqual(self.paths()['Toe Rings'], 'silver/finger-rings/toe-rings/')
+        self.assertGreater(Product.objects.get(pk=product.pk).updated_at, product.updated_at)
+
+    def test_cannot_nest_under_itself_or_a_descendant(self):
+        for parent in (self.rings, self.toe_rings):
+            self.rings.parent = parent
+            with self.assertRaises(ValidationError):
+                self.rings.clean()
+
+    def test_paths_that_would_not_fit_are_refused(self):
+        parent = self.silver
+        for level in range(9):
+            parent = Category.objects.create(name=f'Level {level}', slug=f'{level}' * 100, parent=parent)
+        too_deep = Category(name='Too Deep', slug='x' * 100, parent=parent)
+        with self.assertRaises(ValidationError):
+            too_deep.clean()
+        with self.assertRaises(ValidationError):
+            too_deep.save()
+        # Moving the rings under the deepest level would push a descendant past the limit
+        Category.objects.create(name='Long', slug='y' * 100, parent=self.toe_rings)
+        self.rings.parent = parent
+        with self.assertRaises(ValidationError):
+            self.rings.save()
+
+    def test_category_filter_includes_subcategories(self):
+        ring = make_product('Silver Ring', stock=1, category=self.rings)
+        toe_ring = make_product('Toe Ring', stock=1, category=self.toe_rings)
+        make_product('Payal', stock=1, category=self.anklets)
+
+        def listed(slug):
+            return sorted(p['slug'] for p in self.client.get(reverse('product-list'), {'category': slug}).json())
+
+        self.assertEqual(listed('silver'), [ring.slug, toe_ring.slug])
+        self.assertEqual(listed('toe-rings'), [toe_ring.slug])
+        self.assertEqual(listed('missing'), [])
+
+
+class ProductPaginationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Anklets')
+        self.products = [make_product(f'Payal {n}', stock=1, category=category) for n in range(65)]
+
+    def test_whole_list_unless_a_page_is_requested(self):
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(len(response.json()), 65)
+        self.assertNotIn('X-Total-Count', response)
+
+    def test_limit_and_offset_page_with_headers(self):
+        response = self.client.get(reverse('product-list'), {'limit': 20, 'offset': 60})
+        self.assertEqual(len(response.json()), 5)
+        self.assertEqual(response['X-Total-Count'], '65')
+        self.assertIn('rel="prev"', response['Link'])
+        self.assertNotIn('rel="next"', response['Link'])
+        response = self.client.get(reverse('product-list'), {'limit': 30})
+        self.assertEqual(len(response.json()), 30)
+        self.assertIn('rel="next"', response['Link'])
+
+
+@override_settings(DELTA_FEED_SETTLE_SECONDS=0)
+class ProductChangesFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.anklet = make_product('Silver Anklet', stock=5)
+        self.ring = make_product('Toe Ring', stock=1)
+
+    def feed(self, cursor=None):
+        response = self.client.get(reverse('product-changes'), {'updated_since': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(lines[-1], {'type': 'cursor', 'updated_since': response['X-Next-Cursor']})
+        return lines[:-1], lines[-1]['updated_since']
+
+    def test_snapshot_then_deltas(self):
+        changes, cursor = self.feed()
+        self.assertEqual([(c['type'], c['product']['slug']) for c in changes],
+                         [('product', 'silver-anklet'), ('product', 'toe-ring')])
+
+        changes, cursor = self.feed(cursor)
+        self.assertEqual(changes, [])
+
+        self.ring.stock = 3
+        self.ring.save()
+        anklet_id = self.anklet.pk
+        self.anklet.delete()
+        changes, cursor = self.feed(cursor)
+        self.assertEqual([c['type'] for c in changes], ['product', 'deleted'])
+        self.assertEqual(changes[0]['product']['stock'], 3)
+        self.assertEqual((changes[1]['id'], changes[1]['slug']), (anklet_id, 'silver-anklet'))
+
+    def test_bulk_and_category_deletes_tombstone_in_one_statement(self):
+        changes = []
+
+        def record(sender, product_ids, **kwargs):
+            changes.append(sorted(product_ids))
+        catalog_changed.connect(record)
+        self.addCleanup(catalog_changed.disconnect, record)
+
+        def delete(count):
+            category = Category.objects.create(name=f'Clearance {count}')
+            products = [make_product(f'Clearance {count} {n}', stock=1, category=category) for n in range(count)]
+            changes.clear()
+            with CaptureQueriesContext(connection) as queries:
+                Product.objects.filter(category=category).delete()
+            self.assertEqual(changes, [sorted(p.pk for p in products)])
+            self.assertEqual(ProductTombstone.objects.filter(product_id__in=changes[0]).count(), count)
+            return len(queries)
+
+        self.assertEqual(delete(2), delete(20))
+
+        # Deleting a category deletes the products of its whole subtree the same way
+        _, cursor = self.feed()
+        for delete_category in (lambda c: Category.objects.filter(pk=c.pk).delete(), lambda c: c.delete()):
+            rings = Category.objects.create(name='Rings')
+            toe_rings = Category.objects.create(name='Toe Rings', parent=rings)
+            product = make_product('Toe Ring 2', stock=1, category=toe_rings)
+            changes.clear()
+            delete_category(rings)
+            self.assertEqual(changes, [[product.pk]])
+            feed, cursor = self.feed(cursor)
+            self.assertEqual([(c['type'], c['id']) for c in feed], [('deleted', product.pk)])
+
+    def test_recent_writes_wait_for_the_settle_time(self):
+        # A write stamped inside the window may belong to a transaction that hasn't committed yet
+        Product.objects.filter(pk=self.ring.pk).update(updated_at=timezone.now() - timedelta(seconds=30))
+        Product.objects.filter(pk=self.anklet.pk).update(updated_at=timezone.now() - timedelta(seconds=90))
+        with override_settings(DELTA_FEED_SETTLE_SECONDS=60):
+            changes, cursor = self.feed()
+        self.assertEqual([c['product']['slug'] for c in changes], ['silver-anklet'])
+        self.assertLess(parse_datetime(cursor), timezone.now() - timedelta(seconds=59))
+
+    def test_reservations_and_category_renames_count_as_changes(self):
+        _, cursor = self.feed()
+        StockReservation.objects.reserve({self.ring.pk: 1})
+        changes, cursor = self.feed(cursor)
+        self.assertEqual([c['product']['slug'] for c in changes], ['toe-ring'])
+
+        category = self.ring.category
+        category.name = 'Ankle Chains'
+        category.save()
+        changes, _ = self.feed(cursor)
+        self.assertEqual({c['product']['category'] for c in changes}, {'Ankle Chains'})
+        self.assertEqual(len(changes), 2)
+
+    def test_bad_and_expired_cursors(self):
+        url = reverse('product-changes')
+        self.assertEqual(self.client.get(url, {'updated_since': 'yesterday'}).status_code, 400)
+        too_old = (timezone.now() - timedelta(days=365)).isoformat()
+        self.assertEqual(self.client.get(url, {'updated_since': too_old}).status_code, 410)
+
+
+class MerchantFeedTests(TestCase):
+    def setUp(self):
+        self.feed_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.feed_dir.cleanup)
+        self.enterContext(override_settings(MERCHANT_FEED_DIR=self.feed_dir.name, SITE_URL='https://api.example.com',
+                                            STOREFRONT_URL='https://shop.example.com'))
+        self.payal = make_product('Silver Payal', stock=3, discount_percent=10)
+        ProductImage.objects.create(product=self.payal, image='products/payal.webp')
+        self.ring = make_product('Toe Ring', stock=0)
+
+    def test_live_feed_has_prices_links_and_stock(self):
+        response = self.client.get(reverse('merchant-feed-xml'))
+        xml = b''.join(response.streaming_content).decode()
+        self.assertIn('<g:link>https://shop.example.com/product/silver-payal</g:link>', xml)
+        self.assertIn('<g:image_link>https://api.example.com/media/products/payal.webp</g:image_link>', xml)
+        self.assertIn('<g:price>1000.00 INR</g:price>\n<g:sale_price>900.00 INR</g:sale_price>', xml)
+        self.assertIn('<g:availability>out_of_stock</g:availability>', xml)
+
+        response = self.client.get(reverse('merchant-feed-tsv'))
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0].split('\t'), merchant_feed.TSV_COLUMNS)
+        self.assertEqual(len(rows), 3)
+
+    def test_ended_sale_drops_the_discount(self):
+        self.payal.is_sale_active = True
+        self.payal.sale_ends_at = timezone.now() - timedelta(minutes=1)
+        self.assertIsNone(self.payal.sale_price())
+        self.payal.sale_ends_at = timezone.now() + timedelta(days=1)
+        self.assertEqual(str(self.payal.sale_price()), '900.00')
+
+    def test_incremental_rebuild_only_renders_changed_products(self):
+        self.assertEqual(merchant_feed.refresh_entries(), 2)
+        self.assertEqual(merchant_feed.refresh_entries(), 0)
+
+        self.ring.stock = 5
+        self.ring.save()
+        self.assertEqual(merchant_feed.refresh_entries(), 1)
+
+        # A timed sale that has since ended changes the price without touching updated_at
+        Product.objects.filter(pk=self.payal.pk).update(is_sale_active=True, sale_ends_at=timezone.now())
+        self.assertEqual(merchant_feed.refresh_entries(), 1)
+
+        self.ring.delete()
+        merchant_feed.write_feed_files()
+        response = self.client.get(reverse('merchant-feed-xml'))
+        self.assertIn('Last-Modified', response)
+        xml = b''.join(response.streaming_content).decode()
+        self.assertEqual(xml.count('<item>'), 1)
+        self.assertNotIn('<g:sale_price>', xml)
+        self.assertTrue(xml.endswith('</rss>\n'))
+
+    def test_unchanged_feed_file_is_not_resent(self):
+        merchant_feed.write_feed_files()
+        response = self.client.get(reverse('merchant-feed-xml'))
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(
+            self.client.get(reverse('merchant-feed-xml'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+        self.assertEqual(self.client.get(reverse('merchant-feed-xml'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('merchant-feed-xml'), HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+
+@override_settings(SITEMAP_SHARD_SIZE=2, STOREFRONT_URL='https://shop.example.com')
+class SitemapTests(TestCase):
+    def setUp(self):
+        sitemap_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(sitemap_dir.cleanup)
+        self.enterContext(override_settings(SITEMAP_DIR=sitemap_dir.name))
+        self.products = [make_product(f'Payal {n}', stock=1) for n in range(5)]
+        self.shards = {product.pk: f"products-{product.pk // 2}" for product in self.products}
+
+    def test_only_changed_shards_are_rebuilt(self):
+        self.assertEqual(sorted(sitemaps.build_sitemaps()), sorted({*self.shards.values(), 'categories'}))
+        self.assertEqual(sitemaps.build_sitemaps(), [])
+
+        product = self.products[2]
+        product.stock = 7
+        product.save()
+        self.assertEqual(sorted(sitemaps.build_sitemaps()), sorted([self.shards[product.pk], 'categories']))
+
+        # Emptying a shard drops it from the index
+        emptied = self.shards[self.products[0].pk]
+        Product.objects.filter(pk__in=[pk for pk, shard in self.shards.items() if shard == emptied]).delete()
+        sitemaps.build_sitemaps()
+        with open(sitemaps.sitemap_path('sitemap.xml')) as fh:
+            index = fh.read()
+        self.assertNotIn(sitemaps.shard_filename(emptied), index)
+        self.assertFalse(os.path.exists(sitemaps.sitemap_path(sitemaps.shard_filename(emptied))))
+        self.assertIn(sitemaps.shard_filename(self.shards[product.pk]), index)
+
+    def test_shard_lists_product_urls_with_lastmod(self):
+        self.client.get(reverse('sitemap-index'))
+        product = self.products[1]
+        response = self.client.get(reverse('sitemap-file', args=[sitemaps.shard_filename(self.shards[product.pk])]))
+        xml = b''.join(response.streaming_content).decode()
+        self.assertIn(f'<url><loc>https://shop.example.com/product/{product.slug}</loc>'
+                      f'<lastmod>{product.updated_at.date().isoformat()}</lastmod></url>', xml)
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('sitemap-index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('sitemap-index'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(
+            self.client.get(reverse('sitemap-index'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+        self.assertEqual(self.client.get(reverse('sitemap-file', args=['manifest.json'])).status_code, 404)
+
+
+class ProductAdminPerformanceTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        self.category = Category.objects.create(name='Anklets')
+        self.count = 0
+        self.add_products(3)
+
+    def add_products(self, count):
+        for n in range(self.count, self.count + count):
+            category = Category.objects.create(name=f'Anklets {n}', parent=self.category)
+            product = make_product(f'Oxidised Payal {n}', stock=1, category=category)
+            ProductImage.objects.create(product=product, image=f'products/{n}.webp')
+        self.count += count
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        urls = [reverse('admin:main_product_changelist'), reverse('admin:main_product_changelist') + '?q=oxidised+payal']
+        small = [self.queries(url)[0] for url in urls]
+        self.add_products(27)
+        large = [self.queries(url)[0] for url in urls]
+        self.assertEqual(small, large)
+        self.assertLessEqual(max(large), 8)
+
+    def test_search_uses_slug_prefix_or_id(self):
+        url = reverse('admin:main_product_changelist')
+        _, response = self.queries(url + '?q=Oxidised Payal 2')
+        self.assertEqual(response.context['cl'].result_count, 1)
+        product = Product.objects.get(slug='oxidised-payal-1')
+        _, response = self.queries(url + f'?q={product.pk}')
+        self.assertIn(product, response.context['cl'].result_list)
+
+    def test_search_falls_back_to_words_inside_the_name(self):
+        url = reverse('admin:main_product_changelist')
+        _, response = self.queries(url + '?q=payal 2')
+        self.assertEqual([p.slug for p in response.context['cl'].result_list], ['oxidised-payal-2'])
+        _, response = self.queries(url + '?q=PAYAL')
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_unfiltered_count_uses_table_estimate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.add_products(2)
+        paginator = EstimatedCountPaginator(Product.objects.order_by('pk'), 100)
+        paginator.threshold = 1
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(EstimatedCountPaginator(Product.objects.filter(stock=1).order_by('pk'), 100).count, 5)
+
+
+class BulkPricingActionTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        anklets = Category.objects.create(name='Anklets')
+        self.payal = Category.objects.create(name='Payal', parent=anklets)
+        rings = Category.objects.create(name='Rings')
+        self.anklet = make_product('Silver Anklet', stock=1, category=anklets)
+        self.payals = [make_product(f'Payal {n}', stock=1, category=self.payal) for n in range(3)]
+        self.ring = make_product('Toe Ring', stock=1, category=rings)
+        self.changes = []
+        catalog_changed.connect(self.record_change)
+        self.addCleanup(catalog_changed.disconnect, self.record_change)
+
+    def record_change(self, sender, product_ids, **kwargs):
+        self.changes.append(sorted(product_ids))
+
+    def post_action(self, model, action, pks, **data):
+        url = reverse(f'admin:main_{model}_changelist')
+        return self.client.post(url, {'action': action, '_selected_action': pks, **data})
+
+    def test_confirmation_page_then_single_update_per_batch(self):
+        pks = [p.pk for p in self.payals]
+        response = self.post_action('product', 'bulk_pricing', pks)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'admin/main/product/bulk_pricing.html')
+        self.assertEqual(Product.objects.filter(price=1000).count(), 5)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_action('product', 'bulk_pricing', pks, apply='Apply', price_change='percent',
+                                        price_value='-12.5', sale='start', sale_label='Diwali Sale')
+        self.assertEqual(response.status_code, 302)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "main_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.changes, [sorted(pks)])
+        for product in Product.objects.filter(pk__in=pks):
+            self.assertEqual((product.price, product.is_sale_active, product.sale_label), (875, True, 'Diwali Sale'))
+        self.anklet.refresh_from_db()
+        self.assertEqual((self.anklet.price, self.anklet.is_sale_active), (1000, False))
+
+    def test_batches_and_price_floor(self):
+        self.changes = []
+        with CaptureQueriesContext(connection) as queries:
+            updated = Product.objects.all().update_in_batches(batch_size=2, price=Greatest(F('price') - 5000, 0))
+        self.assertEqual(updated, 5)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 3)
+        self.assertEqual(len(self.changes), 1)
+        self.assertFalse(Product.objects.exclude(price=0).exists())
+
+    def test_invalid_form_changes_nothing(self):
+        response = self.post_action('product', 'bulk_pricing', [self.ring.pk], apply='Apply', price_change='set')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+        self.assertEqual(self.changes, [])
+
+    def test_category_action_covers_subtree(self):
+        Product.objects.update(is_sale_active=True, sale_label='Old Sale', discount_percent=10)
+        self.changes = []
+        self.post_action('category', 'bulk_pricing', [self.anklet.category_id], apply='Apply', sale='end',
+                         discount_percent='0')
+        ended = {self.anklet.pk, *(p.pk for p in self.payals)}
+        self.assertEqual(self.changes, [sorted(ended)])
+        self.assertEqual(set(Product.objects.filter(is_sale_active=False, sale_label=None, discount_percent=0)
+                             .values_list('pk', flat=True)), ended)
+        self.ring.refresh_from_db()
+        self.assertTrue(self.ring.is_sale_active)
+
+    def test_saving_one_product_signals_catalog_change(self):
+        self.changes = []
+        self.ring.save()
+        self.ring.delete()
+        self.assertEqual(len(self.changes), 2)
+
+
+class ContentAddressedMediaTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.media_root = media_root.name
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media_root)
+            for directory, _, names in os.walk(self.media_root) for name in names
+        )
+
+    def banner(self, content, filename='burger.webp'):
+        banner = Banner(heading='Sale')
+        banner.image.save(filename, ContentFile(content))
+        return banner
+
+    def test_identical_uploads_are_stored_once(self):
+        first, second = self.banner(b'burger'), self.banner(b'burger', filename='Burger.WEBP')
+        other = self.banner(b'cappuccino')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertRegex(first.image.name, r'^banners/([0-9a-f]{2})/\1[0-9a-f]{30}\.webp$')
+        self.assertEqual(self.files(), sorted([first.image.name, other.image.name]))
+        self.assertEqual(storage.reference_counts()[first.image.name], 2)
+
+    def test_prune_keeps_referenced_and_recent_files(self):
+        kept, orphan = self.banner(b'burger'), self.banner(b'cappuccino')
+        orphan.delete()
+        self.assertEqual(storage.prune_media(grace_seconds=3600), [])
+        self.assertEqual(storage.prune_media(grace_seconds=0), [orphan.image.name])
+        self.assertEqual(self.files(), [kept.image.name])
+
+    def test_rehash_merges_legacy_duplicates(self):
+        os.makedirs(os.path.join(self.media_root, 'banners'))
+        for name in ('burger.webp', 'burger_UG8Pmhy.webp'):
+            with open(os.path.join(self.media_root, 'banners', name), 'wb') as fh:
+                fh.write(b'burger')
+            Banner.objects.create(heading=name, image=f'banners/{name}')
+        Banner.objects.create(heading='Missing', image='banners/missing.webp')
+
+        rehashed, missing = storage.rehash_media()
+        self.assertEqual((len(rehashed), missing), (2, ['banners/missing.webp']))
+        names = set(Banner.objects.exclude(heading='Missing').values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.files(), sorted(names))
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name, MEDIA_ACCEL=None))
+        self.name = storage.media_storage.save('banners/hero.webp', ContentFile(b'0123456789'))
+        os.makedirs(os.path.join(media_root.name, 'exports'))
+        with open(os.path.join(media_root.name, 'exports', 'orders.csv'), 'w') as fh:
+            fh.write('id\n1\n')
+
+    def get(self, name, **headers):
+        response = self.client.get('/media/' + name, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_public_file_is_cacheable_forever(self):
+        response, body = self.get(self.name)
+        self.assertEqual((response.status_code, body), (200, b'0123456789'))
+        self.assertEqual(response['Cache-Control'], settings.MEDIA_CACHE_CONTROL)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        response, _ = self.get(self.name, if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        for header, status, body, content_range in [
+            ('bytes=2-4', 206, b'234', 'bytes 2-4/10'),
+            ('bytes=7-', 206, b'789', 'bytes 7-9/10'),
+            ('bytes=-3', 206, b'789', 'bytes 7-9/10'),
+            ('bytes=5-100', 206, b'56789', 'bytes 5-9/10'),
+            ('bytes=0-1,4-5', 200, b'0123456789', None),
+            ('bytes=10-', 416, b'', 'bytes */10'),
+        ]:
+            with self.subTest(header=header):
+                response, content = self.get(self.name, range=header)
+                self.assertEqual((response.status_code, content), (status, body))
+                self.assertEqual(response.get('Content-Range'), content_range)
+                if status == 206:
+                    self.assertEqual(response['Content-Length'], str(len(body)))
+
+        etag = self.get(self.name)[0]['ETag']
+        self.assertEqual(self.get(self.name, range='bytes=2-4', if_range=etag)[0].status_code, 206)
+        self.assertEqual(self.get(self.name, range='bytes=2-4', if_range='"stale"')[0].status_code, 200)
+
+    def test_private_media_needs_staff(self):
+        self.assertEqual(self.get('exports/orders.csv')[0].status_code, 403)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        response, body = self.get('exports/orders.csv')
+        self.assertEqual((response.status_code, body), (200, b'id\n1\n'))
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    def test_paths_outside_media_or_hidden_are_not_found(self):
+        for name in ('banners/../../settings.py', 'banners/.hero.webp.tmp', 'banners/missing.webp', 'banners/'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name)[0].status_code, 404)
+
+    def test_web_server_sends_the_bytes(self):
+        with override_settings(MEDIA_ACCEL='x-accel-redirect'):
+            response, body = self.get(self.name)
+        self.assertEqual((response['X-Accel-Redirect'], body), ('/protected-media/' + self.name, b''))
+        self.assertEqual(response['Cache-Control'], settings.MEDIA_CACHE_CONTROL)
+        with override_settings(MEDIA_ACCEL='x-sendfile'):
+            response, _ = self.get(self.name)
+        self.assertEqual(response['X-Sendfile'], storage.media_storage.path(self.name))
+
+
+class ImagePlaceholderTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.product = make_product('Silver Payal', stock=1)
+
+    def image_file(self, size=(300, 200), format='PNG', mode='RGB', **save_kwargs):
+        buffer = io.BytesIO()
+        Image.new(mode, size, (200, 120, 40)).save(buffer, format, **save_kwargs)
+        return ContentFile(buffer.getvalue())
+
+    def test_upload_stores_size_and_placeholder(self):
+        image = ProductImage(product=self.product)
+        image.image.save('payal.png', self.image_file())
+        image.refresh_from_db()
+        self.assertEqual((image.image_width, image.image_height), (300, 200))
+        self.assertTrue(image.image_placeholder.startswith('data:image/webp;base64,'))
+        self.assertLess(len(image.image_placeholder), 400)
+        # Saving again doesn't re-read the file
+        with mock.patch('main.models.field_file_metadata') as metadata:
+            image.save()
+        metadata.assert_not_called()
+
+    def test_rotated_photo_reports_displayed_size(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        banner = Banner(heading='Sale')
+        banner.image.save('hero.jpg', self.image_file(format='JPEG', exif=exif))
+        self.assertEqual((banner.image_width, banner.image_height), (200, 300))
+
+    def test_unreadable_upload_leaves_metadata_empty(self):
+        testimonial = Testimonial(name='Asha', location='Pune', text='Lovely', product_name='Payal')
+        testimonial.image.save('photo.jpg', ContentFile(b'not an image'))
+        self.assertEqual((testimonial.image_width, testimonial.image_placeholder), (None, ''))
+
+    def test_backfill_reads_each_file_once(self):
+        name = storage.media_storage.save('products/payal.png', self.image_file(size=(40, 80)))
+        ProductImage.objects.bulk_create([ProductImage(product=self.product, image=name, order=n) for n in range(3)])
+        ProductImage.objects.create(product=self.product, image='products/missing.png', order=3)
+        with mock.patch('main.placeholders.image_metadata', wraps=placeholders.image_metadata) as metadata:
+            updated, unreadable = placeholders.backfill()
+        self.assertEqual((updated, unreadable, metadata.call_count), (3, ['products/missing.png'], 1))
+        self.assertEqual(set(ProductImage.objects.filter(image=name).values_list('image_width', 'image_height')), {(40, 80)})
+
+    def test_api_includes_size_and_placeholder(self):
+        image = ProductImage(product=self.product)
+        image.image.save('payal.png', self.image_file())
+        banner = Banner(heading='Sale')
+        banner.image.save('hero.png', self.image_file(size=(1200, 400)))
+
+        detail = self.client.get(reverse('product-detail', args=[self.product.slug])).json()
+        self.assertEqual(len(detail['images']), 1)
+        self.assertEqual(detail['image_details'], [{
+            'url': detail['images'][0], 'width': 300, 'height': 200, 'placeholder': image.image_placeholder,
+        }])
+        banners = self.client.get(reverse('banner-list')).json()
+        banners = banners['results'] if isinstance(banners, dict) else banners
+        self.assertEqual((banners[0]['image_width'], banners[0]['image_height']), (1200, 400))
+        self.assertTrue(banners[0]['image_placeholder'])
+
+
+class ImageArchiveUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.payal = make_product('Silver Payal', stock=1)
+        self.ring = make_product('Toe Ring 7', stock=1)
+        ProductImage.objects.create(product=self.payal, image='products/old.webp', order=0)
+
+    def archive(self, members):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+        buffer.seek(0)
+        return buffer
+
+    def png(self, colour):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), colour).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def images(self, product):
+        return list(product.images.order_by('order').values_list('order', 'image'))
+
+    def test_members_are_matched_by_slug_and_order(self):
+        red, blue = self.png('red'), self.png('blue')
+        fh = self.archive({
+            'silver-payal/1.png': red, 'silver-payal.png': blue, 'toe-ring-7.png': red, 'toe-ring-7-0.JPG': blue,
+            'silver-payal-5.png': b'not an image', 'unknown.png': red, 'notes.txt': b'hi', '__MACOSX/._x.png': b'',
+        })
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            result = upload_archive(fh)
+
+        self.assertEqual(result.created, 4)
+        self.assertEqual(sorted(result.skipped), [
+            ('notes.txt', 'not an image file'), ('silver-payal-5.png', 'not a readable image'),
+            ('unknown.png', 'no product with this slug'),
+        ])
+        payal = self.images(self.payal)
+        self.assertEqual([order for order, _ in payal], [0, 1, 2])
+        ring = self.images(self.ring)
+        self.assertEqual([order for order, _ in ring], [0, 1])
+        # The same bytes are stored once
+        self.assertEqual(payal[1][1], ring[1][1])
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "main_productimage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(callbacks, [backfill_in_background])
+
+    def test_numbered_members_go_after_existing_images(self):
+        ProductImage.objects.create(product=self.payal, image='products/older.webp', order=1)
+        red, blue = self.png('red'), self.png('blue')
+        with mock.patch('main.image_archive.backfill_in_background'):
+            upload_archive(self.archive({'silver-payal/1.png': blue, 'silver-payal/0.png': red, 'silver-payal.png': red}))
+        orders = [order for order, _ in self.images(self.payal)]
+        self.assertEqual(orders, [0, 1, 2, 3, 4])
+        self.assertEqual(self.images(self.payal)[:2], [(0, 'products/old.webp'), (1, 'products/older.webp')])
+        # 0.png, then 1.png, then the unnumbered one
+        self.assertEqual(self.images(self.payal)[2][1], self.images(self.payal)[4][1])
+
+    def test_replace_and_admin_view(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        fh = self.archive({'silver-payal-0.png': self.png('red')})
+        upload = SimpleUploadedFile('images.zip', fh.getvalue(), content_type='application/zip')
+        with mock.patch('main.image_archive.backfill_in_background'):
+            response = self.client.post(reverse('admin:main_product_upload_images'), {'archive': upload, 'replace': 'on'})
+        self.assertRedirects(response, reverse('admin:main_product_changelist'))
+        images = self.images(self.payal)
+        self.assertEqual(len(images), 1)
+        self.assertNotEqual(images[0][1], 'products/old.webp')
+
+    def test_not_a_zip(self):
+        result = upload_archive(io.BytesIO(b'plain text'))
+        self.assertEqual((result.created, result.skipped), (0, [('', 'not a ZIP file')]))
+
+
+class RelatedProductsTests(TestCase):
+    def setUp(self):
+        anklets = Category.objects.create(name='Anklets')
+        payal = Category.objects.create(name='Payal', parent=anklets)
+        kids = Category.objects.create(name='Kids Anklets', parent=anklets)
+        rings = Category.objects.create(name='Rings')
+        zircon = [{"label": "Stone", "value": "Cubic Zirconia"}, {"label": "Weight", "value": "12.1 g"}]
+        pearl = [{"label": "Stone", "value": "Pearl"}, {"label": "Weight", "value": "40 g"}]
+        self.payal = make_product('Oxidised Ghungroo Payal', stock=1, category=payal, specifications=zircon)
+        self.twin = make_product('Oxidised Ghungroo Payal Pair', stock=1, category=payal, specifications=zircon)
+        self.cousin = make_product('Beaded Kids Payal', stock=1, category=kids, specifications=zircon)
+        self.far = make_product('Heavy Bridal Payal', stock=1, category=kids, specifications=pearl)
+        Product.objects.filter(pk=self.far.pk).update(price=24000)
+        self.ring = make_product('Oxidised Ghungroo Ring', stock=1, category=rings, specifications=zircon)
+        make_product('Band Ring', stock=1, category=rings)
+
+    def related(self, product):
+        return list(RelatedProduct.objects.filter(product=product).values_list('related__slug', flat=True))
+
+    def test_neighbours_are_ranked_within_the_department(self):
+        self.assertEqual(build_related(k=2), 6)
+        self.assertEqual(self.related(self.payal), [self.twin.slug, self.cousin.slug])
+        # Rings are another department, however alike the names
+        self.assertNotIn(self.ring.slug, self.related(self.twin))
+
+    def test_endpoint_is_one_join(self):
+        build_related(k=2)
+        url = reverse('product-related', args=[self.payal.slug])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual([p['slug'] for p in response.json()], [self.twin.slug, self.cousin.slug])
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(self.client.get(reverse('product-related', args=['nope'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('product-related', args=[self.far.slug])).status_code, 200)
+
+    def test_changed_rebuild_only_touches_affected_products(self):
+        self.assertIsNone(changed_products())
+        build_related(k=2)
+        self.assertEqual(changed_products(), set())
+        self.cousin.name = 'Oxidised Ghungroo Kids Payal'
+        self.cousin.save()
+        changed = changed_products()
+        self.assertIn(self.cousin.pk, changed)
+        self.assertIn(self.payal.pk, changed)
+        self.assertNotIn(self.ring.pk, changed)
+        self.assertEqual(build_related(changed, k=2), len(changed))
+        self.assertEqual(changed_products(), set())
+        self.far.delete()
+        # The deleted product drops out of the cousin's list at once, and the list is rebuilt next time
+        self.assertNotIn(self.far.slug, [p['slug'] for p in self.client.get(reverse('product-related', args=[self.cousin.slug])).json()])
+        self.assertIn(self.cousin.pk, changed_products())
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        anklets = Category.objects.create(name='Anklets')
+        rings = Category.objects.create(name='Toe Rings')
+        self.payal = make_product('Oxidised Ghungroo Payal', stock=1, category=anklets,
+                                  specifications=[{"label": "Stone", "value": "Cubic Zirconia"}])
+        self.pair = make_product('Oxidised Payal Pair', stock=1, category=anklets)
+        self.ring = make_product('Oxidised Bichiya', stock=1, category=rings)
+        ProductImage.objects.create(product=self.payal, image='products/payal.webp', order=0)
+        Product.objects.filter(pk=self.pair.pk).update(popularity=5)
+
+    def suggest(self, q, **params):
+        response = self.client.get(reverse('product-autocomplete'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_every_word_is_a_prefix_of_a_product_word(self):
+        self.assertEqual([p['slug'] for p in self.suggest('ox pay')], [self.pair.slug, self.payal.slug])
+        self.assertEqual([p['slug'] for p in self.suggest('ZIRC')], [self.payal.slug])
+        self.assertEqual([p['slug'] for p in self.suggest('toe oxid')], [self.ring.slug])
+        self.assertEqual(self.suggest('ox', limit=1), [{'slug': self.pair.slug, 'name': 'Oxidised Payal Pair', 'thumbnail': None}])
+        self.assertEqual(self.suggest('ghung')[0]['thumbnail'], 'http://testserver/media/products/payal.webp')
+        self.assertEqual(self.suggest('payal silver'), [])
+        self.assertEqual(self.suggest(''), [])
+
+    @override_settings(AUTOCOMPLETE_REFRESH_SECONDS=3600)
+    def test_answered_from_memory_and_kept_in_sync(self):
+        self.suggest('ox')
+        with self.assertNumQueries(0):
+            self.suggest('oxidised')
+
+        # This process's own changes are applied by the next query
+        self.ring.name = 'Oxidised Silver Bichiya'
+        self.ring.save()
+        self.pair.delete()
+        self.assertEqual([p['slug'] for p in self.suggest('oxidised')], [self.payal.slug, self.ring.slug])
+        self.assertEqual([p['slug'] for p in self.suggest('silv')], [self.ring.slug])
+
+        # Another worker's changes, by the refresh interval
+        Product.objects.filter(pk=self.payal.pk).update(name='Ghungroo Anklet', updated_at=timezone.now())
+        self.assertEqual(len(self.suggest('oxidised')), 2)
+        with override_settings(AUTOCOMPLETE_REFRESH_SECONDS=0):
+            self.suggest('')
+        self.assertEqual([p['slug'] for p in self.suggest('oxidised')], [self.ring.slug])
+
+    @override_settings(AUTOCOMPLETE_REFRESH_SECONDS=3600)
+    def test_rebuilt_in_the_background_to_follow_popularity(self):
+        self.assertEqual([p['slug'] for p in self.suggest('oxidised payal')], [self.pair.slug, self.payal.slug])
+        # View counts don't stamp updated_at, so only a rebuild re-ranks
+        Product.objects.filter(pk=self.payal.pk).update(popularity=50)
+        with override_settings(AUTOCOMPLETE_REBUILD_SECONDS=0), \
+                mock.patch.object(autocomplete, 'rebuild_in_background') as rebuild_in_background:
+            self.assertEqual([p['slug'] for p in self.suggest('oxidised payal')], [self.pair.slug, self.payal.slug])
+            self.suggest('oxidised')
+        rebuild_in_background.assert_called_once_with()
+
+        autocomplete.rebuild()
+        self.assertFalse(autocomplete.rebuilding)
+        self.assertEqual([p['slug'] for p in self.suggest('oxidised payal')], [self.payal.slug, self.pair.slug])
+
+
+class FuzzySearchTests(TestCase):
+    def setUp(self):
+        anklets = Category.objects.create(name='Anklets')
+        self.payal = make_product('Oxidised Ghungroo Payal', stock=1, category=anklets,
+                                  specifications=[{"label": "Type", "value": "Anklet"}])
+        self.chain = make_product('Silver Anklet Chain', stock=1, category=anklets)
+        self.ring = make_product('Toe Ring', stock=1, category=anklets)
+
+    def search(self, q):
+        response = self.client.get(reverse('product-list'), {'search': q})
+        self.assertEqual(response.status_code, 200)
+        return [p['slug'] for p in response.json()], response.get('X-Search-Suggestion')
+
+    def test_misspelled_terms_find_the_closest_words(self):
+        self.assertEqual(self.search('anklit'), ([self.chain.slug, self.payal.slug], 'anklet'))
+        self.assertEqual(self.search('oxidized paayal'), ([self.payal.slug], 'oxidised payal'))
+        # A correctly spelled term is kept; only the typo is corrected
+        self.assertEqual(self.search('silver anklit'), ([self.chain.slug], 'silver anklet'))
+        self.assertEqual(self.search('xyzzy'), ([], None))
+
+    def test_suggestion_header_is_readable_cross_origin(self):
+        response = self.client.get(reverse('product-list'), {'search': 'anklit'}, HTTP_ORIGIN='http://localhost:3000')
+        self.assertIn('X-Search-Suggestion', response['Access-Control-Expose-Headers'])
+
+    def test_only_specification_values_match(self):
+        # The payal's specs are stored as {"label": "Type", "value": "Anklet"}
+        self.assertEqual(self.search('value anklit'), ([], 'value anklet'))
+        self.assertEqual(self.search('type anklit'), ([], 'type anklet'))
+        self.assertEqual(self.search('ghungro anklit'), ([self.payal.slug], 'ghungroo anklet'))
+
+    def test_exact_matches_skip_the_fallback(self):
+        with CaptureQueriesContext(connection) as queries:
+            slugs, suggestion = self.search('ghungroo')
+        self.assertEqual((slugs, suggestion), ([self.payal.slug], None))
+        self.assertFalse([q for q in queries if 'main_searchtrigram' in q['sql']])
+
+    def test_vocabulary_follows_the_catalog(self):
+        self.assertEqual([word for word, _ in corrections('bichiya')], [])
+        self.ring.name = 'Toe Ring Bichiya'
+        self.ring.save()
+        self.assertEqual(corrections('bichiya'), [('bichiya', 1.0)])
+        # Bulk writes skip the signal path; the rebuild catches up and drops words no longer used
+        Product.objects.filter(pk=self.ring.pk).update(name='Toe Ring Bichhua')
+        self.assertEqual(rebuild_words(), (1, 1))
+        self.assertEqual([word for word, _ in corrections('bichiya')], ['bichhua'])
+
+
+class SizeConversionTests(TestCase):
+    def setUp(self):
+        columns = ['Indian Size', 'US Size', 'UK Size', 'Diameter (mm)']
+        rows = [('6', '3.75', 'H', '14.9'), ('10', '5.25', 'K', '15.9'), ('12', '6', 'L', '16.5')]
+        self.rings = SizeGuideCategory.objects.create(
+            slug='rings', name='Ring Size Chart', columns=columns, data=[dict(zip(columns, row)) for row in rows],
+        )
+
+    def convert(self, expected_status=200, **params):
+        response = self.client.get(reverse('size-guide-convert'), params)
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.json()
+
+    def test_exact_and_nearest_conversions(self):
+        result = self.convert(chart='rings', **{'from': 'indian', 'value': '12', 'to': 'US Size'})
+        self.assertEqual((result['from'], result['to'], result['result'], result['exact']), ('Indian Size', 'US Size', '6', True))
+        self.assertEqual(self.convert(chart='rings', **{'from': 'uk', 'value': 'k', 'to': 'indian'})['result'], '10')
+        # A measured diameter between two sizes gets the nearest; exactly halfway, the larger
+        result = self.convert(chart='rings', **{'from': 'diameter', 'value': '16.3', 'to': 'indian'})
+        self.assertEqual((result['result'], result['exact']), ('12', False))
+        self.assertEqual(self.convert(chart='rings', **{'from': 'diameter', 'value': '15.4', 'to': 'us'})['result'], '5.25')
+        self.assertEqual(self.convert(chart='rings', **{'from': 'us', 'value': '3.750'})['row']['Indian Size'], '6')
+
+    def test_errors(self):
+        self.convert(404, chart='bangles', **{'from': 'indian', 'value': '12'})
+        self.assertEqual(self.convert(400, chart='rings', **{'from': 'indian', 'value': '12', 'to': 'eu'})['systems'][0], 'Indian Size')
+        self.convert(404, chart='rings', **{'from': 'uk', 'value': 'Z'})
+        self.convert(400, chart='rings')
+
+    def test_index_is_reused_until_a_chart_is_saved(self):
+        self.convert(chart='rings', **{'from': 'indian', 'value': '6'})
+        with self.assertNumQueries(0):
+            self.convert(chart='rings', **{'from': 'indian', 'value': '6'})
+        self.rings.data = self.rings.data + [{'Indian Size': '14', 'US Size': '7', 'UK Size': 'N', 'Diameter (mm)': '17.3'}]
+        self.rings.save()
+        self.assertEqual(self.convert(chart='rings', **{'from': 'indian', 'value': '14', 'to': 'us'})['result'], '7')
+
+
+class FeaturedTestimonialsTests(TestCase):
+    def setUp(self):
+        for n in range(5):
+            Testimonial.objects.create(name=f'Customer {n}', location='Pune', text='Lovely', product_name='Payal', rating=n + 1)
+        Testimonial.objects.create(name='Hidden', location='Pune', text='Meh', product_name='Payal', rating=5, is_active=False)
+
+    def featured(self, **params):
+        response = self.client.get(reverse('testimonial-featured'), params)
+        self.assertEqual(response.status_code, 200)
+        return [t['name'] for t in response.json()]
+
+    def test_rotates_through_every_active_testimonial(self):
+        first = self.featured(count=2)
+        with self.assertNumQueries(0):
+            second, third = self.featured(count=2), self.featured(count=2)
+        self.assertEqual(len(set(first + second)), 4)
+        self.assertEqual(set(first + second + third[:1]), {f'Customer {n}' for n in range(5)})
+        self.assertEqual(sorted(self.featured(count=20)), [f'Customer {n}' for n in range(5)])
+
+    def test_minimum_rating_and_changes(self):
+        self.assertEqual(sorted(self.featured(min_rating=4)), ['Customer 3', 'Customer 4'])
+        Testimonial.objects.filter(name='Hidden').get().save()
+        Testimonial.objects.create(name='New', location='Delhi', text='Great', product_name='Ring', rating=5)
+        self.assertEqual(sorted(self.featured(min_rating=5)), ['Customer 4', 'New'])
+        self.assertEqual(self.client.get(reverse('testimonial-featured'), {'count': 'many'}).status_code, 400)
+
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        popularity.views.take()
+        self.addCleanup(popularity.views.take)
+        self.anklet = make_product('Silver Anklet', stock=5)
+        self.ring = make_product('Toe Ring', stock=1)
+        self.chain = make_product('Waist Chain', stock=1)
+
+    def popular(self):
+        return [p['slug'] for p in self.client.get(reverse('product-list'), {'ordering': 'popular'}).json()]
+
+    @override_settings(POPULARITY_FLUSH_SECONDS=3600)
+    def test_views_are_counted_in_memory_and_flushed_in_one_statement(self):
+        # Recently renormalised, so the flush doesn't rescale the scores first
+        PopularityEpoch.objects.create(pk=1, started=timezone.now())
+        url = reverse('product-detail', args=[self.ring.slug])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(len(queries), 2)
+        self.client.get(url)
+        self.client.get(reverse('product-detail', args=[self.chain.slug]))
+        self.assertEqual(popularity.views.pending(), {self.ring.pk: 2, self.chain.pk: 1})
+        self.assertEqual(self.popular()[0], self.anklet.slug)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(popularity.views.flush(), 2)
+        self.assertEqual([q['sql'] for q in queries if 'UPDATE' in q['sql']],
+                         ['2 times: UPDATE "main_product" SET "popularity" = "popularity" + %s WHERE "id" = %s'])
+        self.assertEqual(popularity.views.pending(), {})
+        self.assertEqual(self.popular(), [self.ring.slug, self.chain.slug, self.anklet.slug])
+
+    @override_settings(POPULARITY_FLUSH_SECONDS=0)
+    def test_flushed_once_the_response_is_sent(self):
+        self.client.get(reverse('product-detail', args=[self.chain.slug]))
+        self.assertEqual(popularity.views.pending(), {})
+        self.assertGreater(Product.objects.get(pk=self.chain.pk).popularity, 0)
+
+    def test_recent_views_outweigh_older_ones(self):
+        now = timezone.now()
+        popularity.add_popularity({self.anklet.pk: 3}, now=now - timedelta(hours=2 * settings.POPULARITY_HALF_LIFE_HOURS))
+        popularity.add_popularity({self.ring.pk: 1}, now=now)
+        self.assertEqual(self.popular()[:2], [self.ring.slug, self.anklet.slug])
+        self.assertEqual(Product.objects.get(pk=self.ring.pk).updated_at, self.ring.updated_at)
+
+    def test_scores_are_renormalised_before_the_weights_grow_too_large(self):
+        half_life = timedelta(hours=settings.POPULARITY_HALF_LIFE_HOURS)
+        popularity.add_popularity({self.ring.pk: 2}, now=popularity.EPOCH + 10 * half_life)
+        self.assertEqual(Product.objects.get(pk=self.ring.pk).popularity, 2.0 ** 11)
+
+        later = popularity.EPOCH + (popularity.RENORMALISE_HALF_LIVES + 6) * half_life
+        popularity.add_popularity({self.anklet.pk: 1}, now=later)
+        self.assertEqual(PopularityEpoch.objects.get().started, later)
+        self.assertEqual(Product.objects.get(pk=self.anklet.pk).popularity, 1.0)
+        self.assertEqual(Product.objects.get(pk=self.ring.pk).popularity, 2.0 ** (11 - 70))
+        self.assertEqual(self.popular()[:2], [self.anklet.slug, self.ring.slug])
+
+    def test_counts_are_kept_when_a_flush_fails(self):
+        popularity.views.record(self.ring.pk)
+        with mock.patch.object(popularity, 'add_popularity', side_effect=RuntimeError):
+            self.assertEqual(popularity.views.flush(), 0)
+        self.assertEqual(popularity.views.pending(), {self.ring.pk: 1})
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        anklets = Category.objects.create(name='Anklets')
+        self.payal = Category.objects.create(name='Payal', parent=anklets)
+        self.product = make_product('Silver Payal', stock=4, category=self.payal,
+                                    specifications=[{"label": "Material", "value": "Silver"}])
+        ProductImage.objects.create(product=self.product, image='products/a.webp', order=0)
+
+    def import_csv(self, text, **kwargs):
+        return import_file(io.StringIO(text), 'csv', **kwargs)
+
+    def test_duplicate_names_get_unique_slugs(self):
+        self.assertEqual(make_product('Silver Payal', stock=1).slug, 'silver-payal-2')
+        self.assertEqual(unique_product_slugs(['Silver Payal', 'Silver Payal', 'Toe Ring']),
+                         ['silver-payal-3', 'silver-payal-4', 'toe-ring'])
+
+    def test_route_names_are_not_used_as_slugs(self):
+        # /api/products/changes/ and /autocomplete/ are matched before /api/products/<slug>/
+        changes = make_product('Changes', stock=1)
+        self.assertEqual(changes.slug, 'changes-2')
+        self.assertEqual(self.client.get(reverse('product-detail', args=[changes.slug])).status_code, 200)
+        self.assertEqual(unique_product_slugs(['Autocomplete']), ['autocomplete-2'])
+
+        result = self.import_csv("slug,name,category,price,stock\nautocomplete,Toe Ring,anklets/payal,800,3\n")
+        self.assertEqual(result.created, 0)
+        self.assertIn('reserved', result.errors[0].message)
+
+    def test_round_trip(self):
+        for stream, format in ((stream_csv, 'csv'), (stream_jsonl, 'jsonl')):
+            with self.subTest(format=format):
+                exported = ''.join(stream(export_rows()))
+                Product.objects.update(stock=0, specifications=[])
+                result = import_file(io.StringIO(exported), format)
+                self.assertEqual((result.created, result.updated, result.errors), (0, 1, []))
+                self.product.refresh_from_db()
+                self.assertEqual(self.product.stock, 4)
+                self.assertEqual(self.product.specifications, [{"label": "Material", "value": "Silver"}])
+                self.assertEqual(list(self.product.images.values_list('image', flat=True)), ['products/a.webp'])
+
+    def test_bad_rows_are_reported_without_aborting_the_batch(self):
+        result = self.import_csv(
+            "slug,name,category,price,stock,images\n"
+            "silver-payal,,,,9,\n"
+            ",Silver Payal,anklets/payal,1200,2,products/b.webp|products/c.webp\n"
+            ",Broken Ring,rings/toe-rings,not-a-price,1,\n"
+            ",No Category,,500,1,\n"
+            ",Toe Ring,rings/toe-rings,800,3,\n"
+        )
+        self.assertEqual((result.created, result.updated), (2, 1))
+        self.assertEqual([error.line for error in result.errors], [4, 5])
+        self.assertIn('price', result.errors[0].message)
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.name), (9, 'Silver Payal'))
+        self.assertEqual(list(self.product.images.values_list('image', flat=True)), ['products/a.webp'])
+        copy = Product.objects.get(slug='silver-payal-2')
+        self.assertEqual(list(copy.images.values_list('image', flat=True)), ['products/b.webp', 'products/c.webp'])
+        ring = Product.objects.get(slug='toe-ring')
+        self.assertEqual(ring.category.path, 'rings/toe-rings/')
+
+    def test_images_are_only_removed_when_asked(self):
+        def images():
+            return list(self.product.images.values_list('image', flat=True))
+
+        for text, format in (("slug,stock,images\nsilver-payal,3,\n", 'csv'),
+                             ('{"slug": "silver-payal", "stock": 3, "images": null}\n', 'jsonl')):
+            with self.subTest(format=format):
+                self.assertEqual(import_file(io.StringIO(text), format).updated, 1)
+                self.assertEqual(images(), ['products/a.webp'])
+
+        self.import_csv("slug,images\nsilver-payal,-\n")
+        self.assertEqual(images(), [])
+        ProductImage.objects.create(product=self.product, image='products/a.webp', order=0)
+        import_file(io.StringIO('{"slug": "silver-payal", "images": []}\n'), 'jsonl')
+        self.assertEqual(images(), [])
+
+    def test_imported_products_are_found_by_misspelled_searches(self):
+        self.import_csv('name,category,price,specifications\nToe Ring,rings,800,"[{""label"": ""Style"", ""value"": ""Bichiya""}]"\n')
+        response = self.client.get(reverse('product-list'), {'search': 'bichya'})
+        self.assertEqual([p['slug'] for p in response.json()], ['toe-ring'])
+        self.assertEqual(response['X-Search-Suggestion'], 'bichiya')
+
+    def test_dry_run_writes_nothing(self):
+        result = self.import_csv("name,category,price\nToe Ring,rings,800\n", dry_run=True)
+        self.assertEqual(result.created, 1)
+        self.assertFalse(Product.objects.filter(name='Toe Ring').exists())
+        self.assertFalse(Category.objects.filter(slug='rings').exists())
+
+    def test_queries_per_batch_do_not_grow_with_rows(self):
+        def run(count):
+            rows = "".join(f",Bulk Payal {n},anklets/payal,{500 + n},1,products/{n}.webp\n" for n in range(count))
+            with CaptureQueriesContext(connection) as queries:
+                result = self.import_csv("slug,name,category,price,stock,images\n" + rows, batch_size=100)
+            self.assertEqual(result.created, count)
+            return len(queries)
+
+        # The first import adds its words to the search vocabulary; the rest find them there
+        run(1)
+        self.assertEqual(run(5), run(50))
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import AnnouncementListView, BannerListView, ActiveSaleBannerView, TestimonialListView, WhatsAppLinkView, ProductListView, ProductDetailView, CategoryListView, FAQListView, SizeGuideListView, ValidatePromoCodeView
-from .views import APIRootView
+from .views import AnnouncementListView, BannerListView, ActiveSaleBannerView, TestimonialListView, WhatsAppLinkView, ProductListView, ProductDetailView, CategoryListView, FAQListView, SizeGuideListView, ValidatePromoCodeView, RedeemPromoCodeView
+from .views import APIRootView, MerchantFeedView, MetricsView, ProductAutocompleteView, ProductChangesView, RelatedProductListView, SitemapView
+from .views import FeaturedTestimonialsView, SizeConversionView
+from .views import StockReservationCreateView, StockReservationDetailView, StockReservationCheckoutView
 
 urlpatterns = [
     path('', APIRootView.as_view(), name='api-root'),
@@ -8,11 +10,25 @@ urlpatterns = [
     path('banners/', BannerListView.as_view(), name='banner-list'),
     path('sale-banner/', ActiveSaleBannerView.as_view(), name='sale-banner'),
     path('testimonials/', TestimonialListView.as_view(), name='testimonial-list'),
+    path('testimonials/featured/', FeaturedTestimonialsView.as_view(), name='testimonial-featured'),
     path('social/whatsapp-group/', WhatsAppLinkView.as_view(), name='whatsapp-group-link'),
     path('products/', ProductListView.as_view(), name='product-list'),
+    path('products/changes/', ProductChangesView.as_view(), name='product-changes'),
+    path('products/autocomplete/', ProductAutocompleteView.as_view(), name='product-autocomplete'),
     path('products/<slug:slug>/', ProductDetailView.as_view(), name='product-detail'),
+    path('products/<slug:slug>/related/', RelatedProductListView.as_view(), name='product-related'),
     path('faqs/', FAQListView.as_view(), name='faq-list'),
     path('categories/', CategoryListView.as_view(), name='category-list'),
     path('size-guide/', SizeGuideListView.as_view(), name='size-guide'),
+    path('size-guide/convert/', SizeConversionView.as_view(), name='size-guide-convert'),
     path('validate-promo/', ValidatePromoCodeView.as_view(), name='validate-promo'),
+    path('redeem-promo/', RedeemPromoCodeView.as_view(), name='redeem-promo'),
+    path('reservations/', StockReservationCreateView.as_view(), name='reservation-create'),
+    path('reservations/<uuid:token>/', StockReservationDetailView.as_view(), name='reservation-detail'),
+    path('reservations/<uuid:token>/checkout/', StockReservationCheckoutView.as_view(), name='reservation-checkout'),
+    path('feeds/merchant.xml', MerchantFeedView.as_view(feed_format='xml'), name='merchant-feed-xml'),
+    path('feeds/merchant.tsv', MerchantFeedView.as_view(feed_format='tsv'), name='merchant-feed-tsv'),
+    path('sitemap.xml', SitemapView.as_view(), name='sitemap-index'),
+    path('sitemaps/<str:name>', SitemapView.as_view(), name='sitemap-file'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,5 +1,5 @@
 from rest_framework import generics
-from .models import Announcement, Banner, SaleBanner, Testimonial, SocialLink, Product, Category, FAQCategory, SizeGuideCategory
+from .models import Announcement, Banner, SaleBanner, Testimonial, SocialLink, Product, Category, FAQ, FAQCategory, SizeGuideCategory
 from .serializers import CategorySerializer, ProductSerializer, SizeGuideCategorySerializer
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
@@ -8,9 +8,38 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.utils import timezone
 from rest_framework import status
-from .models import PromoCode
+from .models import PromoCode, PromoCodeExhausted, ProductTombstone, StockReservation, OutOfStock
+from .serializers import ReservationRequestSerializer, StockReservationSerializer
+from django.shortcuts import get_object_or_404
+from .filters import FuzzySearchFilter, ProductFilter, ProductOrderingFilter
+from .pagination import ProductPagination
+from django.db.models import Prefetch
 from decimal import Decimal
 from rest_framework.reverse import reverse
+from rest_framework.permissions import IsAdminUser
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+from django.utils.cache import get_conditional_response
+from django.http import Http404, HttpResponseNotAllowed
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.utils._os import safe_join
+from stat import S_ISREG
+from urllib.parse import quote
+import mimetypes
+import os
+import re
+from . import media, merchant_feed, popularity, sitemaps, storage
+from .autocomplete import autocomplete
+from .size_guides import size_guides
+from .testimonials import testimonials
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta, timezone as dt_timezone
+import heapq
+from rest_framework.utils.encoders import JSONEncoder
+from .metrics import registry, PROMETHEUS_CONTENT_TYPE
+
+SITEMAP_FILE_RE = re.compile(r'^sitemap(-[a-z0-9-]+)?\.xml$')
 
 class APIRootView(APIView):
     """
@@ -22,45 +51,62 @@ class APIRootView(APIView):
             'banners': reverse('banner-list', request=request, format=format),
             'sale-banner': reverse('sale-banner', request=request, format=format),
             'products': reverse('product-list', request=request, format=format),
+            'product-changes': reverse('product-changes', request=request, format=format),
+            'product-autocomplete': reverse('product-autocomplete', request=request, format=format),
             'categories': reverse('category-list', request=request, format=format),
             'testimonials': reverse('testimonial-list', request=request, format=format),
+            'featured-testimonials': reverse('testimonial-featured', request=request, format=format),
             'faqs': reverse('faq-list', request=request, format=format),
             'size-guide': reverse('size-guide', request=request, format=format),
+            'size-guide-convert': reverse('size-guide-convert', request=request, format=format),
             'whatsapp-link': reverse('whatsapp-group-link', request=request, format=format),
         })
 class ValidatePromoCodeView(APIView):
     """
     Validates a promo code and calculates discount.
-    POST Payload: { "code": "DEV10", "total_amount": 5000 }
+    POST Payload: { "code": "DEV10", "total_amount": 5000, "customer": "asha@example.com" }
+    `customer` (email or phone) is optional here; it enables the per-customer limit check.
     """
-    def post(self, request):
+    def check_promo(self, request):
+        """Returns (promo, discount, None) or (None, None, error_response)."""
         code = request.data.get('code', '').upper()
         total_amount = Decimal(str(request.data.get('total_amount', 0)))
+        customer = request.data.get('customer', '')
+        if not isinstance(customer, str):
+            return None, None, self.invalid_customer()
 
         try:
             promo = PromoCode.objects.get(code=code)
         except PromoCode.DoesNotExist:
-            return Response({"error": "Invalid promo code"}, status=status.HTTP_400_BAD_REQUEST)
+            return None, None, Response({"error": "Invalid promo code"}, status=status.HTTP_400_BAD_REQUEST)
 
         if not promo.is_valid():
-            return Response({"error": "Promo code is expired or inactive"}, status=status.HTTP_400_BAD_REQUEST)
+            return None, None, Response({"error": "Promo code is expired or inactive"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Read-only checks; the authoritative ones happen atomically in PromoCode.redeem
+        if promo.is_exhausted():
+            return None, None, Response({"error": "This promo code has reached its usage limit"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if customer and promo.max_uses_per_customer is not None and promo.customer_uses(customer) >= promo.max_uses_per_customer:
+            return None, None, Response({
+                "error": "You have already used this promo code the maximum number of times"
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         if total_amount < promo.min_order_amount:
-            return Response({
+            return None, None, Response({
                 "error": f"Minimum order amount of ₹{promo.min_order_amount} required"
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Calculate Discount
-        discount = Decimal(0)
-        if promo.discount_type == 'percent':
-            discount = total_amount * (promo.discount_value / Decimal(100))
-            if promo.max_discount_amount:
-                discount = min(discount, promo.max_discount_amount)
-        else:
-            discount = promo.discount_value
+        return promo, promo.calculate_discount(total_amount), None
 
-        # Ensure discount doesn't exceed total
-        discount = min(discount, total_amount)
+    @staticmethod
+    def invalid_customer():
+        return Response({"error": "customer must be an email address or phone number"}, status=status.HTTP_400_BAD_REQUEST)
+
+    def post(self, request):
+        promo, discount, error = self.check_promo(request)
+        if error:
+            return error
 
         return Response({
             "code": promo.code,
@@ -68,6 +114,34 @@ class ValidatePromoCodeView(APIView):
             "message": "Promo code applied successfully!"
         })
 
+class RedeemPromoCodeView(ValidatePromoCodeView):
+    """
+    Validates and consumes one use of a promo code at checkout.
+    POST Payload: { "code": "DEV10", "total_amount": 5000, "customer": "asha@example.com" }
+    Endpoint: /api/redeem-promo/
+    """
+    def post(self, request):
+        customer = request.data.get('customer', '')
+        if not isinstance(customer, str):
+            return self.invalid_customer()
+        if not customer.strip():
+            return Response({"error": "customer is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        promo, discount, error = self.check_promo(request)
+        if error:
+            return error
+
+        try:
+            promo.redeem(customer)
+        except PromoCodeExhausted as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "code": promo.code,
+            "discount_amount": float(discount),
+            "message": "Promo code redeemed successfully!"
+        })
+
 class AnnouncementListView(generics.ListAPIView):
     """
     Returns a list of active scrolling announcements.
@@ -110,6 +184,23 @@ class TestimonialListView(generics.ListAPIView):
     queryset = Testimonial.objects.filter(is_active=True).order_by('-created_at')
     serializer_class = TestimonialSerializer
 
+class FeaturedTestimonialsView(APIView):
+    """
+    A rotating selection of active testimonials: `count` of them (default 6, at most 20), rated
+    at least `min_rating`, different on each request. Served from memory, see main.testimonials.
+    Endpoint: /api/testimonials/featured/?count=6&min_rating=4
+    Used by: the homepage testimonials strip
+    """
+    max_count = 20
+
+    def get(self, request):
+        try:
+            count = min(max(int(request.query_params.get('count', 6)), 1), self.max_count)
+            min_rating = min(max(int(request.query_params.get('min_rating', 0)), 0), 5)
+        except ValueError:
+            return Response({"error": "count and min_rating must be whole numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(testimonials.take(count, min_rating))
+
 class WhatsAppLinkView(APIView):
     """
     Returns the active WhatsApp Group link.
@@ -128,35 +219,158 @@ class WhatsAppLinkView(APIView):
 class ProductListView(generics.ListAPIView):
     """
     Lists products with filtering for search, category, and ordering.
+    `?ordering=popular` sorts by trending (recently most viewed) first.
+    A `?search=` with no results is retried allowing for typos, closest first; the corrected
+    query is sent back in `X-Search-Suggestion` ("did you mean").
+    ?limit=&offset= return one page (at most 120), with the paging headers of ProductPagination.
     Used by: Collections.tsx
     """
-    queryset = Product.objects.prefetch_related('images', 'category').all()
+    queryset = Product.objects.select_related('category').prefetch_related('images').all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = ProductPagination
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, ProductOrderingFilter]
     
-    # Enable filtering by fields
-    filterset_fields = {
-        'category__name': ['exact'],
-        'price': ['gte', 'lte'],
-    }
+    # ?category=<slug> (includes sub-categories), ?price__gte=, ?price__lte=
+    filterset_class = ProductFilter
     search_fields = ['name', 'description']
     ordering_fields = ['price', 'created_at', 'rating']
     ordering = ['-created_at']  # Default ordering: newest first
+    search_suggestion = None
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if response.data or not request.query_params.get(filters.SearchFilter.search_param) or self.paginator.offset:
+            return response
+        # Nothing spelled that way: retry with the catalog words closest to each term (main.search)
+        self.filter_backends = [DjangoFilterBackend, ProductOrderingFilter, FuzzySearchFilter]
+        response = super().list(request, *args, **kwargs)
+        if self.search_suggestion:
+            response['X-Search-Suggestion'] = self.search_suggestion
+        return response
+
+class ProductAutocompleteView(APIView):
+    """
+    Search-box suggestions: up to `limit` products (default 8, at most 20) with a word starting
+    with each word of `q`, most popular first. Served from memory, see main.autocomplete.
+    Endpoint: /api/products/autocomplete/?q=<text>
+    Used by: the header search box, on every keystroke
+    """
+    max_limit = 20
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 8)), 1), self.max_limit)
+        except ValueError:
+            limit = 8
+        matches = autocomplete.search(request.query_params.get('q', ''), limit)
+        return Response([
+            {'slug': slug, 'name': name,
+             'thumbnail': request.build_absolute_uri(storage.media_storage.url(thumbnail)) if thumbnail else None}
+            for slug, name, thumbnail in matches
+        ])
+
+class ProductChangesView(APIView):
+    """
+    Delta feed for keeping a local copy of the catalog in sync.
+    Endpoint: /api/products/changes/?updated_since=<cursor>
+    Streams one JSON object per line, oldest change first:
+        {"type": "product", "product": {...same as /api/products/<slug>/...}}
+        {"type": "deleted", "id": 12, "slug": "silver-payal", "deleted_at": "..."}
+        {"type": "cursor", "updated_since": "..."}   <- send this back next time
+    Without updated_since it streams every product (a full snapshot to start from).
+    Returns 410 when the cursor is older than the tombstone retention; start over with a snapshot.
+    Changes show up DELTA_FEED_SETTLE_SECONDS after they are made.
+    Used by: the storefront cache and marketplace sync jobs.
+    """
+    def get(self, request):
+        since = None
+        if request.query_params.get('updated_since'):
+            since = parse_datetime(request.query_params['updated_since'])
+            if since is None:
+                return Response({"error": "updated_since must be an ISO 8601 timestamp"}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, dt_timezone.utc)
+            if since < timezone.now() - timedelta(days=settings.DELTA_FEED_TOMBSTONE_DAYS):
+                return Response({"error": "Cursor is too old; fetch a full snapshot without updated_since"},
+                                status=status.HTTP_410_GONE)
+
+        # Stop short of now: a row stamped before `until` may not be committed yet. Writes whose
+        # transaction outlasts the settle time would be skipped, see DELTA_FEED_SETTLE_SECONDS
+        until = timezone.now() - timedelta(seconds=settings.DELTA_FEED_SETTLE_SECONDS)
+        cursor = until.isoformat()
+
+        products = Product.objects.filter(updated_at__lte=until).select_related('category').prefetch_related('images')
+        tombstones = ProductTombstone.objects.filter(deleted_at__lte=until)
+        if since is not None:
+            products = products.filter(updated_at__gt=since)
+            tombstones = tombstones.filter(deleted_at__gt=since)
+        else:
+            tombstones = tombstones.none()
+
+        def lines():
+            encoder = JSONEncoder()
+            changes = heapq.merge(
+                ((product.updated_at, 'product', product)
+                 for product in products.order_by('updated_at', 'id').iterator(chunk_size=500)),
+                ((tombstone.deleted_at, 'deleted', tombstone)
+                 for tombstone in tombstones.order_by('deleted_at', 'id').iterator(chunk_size=500)),
+                key=lambda change: change[0],
+            )
+            for _, kind, obj in changes:
+                if kind == 'product':
+                    data = {"type": kind, "product": ProductSerializer(obj, context={'request': request}).data}
+                else:
+                    data = {"type": kind, "id": obj.product_id, "slug": obj.slug, "deleted_at": obj.deleted_at}
+                yield encoder.encode(data) + "\n"
+            yield encoder.encode({"type": "cursor", "updated_since": cursor}) + "\n"
+
+        response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+        response['X-Next-Cursor'] = cursor
+        return response
 
 class ProductDetailView(generics.RetrieveAPIView):
     """
     Retrieves a single product by slug.
     Used by: ProductDetail.tsx
     """
-    queryset = Product.objects.prefetch_related('images', 'category').all()
+    queryset = Product.objects.select_related('category').prefetch_related('images').all()
     serializer_class = ProductSerializer
     lookup_field = 'slug'
 
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        # In memory only; written in batches by main.popularity
+        popularity.views.record(response.data['id'])
+        return response
+
+class RelatedProductListView(generics.ListAPIView):
+    """
+    The products most similar to one product, best first. Precomputed by
+    manage.py build_related_products, so this is one indexed join (plus the images).
+    Used by: ProductDetail.tsx
+    Endpoint: /api/products/<slug>/related/
+    """
+    serializer_class = ProductSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return (
+            Product.objects.filter(recommended_in__product__slug=self.kwargs['slug'])
+            .order_by('recommended_in__rank').select_related('category').prefetch_related('images')
+        )
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data and not Product.objects.filter(slug=self.kwargs['slug']).exists():
+            raise Http404
+        return response
+
 class CategoryListView(generics.ListAPIView):
     """
-    Returns list of categories for filter buttons.
+    Returns list of categories for filter buttons, ordered depth-first by path
+    so children follow their parent.
     """
-    queryset = Category.objects.all()
+    queryset = Category.objects.select_related('parent').all()
     serializer_class = CategorySerializer
 
 class FAQListView(generics.ListAPIView):
@@ -164,8 +378,10 @@ class FAQListView(generics.ListAPIView):
     Returns list of FAQ categories with their nested active questions.
     Endpoint: /api/faqs/
     """
-    # Prefetch questions to optimize database queries
-    queryset = FAQCategory.objects.prefetch_related('questions').all().order_by('order')
+    # Prefetch only the active questions, already ordered, so serializing needs no extra queries
+    queryset = FAQCategory.objects.prefetch_related(
+        Prefetch('questions', queryset=FAQ.objects.filter(is_active=True).order_by('order'), to_attr='active_questions')
+    ).order_by('order')
     serializer_class = FAQCategorySerializer
 
 class SizeGuideListView(generics.ListAPIView):
@@ -174,4 +390,236 @@ class SizeGuideListView(generics.ListAPIView):
     Endpoint: /api/size-guide/
     """
     queryset = SizeGuideCategory.objects.all().order_by('order')
-    serializer_class = SizeGuideCategorySerializer
\ No newline at end of file
+    serializer_class = SizeGuideCategorySerializer
+
+class SizeConversionView(APIView):
+    """
+    Converts one size between the systems (columns) of a size chart, e.g. an Indian ring size
+    to US, without downloading every chart. Systems can be named loosely ("indian", "us",
+    "diameter"); in numeric columns a value between two rows gives the nearest row (exact: false).
+    Endpoint: /api/size-guide/convert/?chart=rings&from=indian&value=12&to=us
+    Returns: { "chart", "from", "to", "value", "result", "exact", "row" }; `to` is optional,
+    `row` is the whole matching row.
+    """
+    def get(self, request):
+        params = request.query_params
+        missing = [name for name in ('chart', 'from', 'value') if not params.get(name)]
+        if missing:
+            return Response({"error": f"Required: {', '.join(missing)}"}, status=status.HTTP_400_BAD_REQUEST)
+        chart = size_guides.chart(params['chart'])
+        if chart is None:
+            return Response({"error": "No such size chart"}, status=status.HTTP_404_NOT_FOUND)
+
+        systems = {'from': chart.system(params['from'])}
+        if params.get('to'):
+            systems['to'] = chart.system(params['to'])
+        unknown = [params[name] for name, column in systems.items() if column is None]
+        if unknown:
+            return Response({"error": f"Unknown size system: {', '.join(unknown)}", "systems": chart.columns},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        match = chart.find(systems['from'], params['value'])
+        if match is None:
+            return Response({"error": "No matching size"}, status=status.HTTP_404_NOT_FOUND)
+        row, exact = match
+        return Response({
+            'chart': chart.slug,
+            'from': systems['from'],
+            'to': systems.get('to'),
+            'value': params['value'],
+            'result': row.get(systems['to']) if 'to' in systems else None,
+            'exact': exact,
+            'row': row,
+        })
+
+
+class StockReservationCreateView(APIView):
+    """
+    Holds stock for a cart. All lines succeed or none do.
+    POST Payload: { "items": [{ "slug": "silver-anklet", "quantity": 2 }] }
+    Endpoint: /api/reservations/
+    """
+    def post(self, request):
+        serializer = ReservationRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            reservation = StockReservation.objects.reserve(serializer.validated_data['items'])
+        except OutOfStock as exc:
+            product = Product.objects.filter(pk=exc.product_id).only('slug', 'stock').first()
+            return Response({
+                "error": "Not enough stock",
+                "slug": product.slug if product else None,
+                "available": product.stock if product else 0,
+            }, status=status.HTTP_409_CONFLICT)
+
+        reservation = StockReservation.objects.prefetch_related('items__product').get(pk=reservation.pk)
+        return Response(StockReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+class StockReservationDetailView(APIView):
+    """
+    GET shows a reservation; DELETE releases its stock (e.g. cart abandoned).
+    Endpoint: /api/reservations/<token>/
+    """
+    def get_object(self, token):
+        return get_object_or_404(StockReservation.objects.prefetch_related('items__product'), token=token)
+
+    def get(self, request, token):
+        return Response(StockReservationSerializer(self.get_object(token)).data)
+
+    def delete(self, request, token):
+        reservation = self.get_object(token)
+        if not reservation.release():
+            return Response({"error": f"Reservation is already {reservation.status}"}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class StockReservationCheckoutView(APIView):
+    """
+    Confirms a held reservation once payment succeeds. Fails if it already expired.
+    Endpoint: /api/reservations/<token>/checkout/
+    """
+    def post(self, request, token):
+        reservation = get_object_or_404(StockReservation.objects.prefetch_related('items__product'), token=token)
+        if not reservation.confirm():
+            reservation.refresh_from_db(fields=['status'])
+            return Response({"error": "Reservation has expired or is no longer held"}, status=status.HTTP_410_GONE)
+        return Response(StockReservationSerializer(reservation).data)
+
+
+class MerchantFeedView(APIView):
+    """
+    Google Merchant Center product feed of the whole catalog.
+    Endpoint: /api/feeds/merchant.xml, /api/feeds/merchant.tsv
+    Serves the file cached by `manage.py build_merchant_feed` (run it from cron), answering
+    If-None-Match / If-Modified-Since with 304; until the first build, renders the feed live
+    from the database.
+    """
+    feed_format = 'xml'
+
+    def get(self, request):
+        content_type = merchant_feed.CONTENT_TYPES[self.feed_format]
+        path = merchant_feed.feed_path(self.feed_format)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return StreamingHttpResponse(merchant_feed.stream_feed(self.feed_format), content_type=content_type)
+
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if not_modified is not None:
+            return not_modified
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        return response
+
+
+class SitemapView(APIView):
+    """
+    Sitemap index and shards, as written by `manage.py build_sitemaps` (run it from cron).
+    Endpoint: /api/sitemap.xml, /api/sitemaps/sitemap-products-0.xml, ...
+    Answers If-None-Match / If-Modified-Since with 304. The index is built on first request if missing.
+    """
+    def get(self, request, name=sitemaps.INDEX_NAME):
+        if not SITEMAP_FILE_RE.match(name):
+            raise Http404
+        path = sitemaps.sitemap_path(name)
+        if name == sitemaps.INDEX_NAME and not os.path.exists(path):
+            sitemaps.build_sitemaps()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise Http404
+
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if not_modified is not None:
+            return not_modified
+        response = FileResponse(open(path, 'rb'), content_type='application/xml; charset=utf-8')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = 'public, max-age=3600'
+        return response
+
+class MetricsView(APIView):
+    """
+    Per-endpoint request latency, SQL and render percentiles in Prometheus text format.
+    Numbers are for the worker process that answers the scrape.
+    Staff only (session or basic auth).
+    Endpoint: /api/metrics/
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(registry.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def serve_media(request, path):
+    """
+    Files under MEDIA_URL, in production as well as DEBUG. Media outside MEDIA_PUBLIC_PREFIXES
+    needs a staff session. Supports conditional GETs and a single byte range. With MEDIA_ACCEL
+    set, only the headers come from here and the web server sends the file.
+    Endpoint: /media/<path>
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    if media.is_hidden(path):
+        raise Http404
+    if not media.is_public(path) and not request.user.is_staff:
+        raise PermissionDenied
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not S_ISREG(stat.st_mode):
+        raise Http404
+
+    etag = media.etag(path, stat)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if settings.MEDIA_ACCEL == 'x-accel-redirect':
+        # nginx serves the `internal` location itself, ranges included
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    elif settings.MEDIA_ACCEL == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        response = file_response(request, full_path, stat, etag, content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if media.is_public(path):
+        response['Cache-Control'] = storage.cache_control(path) or settings.MEDIA_DEFAULT_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def file_response(request, full_path, stat, etag, content_type):
+    """The file (or the requested byte range of it), streamed by Django; sendfile() under gunicorn/uWSGI."""
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or if_range in (etag, http_date(stat.st_mtime)):
+        try:
+            byte_range = media.parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(media.FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response.block_size = 64 * 1024
+    return response